@@ -1,13 +1,39 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.api.predict import router as predict_router
 from src.api.healthcheck import router as health_router
 from src.api.email import router as email_router
+from src.api.research import router as research_router
+from src.api.plans import router as plans_router
+from src.api.metrics import router as metrics_router
+from src.api.auth import router as auth_router
+from src.inference.run_inference import get_dispatcher
+from metrics import MetricsMiddleware
+from compression import CompressionMiddleware
+from src.vision_service.produce_quality_detection import shutdown_grader
+from auth import shutdown_hasher
+from plan_scheduler import ENABLED as PREGEN_ENABLED, get_pregenerator
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    dispatcher = get_dispatcher()
+    await dispatcher.start()
+    if PREGEN_ENABLED:
+        get_pregenerator().start()
+    yield
+    await get_pregenerator().stop()
+    dispatcher.shutdown()
+    shutdown_grader()
+    shutdown_hasher()
 
 app = FastAPI(
     title="FoodGene ML Service",
     version="1.0.0",
-    description="Machine learning microservice for predictions, vision, NLP, and crop yield"
+    description="Machine learning microservice for predictions, vision, NLP, and crop yield",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware to allow frontend requests
@@ -18,10 +44,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(health_router, prefix="/health")
+app.include_router(metrics_router, prefix="/metrics")
 app.include_router(predict_router, prefix="/predict")
 app.include_router(email_router, prefix="/api")
+app.include_router(research_router, prefix="/api")
+app.include_router(plans_router, prefix="/api")
+app.include_router(auth_router, prefix="/api")
 
 @app.get("/")
 def index():
@@ -0,0 +1,199 @@
+"""Password hashing and JWT handling for the auth routes.
+
+bcrypt is deliberately slow, so hashing and verification run on a small,
+bounded thread pool (bcrypt releases the GIL) instead of on the event loop.
+At most ``AUTH_HASH_QUEUE`` operations may be waiting or running; beyond
+that new logins are rejected immediately with ``HashQueueFullError`` rather
+than queueing behind a storm. The cost factor is set by ``BCRYPT_ROUNDS``;
+stored hashes with a different cost are upgraded on the next login.
+
+Verified access tokens are kept in an LRU cache until they expire, so
+authenticated requests skip the signature check and claim decoding.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import bcrypt
+from jose import JWTError, jwt
+
+from metrics import CACHE_REQUESTS, timed
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+HASH_QUEUE = int(os.getenv("AUTH_HASH_QUEUE", "64"))
+
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+if not SECRET_KEY:
+    # Anyone can read the fallback secret and forge tokens with it, so it is
+    # only used when development mode is asked for explicitly
+    if os.getenv("FOODGENE_ENV", "").lower() not in ("dev", "development"):
+        raise RuntimeError("JWT_SECRET_KEY is not set; set it, or set FOODGENE_ENV=dev "
+                           "to use the insecure development secret")
+    SECRET_KEY = "foodgene-dev-secret"
+    logger.warning("JWT_SECRET_KEY not set; using an insecure development secret (FOODGENE_ENV=dev)")
+
+# bcrypt only uses the first 72 bytes of a password
+_MAX_PASSWORD_BYTES = 72
+
+
+class HashQueueFullError(Exception):
+    """Raised when too many password operations are already pending."""
+
+
+class InvalidTokenError(Exception):
+    """Raised for malformed, forged or expired access tokens."""
+
+
+def _encode(password: str) -> bytes:
+    return password.encode("utf-8")[:_MAX_PASSWORD_BYTES]
+
+
+@timed("password_hash")
+def hash_password_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+@timed("password_verify")
+def verify_password_sync(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(_encode(password), hashed.encode())
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    # Verified against when the user doesn't exist, at the same cost as a real
+    # hash, so response time doesn't reveal which accounts exist
+    return hash_password_sync("foodgene-dummy-password")
+
+
+def _verify_missing(password: str) -> bool:
+    verify_password_sync(password, _dummy_hash())
+    return False
+
+
+def needs_rehash(hashed: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True if a stored bcrypt hash uses a different cost than configured."""
+    parts = hashed.split("$")
+    return len(parts) < 4 or parts[2] != f"{rounds:02d}"
+
+
+class PasswordHasher:
+    """Run bcrypt on a bounded thread pool."""
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_QUEUE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashQueueFullError("Too many concurrent password operations")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password_sync, password)
+
+    async def verify(self, password: str, hashed: Optional[str]) -> bool:
+        if not hashed:
+            return await self._run(_verify_missing, password)
+        return await self._run(verify_password_sync, password, hashed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TokenCache:
+    """LRU cache of verified token claims, each valid until the token's expiry."""
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is None:
+                return None
+            if claims.get("exp", 0) <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+
+def create_access_token(user_id: str, email: str,
+                        expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
+    """Issue a signed access token with the user id as subject."""
+    expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
+    return jwt.encode({"sub": user_id, "email": email, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Return the claims of a valid token, from the cache when possible.
+
+    Raises:
+        InvalidTokenError: If the token is malformed, forged or expired
+    """
+    claims = token_cache.get(token)
+    if claims is not None:
+        CACHE_REQUESTS.inc(cache="jwt_claims", result="hit")
+        return claims
+    CACHE_REQUESTS.inc(cache="jwt_claims", result="miss")
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError as e:
+        raise InvalidTokenError(str(e))
+    if "sub" not in claims or "exp" not in claims:
+        raise InvalidTokenError("Token is missing required claims")
+    token_cache.put(token, claims)
+    return claims
+
+
+_hasher: Optional[PasswordHasher] = None
+
+
+def get_hasher() -> PasswordHasher:
+    """Return the process-wide password hasher."""
+    global _hasher
+    if _hasher is None:
+        _hasher = PasswordHasher()
+    return _hasher
+
+
+def shutdown_hasher() -> None:
+    """Stop the hasher's thread pool if it was started."""
+    if _hasher is not None:
+        _hasher.shutdown()
@@ -0,0 +1,203 @@
+"""Online backup of the FoodGene SQLite database.
+
+Copying ``foodgene.db`` while the service writes either yields a torn copy
+or (with a lock) stalls every writer for the duration. This tool uses
+SQLite's online backup API instead:
+
+- The source connection holds one read transaction for the whole backup, so
+  every step copies from the same WAL snapshot. Writers keep committing to
+  the WAL meanwhile and the backup never restarts because of them. (The WAL
+  cannot be checkpointed past the snapshot until the backup ends, so it may
+  grow during a long backup.)
+- Pages are copied ``BACKUP_STEP_PAGES`` at a time, sleeping between steps
+  to stay under ``BACKUP_MAX_MB_PER_SEC``, so the copy never saturates the
+  disk the service is using.
+- The copy is checked with ``PRAGMA integrity_check`` before it is kept,
+  optionally gzip-compressed, then moved into place atomically.
+
+    python -m backup_db --output-dir ../backups --gzip --keep 24
+"""
+import argparse
+import glob
+import gzip
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from db import get_db_path
+
+logger = logging.getLogger(__name__)
+
+STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+MAX_MB_PER_SEC = float(os.getenv("BACKUP_MAX_MB_PER_SEC", "50"))
+GZIP_LEVEL = int(os.getenv("BACKUP_GZIP_LEVEL", "6"))
+CHUNK_BYTES = 1 << 20
+
+PREFIX = "foodgene-"
+
+
+class BackupError(RuntimeError):
+    """Raised when a backup cannot be taken or fails verification."""
+
+
+class _Throttle:
+    """Sleep as needed to keep a byte stream under max_bytes_per_sec."""
+
+    def __init__(self, max_mb_per_sec: float):
+        self.max_bytes_per_sec = max_mb_per_sec * 1024 * 1024
+        self.started = time.monotonic()
+        self.done = 0
+
+    def __call__(self, nbytes: int) -> None:
+        self.done += nbytes
+        if self.max_bytes_per_sec <= 0:
+            return
+        ahead = self.done / self.max_bytes_per_sec - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def integrity_check(path: str) -> List[str]:
+    """Run PRAGMA integrity_check on a database file; returns the problems found."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if rows == ["ok"] else rows
+
+
+def _copy(source: str, target: str, step_pages: int, max_mb_per_sec: float) -> Dict[str, Any]:
+    src = sqlite3.connect(source, timeout=30, isolation_level=None)
+    dst = sqlite3.connect(target)
+    try:
+        page_size = src.execute("PRAGMA page_size").fetchone()[0]
+        # Pin one WAL snapshot so concurrent writers don't restart the backup
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        throttle = _Throttle(max_mb_per_sec)
+        steps = 0
+
+        def progress(status, remaining, total):
+            nonlocal steps
+            steps += 1
+            if remaining:
+                throttle(step_pages * page_size)
+
+        src.backup(dst, pages=max(1, step_pages), progress=progress)
+        src.execute("COMMIT")
+        # The copy inherits WAL mode; a backup should be a single self-contained file
+        dst.execute("PRAGMA journal_mode=DELETE")
+        pages = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    return {"pages": pages, "page_size": page_size, "steps": steps}
+
+
+def _gzip(path: str, target: str, max_mb_per_sec: float) -> None:
+    throttle = _Throttle(max_mb_per_sec)
+    with open(path, "rb") as f_in, gzip.open(target, "wb", compresslevel=GZIP_LEVEL) as f_out:
+        while True:
+            chunk = f_in.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            f_out.write(chunk)
+            throttle(len(chunk))
+
+
+def backup(destination: str, source: Optional[str] = None, compress: bool = False,
+           verify: bool = True, step_pages: int = STEP_PAGES,
+           max_mb_per_sec: float = MAX_MB_PER_SEC) -> Dict[str, Any]:
+    """Take a consistent copy of the database while it is in use.
+
+    Args:
+        destination: File to write (".gz" is appended when compressing)
+        source: Database to back up (defaults to the service's database)
+        compress: gzip the copy
+        verify: Run PRAGMA integrity_check on the copy before keeping it
+        step_pages: Pages copied per backup step
+        max_mb_per_sec: Throughput cap for the copy and compression (0 = none)
+
+    Returns:
+        {"path", "bytes", "pages", "page_size", "steps", "seconds"}
+
+    Raises:
+        BackupError: If the source is missing or the copy fails verification
+    """
+    source = source or get_db_path()
+    if not os.path.exists(source):
+        raise BackupError(f"Database {source} does not exist")
+    if compress and not destination.endswith(".gz"):
+        destination += ".gz"
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+
+    started = time.monotonic()
+    # Work on hidden temporary files so a partial backup is never mistaken for a good one
+    base = os.path.join(directory, f".{os.path.basename(destination)}.{os.getpid()}")
+    copy_path, gz_path = f"{base}.db", f"{base}.gz"
+    try:
+        stats = _copy(source, copy_path, step_pages, max_mb_per_sec)
+        if verify:
+            problems = integrity_check(copy_path)
+            if problems:
+                raise BackupError(f"Backup of {source} failed integrity_check: {problems[:5]}")
+        if compress:
+            _gzip(copy_path, gz_path, max_mb_per_sec)
+            os.replace(gz_path, destination)
+        else:
+            os.replace(copy_path, destination)
+    finally:
+        for leftover in (copy_path, gz_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {"path": destination, "bytes": os.path.getsize(destination), **stats,
+            "verified": verify, "seconds": round(time.monotonic() - started, 2)}
+
+
+def prune(directory: str, keep: int) -> List[str]:
+    """Delete all but the newest keep backups in directory; returns the deleted paths."""
+    backups = sorted(glob.glob(os.path.join(directory, f"{PREFIX}*.db*")))
+    removed = backups[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Back up the FoodGene database without blocking the service")
+    parser.add_argument("-o", "--output", help="Backup file to write")
+    parser.add_argument("--output-dir", default="backups",
+                        help="Directory for timestamped backups when --output is not given")
+    parser.add_argument("--source", help="Database to back up (default: FOODGENE_DB_PATH or foodgene.db)")
+    parser.add_argument("--gzip", action="store_true", help="Compress the backup")
+    parser.add_argument("--no-verify", action="store_true", help="Skip PRAGMA integrity_check")
+    parser.add_argument("--step-pages", type=int, default=STEP_PAGES)
+    parser.add_argument("--max-mb-per-sec", type=float, default=MAX_MB_PER_SEC)
+    parser.add_argument("--keep", type=int, default=0,
+                        help="Keep only this many backups in --output-dir (0 keeps all)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    destination = args.output or os.path.join(
+        args.output_dir, f"{PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+    try:
+        result = backup(destination, source=args.source, compress=args.gzip, verify=not args.no_verify,
+                        step_pages=args.step_pages, max_mb_per_sec=args.max_mb_per_sec)
+    except (BackupError, sqlite3.Error) as e:
+        logger.error(f"Backup failed: {e}")
+        return 1
+    logger.info("Backup written: %s", result)
+    if args.keep and not args.output:
+        for path in prune(args.output_dir, args.keep):
+            logger.info("Removed old backup %s", path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""Benchmarks for the ML service. Run from ml/ as ``python -m benchmarks.<name>``:
+
+- ``load``: in-process load test with fake OpenAI/SMTP upstreams
+- ``serving``: throughput of run_backend.py's production mode by worker count
+- ``micro``: hot-path micro-benchmarks
+- ``compare``: diff two JSON reports and flag regressions
+- ``login_storm``: latency of other endpoints during a burst of bcrypt logins
+- ``responses``: plan response encoding cost and compressed size
+- ``plan_history``: plan revision storage size and reconstruction time
+- ``pregeneration``: peak plan request latency with off-peak pre-generated plans
+- ``backup``: database write/read latency during an online backup
+- ``produce_quality``: tray grading of a synthetic 24MP photo
+- ``grocery``, ``prompts``: LLM token savings of local grocery lists and compact prompts
+"""
@@ -0,0 +1,160 @@
+"""Benchmark: write latency of the service's database during a backup.
+
+Builds a throwaway database of ``--size-mb`` in WAL mode and runs a writer
+(small inserts, like plan saves and revisions) and a reader (primary key
+lookups) against it. Their latency is measured with no backup running,
+during ``backup_db.backup`` (throttled online backup), during ``VACUUM
+INTO`` and during a plain file copy under a write lock, the naive way to get
+a consistent copy.
+
+    python -m benchmarks.backup --size-mb 200 -o backup.json
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.common import environment, percentiles, write_report
+
+ROW_BYTES = 1000
+
+
+def _build(path: str, size_mb: int) -> int:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, data BLOB)")
+    rows = size_mb * 1024 * 1024 // ROW_BYTES
+    with conn:
+        conn.executemany("INSERT INTO items (data) VALUES (?)",
+                         ((os.urandom(ROW_BYTES),) for _ in range(rows)))
+    conn.close()
+    return rows
+
+
+class _Workload:
+    """Writer and reader threads recording per-operation latency."""
+
+    def __init__(self, path: str, rows: int, interval: float):
+        self.path, self.rows, self.interval = path, rows, interval
+        self.writes: List[float] = []
+        self.reads: List[float] = []
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._write), threading.Thread(target=self._read)]
+
+    def _write(self) -> None:
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        payload = os.urandom(512)
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            with conn:
+                conn.execute("INSERT INTO items (data) VALUES (?)", (payload,))
+            self.writes.append(time.perf_counter() - started)
+            time.sleep(self.interval)
+        conn.close()
+
+    def _read(self) -> None:
+        conn = sqlite3.connect(self.path, timeout=60)
+        rng = random.Random(0)
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            conn.execute("SELECT data FROM items WHERE id = ?", (rng.randrange(1, self.rows),)).fetchone()
+            self.reads.append(time.perf_counter() - started)
+            time.sleep(self.interval)
+        conn.close()
+
+    def __enter__(self) -> "_Workload":
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def _locked_copy(source: str, target: str) -> None:
+    conn = sqlite3.connect(source, timeout=60, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    # With writers locked out the main file plus the WAL are a consistent copy
+    shutil.copyfile(source, target)
+    shutil.copyfile(source + "-wal", target + "-wal")
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def _vacuum_into(source: str, target: str) -> None:
+    conn = sqlite3.connect(source, timeout=60)
+    conn.execute("VACUUM INTO ?", (target,))
+    conn.close()
+
+
+def _measure(path: str, rows: int, interval: float, action: Callable[[], Any],
+             idle_seconds: float) -> Dict[str, Any]:
+    with _Workload(path, rows, interval) as load:
+        started = time.perf_counter()
+        result = action() if action else time.sleep(idle_seconds)
+        seconds = time.perf_counter() - started
+    return {
+        "seconds": round(seconds, 2),
+        "write_ms": percentiles(load.writes),
+        "read_ms": percentiles(load.reads),
+        **({"result": result} if isinstance(result, dict) else {}),
+    }
+
+
+def run(size_mb: int, step_pages: int, max_mb_per_sec: float, interval: float, workdir: str) -> Dict[str, Any]:
+    import backup_db
+
+    source = os.path.join(workdir, "source.db")
+    rows = _build(source, size_mb)
+    target = os.path.join(workdir, "backup.db")
+
+    def fresh(fn):
+        def action():
+            for path in (target, target + "-wal"):
+                if os.path.exists(path):
+                    os.remove(path)
+            return fn()
+        return action
+
+    online = _measure(source, rows, interval, fresh(lambda: backup_db.backup(
+        target, source=source, step_pages=step_pages, max_mb_per_sec=max_mb_per_sec)), 0)
+    return {
+        "size_mb": size_mb,
+        "step_pages": step_pages,
+        "max_mb_per_sec": max_mb_per_sec,
+        "no_backup": _measure(source, rows, interval, None, online["seconds"]),
+        "online_backup": online,
+        "vacuum_into": _measure(source, rows, interval, fresh(lambda: _vacuum_into(source, target)), 0),
+        "locked_copy": _measure(source, rows, interval, fresh(lambda: _locked_copy(source, target)), 0),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--step-pages", type=int, default=256)
+    parser.add_argument("--max-mb-per-sec", type=float, default=50)
+    parser.add_argument("--interval", type=float, default=0.005, help="Pause between workload operations (s)")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="foodgene-bench-")
+    try:
+        result = run(args.size_mb, args.step_pages, args.max_mb_per_sec, args.interval, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report({"environment": environment(), "backup": result}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
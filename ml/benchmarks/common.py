@@ -0,0 +1,59 @@
+"""Shared helpers for the benchmark scripts."""
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+def load_example(name: str) -> Dict[str, Any]:
+    """Load a JSON payload from the repo's examples/ directory."""
+    with open(os.path.join(EXAMPLES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentiles(samples: Sequence[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """Mean and nearest-rank p50/p95/p99 of samples, multiplied by scale (s -> ms by default)."""
+    if not samples:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def rank(pct: float) -> float:
+        return ordered[min(n - 1, max(0, int(round(pct / 100 * n + 0.5)) - 1))] * scale
+
+    return {
+        "mean": round(sum(ordered) / n * scale, 4),
+        "p50": round(rank(50), 4),
+        "p95": round(rank(95), 4),
+        "p99": round(rank(99), 4),
+        "max": round(ordered[-1] * scale, 4),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the run so results can be compared across commits and machines."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_report(report: Dict[str, Any], path: Optional[str]) -> None:
+    """Print the report and optionally write it to path."""
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,76 @@
+"""Compare two benchmark reports and flag latency/throughput regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 10
+
+Exits with status 1 when any scenario's p95 latency or throughput, or any
+micro-benchmark's p50, is worse than the baseline by more than the threshold
+percentage.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+# (section, metric path, higher_is_better)
+METRICS = (
+    ("scenarios", ("throughput_rps",), True),
+    ("scenarios", ("latency_ms", "p50"), False),
+    ("scenarios", ("latency_ms", "p95"), False),
+    ("scenarios", ("latency_ms", "p99"), False),
+    ("micro", ("latency_us", "p50"), False),
+)
+# Only these are considered for the exit status; p50/p99 are informational
+GATED = {("throughput_rps",), ("latency_ms", "p95"), ("latency_us", "p50")}
+
+
+def _get(data: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data if isinstance(data, (int, float)) else None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float) -> Tuple[List[Dict[str, Any]], bool]:
+    rows, regressed = [], False
+    for section, path, higher_is_better in METRICS:
+        for name, result in (current.get(section) or {}).items():
+            old = _get((baseline.get(section) or {}).get(name, {}), path)
+            new = _get(result, path)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flagged = path in GATED and worse > threshold
+            regressed |= flagged
+            rows.append({"section": section, "name": name, "metric": ".".join(path),
+                         "baseline": old, "current": new, "change_pct": round(change, 1),
+                         "regression": flagged})
+    return rows, regressed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows, regressed = compare(baseline, current, args.threshold)
+    print(f"baseline {baseline.get('environment', {}).get('commit')} -> "
+          f"current {current.get('environment', {}).get('commit')}")
+    for row in rows:
+        marker = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['section']:<10} {row['name']:<26} {row['metric']:<15} "
+              f"{row['baseline']:>12.3f} -> {row['current']:>12.3f} ({row['change_pct']:+.1f}%){marker}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
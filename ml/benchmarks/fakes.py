@@ -0,0 +1,281 @@
+"""Local stand-ins for OpenAI and SMTP with configurable latency and errors.
+
+Both servers bind to 127.0.0.1 on a free port and run in daemon threads. The
+app under test is pointed at them through its normal configuration
+(``OPENAI_BASE_URL``, ``SMTP_SERVER``/``SMTP_PORT``), so the real client code
+paths, including retries, timeouts and the circuit breaker, are exercised.
+"""
+import datetime
+import json
+import random
+import socket
+import socketserver
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from models import plan_engine
+from models.meal_index import ALTERNATIVE_MEALS
+from prompts import count_tokens
+
+
+class LatencyProfile:
+    """Response-time and failure behaviour of a fake upstream.
+
+    Each call sleeps ``latency`` seconds plus uniform ``jitter``; with
+    probability ``slow_rate`` it sleeps ``slow_seconds`` instead (the tail),
+    and with probability ``error_rate`` it fails. With ``tokens_per_second``
+    set, a completion additionally takes its token count divided by that
+    rate, like a model decoding. Draws come from a seeded RNG so runs are
+    reproducible.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_seconds: float = 0.0, seed: int = 0,
+                 tokens_per_second: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.tokens_per_second = tokens_per_second
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return (delay_seconds, should_fail) for one call."""
+        with self._lock:
+            if self._rng.random() < self.slow_rate:
+                delay = self.slow_seconds
+            else:
+                delay = self.latency + self._rng.uniform(0, self.jitter)
+            return delay, self._rng.random() < self.error_rate
+
+    def decode_seconds(self, completion_tokens: int) -> float:
+        """Time to produce a completion of this many tokens."""
+        return completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate,
+            "slow_rate": self.slow_rate, "slow_seconds": self.slow_seconds,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+
+def fake_completion(prompt: str, rng: random.Random, grocery_list: bool = False) -> str:
+    """A plausible model reply; plans include a written grocery list when grocery_list is set."""
+    if "7-day" in prompt:
+        diet = rng.choice(sorted(plan_engine.MEAL_LIBRARY))
+        plan = plan_engine.generate_plan(rng.randrange(1600, 2800, 100), {}, {"diet_pref": diet})
+        days = [{"day": d["day"], "meals": [{k: v for k, v in m.items() if k != "allergens"}
+                                            for m in d["meals"]]} for d in plan["days"]]
+        if grocery_list:
+            # What the model used to write: item + display quantity per line
+            grocery = [{"item": g["item"], "quantity": g["quantity"]} for g in plan["grocery_list"]]
+            return json.dumps({"days": days, "grocery_list": grocery})
+        return json.dumps({"days": days})
+    meal = rng.choice(ALTERNATIVE_MEALS)
+    return json.dumps({k: meal[k] for k in ("name", "serving", "cal", "protein_g", "carbs_g", "fat_g")})
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server: "FakeOpenAIServer" = self.server.owner
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._reply(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+
+        delay, fail = server.profile.draw()
+        if not fail:
+            prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+            with server.lock:
+                content = fake_completion(prompt, server.rng, server.grocery_list)
+            prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+            delay += server.profile.decode_seconds(completion_tokens)
+        time.sleep(delay)
+        with server.lock:
+            server.calls += 1
+            server.failures += fail
+        if fail:
+            self._reply(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+
+        self._reply(200, {
+            "id": f"chatcmpl-fake{server.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+class FakeOpenAIServer:
+    """Chat-completions endpoint returning valid plan/meal JSON.
+
+    Use ``base_url`` as ``OPENAI_BASE_URL``. With ``grocery_list`` set, plans
+    come back with a model-written grocery list, as before it was built
+    locally.
+    """
+
+    def __init__(self, profile: Optional[LatencyProfile] = None, seed: int = 0,
+                 grocery_list: bool = False):
+        self.profile = profile or LatencyProfile()
+        self.grocery_list = grocery_list
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _OpenAIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _self_signed_context() -> ssl.SSLContext:
+    """Server TLS context for STARTTLS with a throwaway self-signed certificate."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    with tempfile.NamedTemporaryFile("wb", suffix=".pem") as pem:
+        pem.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption()))
+        pem.write(cert.public_bytes(serialization.Encoding.PEM))
+        pem.flush()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(pem.name)
+    return context
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _send(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def _rebind(self, sock) -> None:
+        self.connection = sock
+        self.rfile = sock.makefile("rb")
+        self.wfile = sock.makefile("wb")
+
+    def handle(self):
+        server: "FakeSMTPServer" = self.server.owner
+        self._send("220 fake-smtp ESMTP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._send("250-fake-smtp")
+                self._send("250-STARTTLS")
+                self._send("250 AUTH PLAIN LOGIN")
+            elif verb == "STARTTLS":
+                self._send("220 Ready to start TLS")
+                self._rebind(server.tls.wrap_socket(self.connection, server_side=True))
+            elif verb == "AUTH":
+                self._send("235 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._send("250 OK")
+            elif verb == "DATA":
+                self._send("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    size += len(chunk)
+                delay, fail = server.profile.draw()
+                time.sleep(delay)
+                with server.lock:
+                    server.messages += 1
+                    server.failures += fail
+                    server.bytes_received += size
+                self._send("451 Injected failure" if fail else "250 Queued")
+            elif verb == "QUIT":
+                self._send("221 Bye")
+                return
+            else:
+                self._send("502 Command not implemented")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSMTPServer:
+    """SMTP server that accepts STARTTLS and any AUTH, and discards mail.
+
+    The latency profile is applied after DATA, where a real relay does its work.
+    """
+
+    def __init__(self, profile: Optional[LatencyProfile] = None):
+        self.profile = profile or LatencyProfile()
+        self.lock = threading.Lock()
+        self.tls = _self_signed_context()
+        self.messages = 0
+        self.failures = 0
+        self.bytes_received = 0
+        self._server = _ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "FakeSMTPServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,105 @@
+"""Benchmark: LLM-generated vs locally computed grocery lists.
+
+Generates plans through the real OpenAI client against the fake OpenAI
+server, once with the model writing the ``grocery_list`` section (as before)
+and once with the list built locally. Both runs use the same seed, so the
+model returns the same meals and only the grocery section differs. Token
+counts are the usage the server reports and latencies are measured per call,
+with the server decoding at ``--tokens-per-second``. The local aggregation
+that replaces the section is timed separately.
+
+    python -m benchmarks.grocery --plans 5 --tokens-per-second 60 -o grocery.json
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import environment, percentiles, write_report
+from benchmarks.fakes import FakeOpenAIServer, LatencyProfile
+from models import plan_engine
+from models.grocery import apply_swap, build_grocery_list
+
+
+def _timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def _generate(plans: int, profile: LatencyProfile, seed: int, grocery_list: bool) -> Dict[str, Any]:
+    import llm
+    from prompts import token_meter
+
+    server = FakeOpenAIServer(profile, seed=seed, grocery_list=grocery_list).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    before = token_meter.stats().get("plan", {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+    latencies = []
+    try:
+        for _ in range(plans):
+            started = time.perf_counter()
+            llm.call_llm_for_plan(2000, {}, {"diet_pref": "balanced", "allergies": []})
+            latencies.append(time.perf_counter() - started)
+    finally:
+        server.stop()
+    after = token_meter.stats()["plan"]
+    calls = after["calls"] - before["calls"]
+    return {
+        "calls": calls,
+        "avg_prompt_tokens": round((after["prompt_tokens"] - before["prompt_tokens"]) / calls, 1),
+        "avg_completion_tokens": round((after["completion_tokens"] - before["completion_tokens"]) / calls, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def run(plans: int, latency: float, tokens_per_second: float, repeat: int, seed: int) -> Dict[str, Any]:
+    profile = {"latency": latency, "tokens_per_second": tokens_per_second}
+    with_grocery = _generate(plans, LatencyProfile(seed=seed, **profile), seed, grocery_list=True)
+    without_grocery = _generate(plans, LatencyProfile(seed=seed, **profile), seed, grocery_list=False)
+    saved = with_grocery["avg_completion_tokens"] - without_grocery["avg_completion_tokens"]
+
+    local: List[Dict[str, Any]] = []
+    for diet in plan_engine.MEAL_LIBRARY:
+        plan = plan_engine.generate_plan(2000, {}, {"diet_pref": diet})
+        old_meal = plan["days"][0]["meals"][1]
+        new_meal = plan["days"][1]["meals"][1]
+        local.append({
+            "diet": diet,
+            "grocery_items": len(plan["grocery_list"]),
+            "build_ms": round(_timeit(lambda: build_grocery_list(plan), repeat), 4),
+            "swap_update_ms": round(
+                _timeit(lambda: apply_swap(plan["grocery_list"], old_meal, new_meal), repeat), 4),
+        })
+    return {
+        "plans": plans,
+        "llm": profile,
+        "llm_grocery": with_grocery,
+        "local_grocery": without_grocery,
+        "completion_tokens_saved": round(saved, 1),
+        "completion_tokens_saved_pct": round(100 * saved / with_grocery["avg_completion_tokens"], 1),
+        "p50_latency_saved_ms": round(with_grocery["latency_ms"]["p50"] - without_grocery["latency_ms"]["p50"], 1),
+        "local_aggregation": local,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=5, help="Plans generated per mode")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fixed seconds per fake OpenAI call")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="Decode speed of the fake OpenAI server")
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    result = run(args.plans, args.llm_latency, args.tokens_per_second, args.repeat, args.seed)
+    write_report({"environment": environment(), "grocery": result}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Load test of the ML service against local OpenAI and SMTP stand-ins.
+
+Boots the app in-process under uvicorn on a free port, with OpenAI and SMTP
+replaced by the fakes in ``benchmarks.fakes`` and a throwaway SQLite
+database. Each scenario is driven by a fixed number of concurrent closed-loop
+clients; throughput and p50/p95/p99 latency are written to a JSON report that
+``benchmarks.compare`` can diff across commits.
+
+    python -m benchmarks.load --profile realistic -c 16 -n 200 -o bench.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.common import environment, load_example, percentiles, write_report
+from benchmarks.fakes import FakeOpenAIServer, FakeSMTPServer, LatencyProfile, free_port
+
+# Upstream behaviour per named profile (seconds / probabilities)
+PROFILES = {
+    "fast": {
+        "llm": {"latency": 0.05, "jitter": 0.02},
+        "smtp": {"latency": 0.01, "jitter": 0.005},
+    },
+    "realistic": {
+        "llm": {"latency": 1.5, "jitter": 1.0, "slow_rate": 0.02, "slow_seconds": 8.0, "error_rate": 0.01},
+        "smtp": {"latency": 0.2, "jitter": 0.2, "error_rate": 0.005},
+    },
+    "degraded": {
+        "llm": {"latency": 4.0, "jitter": 2.0, "slow_rate": 0.1, "slow_seconds": 20.0, "error_rate": 0.2},
+        "smtp": {"latency": 1.0, "jitter": 1.0, "error_rate": 0.05},
+    },
+}
+
+DIETS = ("balanced", "vegetarian", "keto")
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+def _plan_body(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "calories": rng.randrange(1600, 2800, 100),
+        "profile": {"diet_pref": rng.choice(DIETS), "allergies": rng.choice([[], ["peanuts"], ["milk"]])},
+    }
+
+
+def build_scenarios(state: Dict[str, Any]) -> Dict[str, Callable[[random.Random], Request]]:
+    """Map scenario name to a function producing one (method, path, json) request."""
+    scanner = load_example("sample_scanner_upload.json")
+    food_request = load_example("sample_food_request.json")
+    crop = load_example("sample_crop_yield.json")
+    text = load_example("research_summary_sample.json")["text"]
+
+    def swap(surprise: bool):
+        def make(rng):
+            return ("POST", "/api/swap-meal", {
+                "plan_id": rng.choice(state["plan_ids"]), "day": rng.choice(DAYS),
+                "meal_index": rng.randrange(3), "surprise": surprise,
+            })
+        return make
+
+    def nlp(rng):
+        # Half repeat submissions (corpus cache hits), half new documents
+        body = text if rng.random() < 0.5 else f"{text} Study {rng.randrange(10**9)} replicated this."
+        return ("POST", "/predict/nlp", {"text": body})
+
+    return {
+        "generate_plan": lambda rng: ("POST", "/api/generate-plan", _plan_body(rng)),
+        "swap_meal_local": swap(False),
+        "swap_meal_llm": swap(True),
+        "email_plan": lambda rng: ("POST", "/api/email-plan", {
+            "email": f"bench+{rng.randrange(10**6)}@example.com", "name": "Bench",
+            "htmlContent": "<p>Your plan</p>",
+        }),
+        "predict_scanner": lambda rng: ("POST", "/predict/scanner", scanner),
+        "predict_diet": lambda rng: ("POST", "/predict/diet", food_request),
+        "predict_crop_yield": lambda rng: ("POST", "/predict/crop_yield", {**crop, "rainfall": rng.randrange(400, 2500)}),
+        "predict_nlp": nlp,
+    }
+
+
+class AppServer:
+    """Run the FastAPI app under uvicorn in a background thread."""
+
+    def __init__(self, port: int):
+        import uvicorn
+        from app import app
+
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                                    log_level="warning", lifespan="on"))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60.0) -> "AppServer":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("App server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self._thread.join(timeout=30)
+
+
+async def drive(client, make_request: Callable[[random.Random], Request], total: int,
+                concurrency: int, seed: int) -> Dict[str, Any]:
+    """Issue total requests from concurrency closed-loop clients."""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sources: Counter = Counter()
+    remaining = [total]
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            method, path, body = make_request(rng)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+            except Exception as e:
+                status, response = type(e).__name__, None
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] += 1
+            if response is not None and status == 200:
+                data = response.json()
+                if isinstance(data, dict) and "source" in data:
+                    sources[data["source"]] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "error_rate": round(1 - ok / total, 4) if total else 0.0,
+        "status_counts": dict(statuses),
+        "sources": dict(sources),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def run_scenarios(base_url: str, names: List[str], total: int, concurrency: int,
+                        seed: int, seed_plans: int) -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        # Untimed setup: plans for the swap scenarios to edit
+        rng = random.Random(seed)
+        state = {"plan_ids": []}
+        for _ in range(seed_plans):
+            response = await client.post("/api/generate-plan", json=_plan_body(rng))
+            response.raise_for_status()
+            state["plan_ids"].append(response.json()["plan_id"])
+
+        scenarios = build_scenarios(state)
+        results = {}
+        for name in names:
+            results[name] = await drive(client, scenarios[name], total, concurrency, seed)
+            print(f"{name}: {results[name]['throughput_rps']} req/s, "
+                  f"p95 {results[name]['latency_ms']['p95']} ms", file=sys.stderr)
+        return results
+
+
+def _stage_summary() -> Dict[str, Any]:
+    from metrics import STAGE_SECONDS
+
+    return {labels["stage"]: STAGE_SECONDS.snapshot(**labels) for labels in STAGE_SECONDS.label_sets()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-s", "--scenario", action="append", help="Run only these scenarios (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seed-plans", type=int, default=20, help="Plans created before the swap scenarios")
+    parser.add_argument("--llm-latency", type=float, help="Override the profile's LLM base latency")
+    parser.add_argument("--llm-error-rate", type=float, help="Override the profile's LLM error rate")
+    parser.add_argument("--smtp-latency", type=float, help="Override the profile's SMTP latency")
+    parser.add_argument("--smtp-error-rate", type=float, help="Override the profile's SMTP error rate")
+    parser.add_argument("--micro-iterations", type=int, default=2000,
+                        help="Iterations per micro-benchmark (0 to skip)")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    llm_cfg = dict(PROFILES[args.profile]["llm"])
+    smtp_cfg = dict(PROFILES[args.profile]["smtp"])
+    for cfg, key, value in ((llm_cfg, "latency", args.llm_latency), (llm_cfg, "error_rate", args.llm_error_rate),
+                            (smtp_cfg, "latency", args.smtp_latency), (smtp_cfg, "error_rate", args.smtp_error_rate)):
+        if value is not None:
+            cfg[key] = value
+
+    openai_server = FakeOpenAIServer(LatencyProfile(seed=args.seed, **llm_cfg), seed=args.seed).start()
+    smtp_server = FakeSMTPServer(LatencyProfile(seed=args.seed + 1, **smtp_cfg)).start()
+    workdir = tempfile.mkdtemp(prefix="foodgene-bench-")
+    os.environ.update({
+        "FOODGENE_DB_PATH": os.path.join(workdir, "bench.db"),
+        "JWT_SECRET_KEY": "bench-secret",
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": openai_server.base_url,
+        "EMAIL_PROVIDER": "smtp",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_server.port),
+        "SENDER_EMAIL": "bench@example.com",
+        "SENDER_PASSWORD": "bench",
+    })
+
+    names = args.scenario or list(build_scenarios({"plan_ids": [""]}))
+    app_server = AppServer(free_port()).start()
+    try:
+        scenarios = asyncio.run(run_scenarios(app_server.base_url, names, args.requests,
+                                              args.concurrency, args.seed, args.seed_plans))
+    finally:
+        app_server.stop()
+        openai_server.stop()
+        smtp_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "environment": environment(),
+        "config": {
+            "profile": args.profile, "requests": args.requests, "concurrency": args.concurrency,
+            "seed": args.seed, "llm": llm_cfg, "smtp": smtp_cfg,
+        },
+        "scenarios": scenarios,
+        "stages": _stage_summary(),
+        "upstreams": {
+            "openai": {"calls": openai_server.calls, "failures": openai_server.failures},
+            "smtp": {"messages": smtp_server.messages, "failures": smtp_server.failures},
+        },
+    }
+    if args.micro_iterations > 0:
+        from benchmarks import micro
+        report["micro"] = micro.run(args.micro_iterations, args.seed)
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Latency of other endpoints while the service absorbs a login storm.
+
+Boots the app in-process (see ``benchmarks.load``) with a throwaway database,
+signs up a pool of users, then samples ``/health``, ``/predict/crop_yield``
+and ``/api/auth/me`` from one closed-loop client each:
+
+- ``baseline``: probes only
+- ``storm``: probes while ``-c`` clients log in back to back
+- ``storm_inline`` (with ``--inline``): the same storm with bcrypt run
+  directly on the event loop, i.e. without the hashing pool
+
+Probe p50/p95/p99 per phase show whether the rest of the service stays flat.
+
+    python -m benchmarks.login_storm -c 32 --duration 10 --rounds 12 -o storm.json
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import environment, load_example, percentiles, write_report
+from benchmarks.fakes import free_port
+
+PASSWORD = "storm-password"
+
+
+async def _probe(client, method: str, path: str, stop: asyncio.Event, interval: float,
+                 **kwargs) -> List[float]:
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def _login_worker(client, emails: List[str], offset: int, stop: asyncio.Event,
+                        latencies: List[float], statuses: Counter) -> None:
+    i = offset
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.post("/api/auth/login",
+                                     json={"email": emails[i % len(emails)], "password": PASSWORD})
+        latencies.append(time.perf_counter() - started)
+        statuses[str(response.status_code)] += 1
+        i += 1
+
+
+async def run_phase(client, token: str, duration: float, logins: int,
+                    interval: float) -> Dict[str, Any]:
+    """Probe for duration seconds with logins concurrent login clients."""
+    crop = load_example("sample_crop_yield.json")
+    stop = asyncio.Event()
+    probes = {
+        "health": _probe(client, "GET", "/health", stop, interval),
+        "predict_crop_yield": _probe(client, "POST", "/predict/crop_yield", stop, interval, json=crop),
+        "auth_me": _probe(client, "GET", "/api/auth/me", stop, interval,
+                          headers={"Authorization": f"Bearer {token}"}),
+    }
+    login_latencies: List[float] = []
+    statuses: Counter = Counter()
+    emails = [f"storm{i}@example.com" for i in range(max(logins, 1))]
+    tasks = {name: asyncio.create_task(coro) for name, coro in probes.items()}
+    workers = [asyncio.create_task(_login_worker(client, emails, i, stop, login_latencies, statuses))
+               for i in range(logins)]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*workers)
+
+    result = {"probes": {name: {"samples": len(lat), "latency_ms": percentiles(lat)}
+                         for name, lat in zip(tasks, await asyncio.gather(*tasks.values()))}}
+    if logins:
+        result["logins"] = {
+            "concurrency": logins,
+            "completed": len(login_latencies),
+            "throughput_rps": round(len(login_latencies) / duration, 2),
+            "status_counts": dict(statuses),
+            "latency_ms": percentiles(login_latencies),
+        }
+    return result
+
+
+def _inline_hasher_class():
+    import auth
+
+    class InlineHasher(auth.PasswordHasher):
+        """Runs bcrypt on the event loop, as a handler hashing inline would."""
+
+        async def _run(self, fn, *args):
+            return fn(*args)
+
+    return InlineHasher
+
+
+async def run(base_url: str, users: int, concurrency: int, duration: float, interval: float,
+              inline: bool) -> Dict[str, Any]:
+    import httpx
+
+    import auth
+
+    limits = httpx.Limits(max_connections=concurrency + 8, max_keepalive_connections=concurrency + 8)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        # Untimed setup: accounts for the storm and a token for the probe
+        for i in range(max(users, concurrency)):
+            response = await client.post("/api/auth/signup",
+                                         json={"email": f"storm{i}@example.com", "password": PASSWORD})
+            response.raise_for_status()
+        token = response.json()["access_token"]
+
+        phases = {"baseline": await run_phase(client, token, duration, 0, interval),
+                  "storm": await run_phase(client, token, duration, concurrency, interval)}
+        if inline:
+            InlineHasher = _inline_hasher_class()
+            pooled = auth.get_hasher()
+            auth._hasher = InlineHasher()
+            try:
+                phases["storm_inline"] = await run_phase(client, token, duration, concurrency, interval)
+            finally:
+                auth._hasher = pooled
+        for name, phase in phases.items():
+            probe_p95 = {probe: r["latency_ms"]["p95"] for probe, r in phase["probes"].items()}
+            print(f"{name}: probe p95 ms {probe_p95}", file=sys.stderr)
+        return phases
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="Concurrent login clients")
+    parser.add_argument("-u", "--users", type=int, default=64, help="Accounts created before the storm")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="Seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.02, help="Pause between probe requests")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--inline", action="store_true",
+                        help="Also run the storm with bcrypt on the event loop for comparison")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="foodgene-bench-")
+    os.environ.update({
+        "FOODGENE_DB_PATH": os.path.join(workdir, "bench.db"),
+        "BCRYPT_ROUNDS": str(args.rounds),
+        "JWT_SECRET_KEY": "bench-secret",
+    })
+    # No LLM is involved; keep any real key out of the run
+    os.environ.pop("OPENAI_API_KEY", None)
+
+    from benchmarks.load import AppServer
+
+    app_server = AppServer(free_port()).start()
+    try:
+        phases = asyncio.run(run(app_server.base_url, args.users, args.concurrency,
+                                 args.duration, args.interval, args.inline))
+    finally:
+        app_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    import auth
+
+    report = {
+        "environment": environment(),
+        "config": {
+            "concurrency": args.concurrency, "users": args.users, "duration_s": args.duration,
+            "probe_interval_s": args.interval, "bcrypt_rounds": args.rounds,
+            "hash_workers": auth.HASH_WORKERS, "hash_queue": auth.HASH_QUEUE,
+        },
+        "phases": phases,
+    }
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
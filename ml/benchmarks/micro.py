@@ -0,0 +1,72 @@
+"""Micro-benchmarks for the hot model and parsing functions.
+
+    python -m benchmarks.micro -n 2000 -o micro.json
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.common import environment, load_example, percentiles, write_report
+from benchmarks.fakes import fake_completion
+
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int = 50) -> Dict[str, Any]:
+    """Time iterations of fn individually; latencies are reported in microseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    total = sum(samples)
+    return {"iterations": iterations, "ops_per_second": round(iterations / total, 1) if total else None,
+            "latency_us": percentiles(samples, scale=1e6)}
+
+
+def cases(seed: int = 0) -> Dict[str, Callable[[], Any]]:
+    import llm
+    from models import crop_yield, diet_generator, nlp
+
+    rng = random.Random(seed)
+    # A completion as the model returns it: JSON wrapped in a little prose
+    completion = "Here is your plan:\n" + fake_completion("7-day", rng) + "\nEnjoy!"
+    food_request = load_example("sample_food_request.json")
+    crop = load_example("sample_crop_yield.json")
+    text = load_example("research_summary_sample.json")["text"]
+
+    return {
+        "extract_json": lambda: llm._extract_json(completion),
+        "diet_generator.generate": lambda: diet_generator.generate(
+            food_request["profile"], food_request["food_items"], food_request["constraints"]),
+        "crop_yield.predict": lambda: crop_yield.predict(crop),
+        "nlp.summarize": lambda: nlp.summarize(text),
+    }
+
+
+def run(iterations: int, seed: int = 0) -> Dict[str, Any]:
+    return {name: measure(fn, iterations) for name, fn in cases(seed).items()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    write_report({"environment": environment(), "micro": run(args.iterations, args.seed)}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Benchmark: plan revision storage size and reconstruction cost.
+
+Simulates users editing their plans (mostly meal swaps, some calorie
+tweaks) through ``plan_store`` on a throwaway database and compares the
+revision table against storing the whole plan JSON for every revision.
+Then times rebuilding random revisions and listing a plan's history.
+
+    python -m benchmarks.plan_history --plans 200 --revisions 30 -o plan_history.json
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import environment, percentiles, write_report
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def _edit(plan: Dict[str, Any], constraints: Dict[str, Any], rng: random.Random, rescale_rate: float):
+    """Apply one user edit; returns (plan, constraints or None, reason)."""
+    from models.grocery import apply_swap
+    from models.meal_index import ALTERNATIVE_MEALS
+    from models.plan_rescaler import RescaleError, rescale_plan
+
+    if rng.random() < rescale_rate:
+        calories = rng.randrange(1500, 3000, 100)
+        ratio = calories / constraints["calories"]
+        macros = {k: v * ratio for k, v in constraints["macros"].items()}
+        try:
+            plan = rescale_plan(plan, calories, macros, strict=False, previous=constraints)
+        except RescaleError:
+            pass
+        return plan, {**constraints, "calories": calories, "macros": macros}, "rescale"
+
+    day = plan["days"][rng.randrange(len(DAYS))]
+    index = rng.randrange(len(day["meals"]))
+    old_meal, new_meal = day["meals"][index], dict(rng.choice(ALTERNATIVE_MEALS))
+    day["meals"][index] = new_meal
+    plan["grocery_list"] = apply_swap(plan["grocery_list"], old_meal, new_meal)
+    return plan, None, "swap"
+
+
+def run(plans: int, revisions: int, rescale_rate: float, lookups: int, seed: int) -> Dict[str, Any]:
+    import plan_store
+    from db import get_connection
+    from models import plan_engine
+    from serialization import dumps
+
+    rng = random.Random(seed)
+    conn = get_connection()
+    conn.execute("CREATE TABLE full_copies (plan_id VARCHAR, revision INTEGER, generated_plan JSON)")
+    plan_ids = []
+    edit_seconds = []
+    for _ in range(plans):
+        calories = rng.randrange(1500, 3000, 100)
+        constraints = {"calories": calories, "macros": {"protein_g": 150, "carbs_g": 250, "fat_g": 65},
+                       "profile": {"diet_pref": rng.choice(sorted(plan_engine.MEAL_LIBRARY)), "allergies": []}}
+        plan = plan_engine.generate_plan(calories, constraints["macros"], constraints["profile"])
+        plan = {"days": [{"day": d["day"], "meals": [dict(m) for m in d["meals"]]} for d in plan["days"]],
+                "grocery_list": [dict(g) for g in plan["grocery_list"]]}
+        plan_id = plan_store.save_plan(plan, constraints)
+        plan_ids.append(plan_id)
+        conn.execute("INSERT INTO full_copies VALUES (?, 0, ?)", (plan_id, dumps(plan).decode()))
+        for revision in range(1, revisions + 1):
+            plan, new_constraints, reason = _edit(plan, constraints, rng, rescale_rate)
+            constraints = new_constraints or constraints
+            started = time.perf_counter()
+            plan_store.update_plan(plan_id, plan, new_constraints, reason=reason)
+            edit_seconds.append(time.perf_counter() - started)
+            conn.execute("INSERT INTO full_copies VALUES (?, ?, ?)", (plan_id, revision, dumps(plan).decode()))
+    conn.commit()
+
+    def table_bytes(sql: str) -> int:
+        return conn.execute(sql).fetchone()[0]
+
+    delta_bytes = table_bytes("SELECT SUM(LENGTH(data)) FROM plan_revisions")
+    full_bytes = table_bytes("SELECT SUM(LENGTH(generated_plan)) FROM full_copies")
+    kinds = dict(conn.execute("SELECT kind, COUNT(*) FROM plan_revisions GROUP BY kind").fetchall())
+
+    rebuild, history = [], []
+    for _ in range(lookups):
+        plan_id, revision = rng.choice(plan_ids), rng.randrange(revisions + 1)
+        started = time.perf_counter()
+        plan_store.get_revision(plan_id, revision)
+        rebuild.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        plan_store.list_revisions(plan_id)
+        history.append(time.perf_counter() - started)
+
+    return {
+        "plans": plans,
+        "revisions_per_plan": revisions,
+        "snapshot_interval": plan_store.SNAPSHOT_INTERVAL,
+        "revision_kinds": kinds,
+        "storage_bytes": {
+            "full_copy_per_revision": full_bytes,
+            "snapshots_and_deltas": delta_bytes,
+            "reduction_pct": round(100 * (1 - delta_bytes / full_bytes), 1),
+        },
+        "update_ms": percentiles(edit_seconds),
+        "rebuild_revision_ms": percentiles(rebuild),
+        "list_history_ms": percentiles(history),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=200)
+    parser.add_argument("--revisions", type=int, default=30, help="Edits per plan")
+    parser.add_argument("--rescale-rate", type=float, default=0.1, help="Share of edits that are calorie tweaks")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="foodgene-bench-")
+    os.environ["FOODGENE_DB_PATH"] = os.path.join(workdir, "bench.db")
+    try:
+        result = run(args.plans, args.revisions, args.rescale_rate, args.lookups, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report({"environment": environment(), "plan_history": result}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
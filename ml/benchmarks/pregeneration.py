@@ -0,0 +1,147 @@
+"""Benchmark: peak-time plan requests with and without off-peak pre-generation.
+
+Seeds completed profiles on a throwaway database and points the app at a
+fake OpenAI server with realistic latency. One ``plan_scheduler`` pass
+pre-generates next week's plans under the configured rate and concurrency
+budget; then every user requests a plan "on Sunday evening" through
+``/api/generate-plan`` and the latency is compared with users whose plan
+has to be generated on demand.
+
+    python -m benchmarks.pregeneration --users 40 --llm-latency 1.5 -o pregeneration.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import environment, percentiles, write_report
+from benchmarks.fakes import FakeOpenAIServer, LatencyProfile
+
+DIETS = ("balanced", "vegetarian", "vegan", "keto")
+ACTIVITY = ("Sedentary", "Light", "Moderate", "Active", "Very Active")
+
+
+def _seed_profiles(users: int) -> List[Dict[str, Any]]:
+    import plan_scheduler
+
+    conn = plan_scheduler._conn()
+    profiles = []
+    with conn:
+        for i in range(users):
+            row = {
+                "id": f"profile-{i}", "user_id": f"user-{i:04d}", "name": f"User {i}",
+                "age": 20 + i % 40, "weight": 55 + i % 45, "height": 155 + i % 40,
+                "activity_level": ACTIVITY[i % len(ACTIVITY)],
+                "dietary_preferences": json.dumps([DIETS[i % len(DIETS)]]),
+                "allergies": json.dumps(["peanuts"] if i % 5 == 0 else []),
+                "profile_complete": True,
+            }
+            conn.execute(
+                "INSERT INTO profiles (id, user_id, name, age, weight, height, activity_level, "
+                "dietary_preferences, allergies, profile_complete) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(row.values()),
+            )
+            profiles.append(row)
+    return profiles
+
+
+def _request(profile: Dict[str, Any]) -> Dict[str, Any]:
+    import plan_scheduler
+
+    calories, macros, plan_profile = plan_scheduler.plan_inputs(profile)
+    return {"calories": calories, "macros": macros, "profile": plan_profile}
+
+
+def _auth(profile: Dict[str, Any]) -> Dict[str, str]:
+    import auth
+
+    token = auth.create_access_token(profile["user_id"], f"{profile['user_id']}@example.com")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def run(users: int, concurrency: int, rate: float) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+
+    import plan_scheduler
+    from app import app
+
+    profiles = _seed_profiles(users)
+    # Pretend the pass runs in the early hours of Thursday and requests arrive on Sunday evening
+    thursday = date.today() + timedelta(days=(3 - date.today().weekday()) % 7)
+    sunday = thursday + timedelta(days=3)
+
+    pregenerator = plan_scheduler.PlanPregenerator(concurrency=concurrency, rate_per_minute=rate)
+    started = time.perf_counter()
+    pass_result = asyncio.run(pregenerator.run_once(today=thursday))
+    pass_seconds = time.perf_counter() - started
+
+    on_demand, pregenerated, sources = [], [], {}
+    real_today = plan_scheduler.date
+
+    class _Sunday(date):
+        @classmethod
+        def today(cls):
+            return sunday
+
+    plan_scheduler.date = _Sunday
+    try:
+        with TestClient(app) as client:
+            for profile in profiles:
+                # On demand: same request anonymously, so nothing pre-generated applies
+                started = time.perf_counter()
+                client.post("/api/generate-plan", json=_request(profile)).raise_for_status()
+                on_demand.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                response = client.post("/api/generate-plan", json=_request(profile), headers=_auth(profile))
+                pregenerated.append(time.perf_counter() - started)
+                response.raise_for_status()
+                kind = "pregenerated" if response.json().get("pregenerated") else response.json()["source"]
+                sources[kind] = sources.get(kind, 0) + 1
+    finally:
+        plan_scheduler.date = real_today
+
+    return {
+        "users": users,
+        "budget": {"concurrency": concurrency, "rate_per_minute": rate},
+        "pregeneration_pass": {**pass_result, "wall_seconds": round(pass_seconds, 2),
+                               "ran_at": datetime.combine(thursday, datetime.min.time()).isoformat()},
+        "peak_on_demand_ms": percentiles(on_demand),
+        "peak_pregenerated_ms": percentiles(pregenerated),
+        "peak_sources": sources,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM calls during the pass")
+    parser.add_argument("--rate", type=float, default=120, help="LLM calls per minute during the pass")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Seconds per fake OpenAI call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="foodgene-bench-")
+    os.environ["FOODGENE_DB_PATH"] = os.path.join(workdir, "bench.db")
+    server = FakeOpenAIServer(LatencyProfile(latency=args.llm_latency, seed=args.seed), seed=args.seed).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+    try:
+        result = run(args.users, args.concurrency, args.rate)
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report({"environment": environment(), "pregeneration": result}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
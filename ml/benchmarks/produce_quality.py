@@ -0,0 +1,106 @@
+"""Benchmark: produce quality grading of a synthetic high-resolution tray photo.
+
+Renders a tray of produce (with bruises) at the requested resolution, encodes
+it as JPEG, and times decoding plus grading inline and across the process pool.
+
+    python -m benchmarks.produce_quality --megapixels 24 -w 4 -o quality.json
+"""
+import argparse
+import io
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.common import environment, write_report
+from src.vision_service.produce_quality_detection import REFERENCE_COLOURS, ProduceGrader, load_image
+
+
+def synthetic_tray(megapixels: float, seed: int = 0) -> np.ndarray:
+    """Grey tray with rows of coloured produce, about 10% of it bruised."""
+    rng = np.random.default_rng(seed)
+    width = int(math.sqrt(megapixels * 1e6 * 3 / 2))
+    height = int(width * 2 / 3)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = (128, 128, 124)
+    radius = max(8, width // 40)
+    colours = list(REFERENCE_COLOURS.values())
+    for cy in range(radius, height - radius, int(radius * 2.2)):
+        for cx in range(radius, width - radius, int(radius * 2.2)):
+            colour = np.array(colours[((cy // radius) + (cx // radius)) % len(colours)], dtype=np.int16)
+            y0, y1, x0, x1 = cy - radius, cy + radius, cx - radius, cx + radius
+            yy, xx = np.ogrid[y0:y1, x0:x1]
+            disc = (yy - cy) ** 2 + (xx - cx) ** 2 <= radius ** 2
+            shade = np.clip(colour + rng.integers(-12, 12, size=3), 0, 255).astype(np.uint8)
+            image[y0:y1, x0:x1][disc] = shade
+            if rng.random() < 0.1:
+                by, bx = cy + rng.integers(-radius // 2, radius // 2), cx + rng.integers(-radius // 2, radius // 2)
+                bruise = (yy - by) ** 2 + (xx - bx) ** 2 <= (radius // 2) ** 2
+                image[y0:y1, x0:x1][disc & bruise] = (shade * 0.35).astype(np.uint8)
+    return image
+
+
+def _time(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(megapixels: float, workers: int, repeat: int, seed: int) -> Dict[str, Any]:
+    from PIL import Image
+
+    image = synthetic_tray(megapixels, seed)
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, "JPEG", quality=90)
+    encoded = buffer.getvalue()
+
+    decode_s, decoded = _time(lambda: load_image(encoded), repeat)
+    results = {}
+    for name, count in (("inline", 1), ("pool", workers)):
+        grader = ProduceGrader(workers=count)
+        try:
+            if count > 1:
+                grader.grade_image(decoded)  # start and warm the pool
+            seconds, graded = _time(lambda: grader.grade_image(decoded), repeat)
+        finally:
+            grader.shutdown()
+        results[name] = {
+            "workers": count,
+            "grade_seconds": round(seconds, 3),
+            "patches_per_second": round(graded["patches"] / seconds),
+            "end_to_end_seconds": round(decode_s + seconds, 3),
+        }
+    return {
+        "environment": environment(),
+        "image": {"width": image.shape[1], "height": image.shape[0],
+                  "megapixels": round(image.shape[0] * image.shape[1] / 1e6, 1),
+                  "jpeg_bytes": len(encoded)},
+        "decode_seconds": round(decode_s, 3),
+        "grading": results,
+        "summary": {k: graded[k] for k in ("overall_grade", "overall_quality", "produce_coverage", "patches")},
+        "items": [{k: item[k] for k in ("label", "grade", "quality", "coverage", "estimated_items")}
+                  for item in graded["items"]],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=24.0)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    write_report(run(args.megapixels, args.workers, args.repeat, args.seed), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
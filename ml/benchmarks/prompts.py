@@ -0,0 +1,89 @@
+"""Benchmark: prompt size of the compact encoding vs the previous prompts.
+
+Compares prompt tokens of the plan and meal-swap prompts against the former
+verbose JSON prompts (full schema per day, plan truncated at 1500 chars) and
+converts the difference with an assumed prefill rate.
+
+    python -m benchmarks.prompts -o prompts.json
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import write_report
+from models import plan_engine
+from prompts import count_tokens, plan_prompt, swap_prompt
+
+_MEAL = '{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}'
+
+
+def _legacy_constraints(calories, macros, profile, plan_style: bool) -> str:
+    allergies = ', '.join(profile.get('allergies', [])) if profile.get('allergies') else 'none'
+    if plan_style:
+        return (f"Constraints:\n- daily calories target: {calories}\n"
+                f"- macros per day: protein {macros.get('protein_g', 150)} g, fat {macros.get('fat_g', 65)} g, "
+                f"carbs {macros.get('carbs_g', 250)} g\n- preference: {profile.get('diet_pref', 'balanced')}\n"
+                f"- allergies: {allergies}")
+    return (f"Constraints:\n- daily calories: {calories}\n"
+            f"- macros: protein {macros.get('protein_g', 150)}g, fat {macros.get('fat_g', 65)}g, "
+            f"carbs {macros.get('carbs_g', 250)}g\n- diet preference: {profile.get('diet_pref', 'balanced')}\n"
+            f"- allergies: {allergies}")
+
+
+def legacy_plan_prompt(calories, macros, profile) -> str:
+    days = ",\n".join(
+        f'    {{"day": "{d}", "meals": [{_MEAL.format()}]}}' for d in plan_engine.DAYS
+    )
+    return ("You are a professional dietitian. Produce a 7-day meal plan for one adult.\n"
+            f"{_legacy_constraints(calories, macros, profile, True)}\n\n"
+            "Output ONLY valid JSON matching this structure, no other text:\n"
+            f'{{\n  "days": [\n{days}\n  ],\n  "grocery_list": [{{"item": "", "quantity": ""}}]\n}}\n'
+            "Be concise. Return JSON only.")
+
+
+def legacy_swap_prompt(plan, day, meal_index, calories, macros, profile) -> str:
+    return ("You are a professional dietitian. Given the following meal plan, replace the meal at "
+            f"day '{day}', meal index {meal_index} with a single alternative meal.\n\n"
+            f"Plan (truncated): {json.dumps(plan)[:1500]}\n\n"
+            f"{_legacy_constraints(calories, macros, profile, False)}\n\n"
+            "Return ONLY valid JSON of the single meal, no other text:\n" + _MEAL.format())
+
+
+def run(prefill_tokens_per_second: float) -> Dict[str, Any]:
+    macros = {"protein_g": 150, "carbs_g": 220, "fat_g": 70}
+    results: List[Dict[str, Any]] = []
+    for diet in plan_engine.MEAL_LIBRARY:
+        profile = {"diet_pref": diet, "allergies": ["peanuts"]}
+        plan = plan_engine.generate_plan(2000, macros, profile)
+        pairs = {
+            "plan": (legacy_plan_prompt(2000, macros, profile), plan_prompt(2000, macros, profile)),
+            "swap": (legacy_swap_prompt(plan, "Fri", 1, 2000, macros, profile),
+                     swap_prompt(plan, "Fri", 1, 2000, macros, profile)),
+        }
+        for call, (old, new) in pairs.items():
+            old_tokens, new_tokens = count_tokens(old), count_tokens(new)
+            results.append({
+                "diet": diet,
+                "call": call,
+                "legacy_prompt_tokens": old_tokens,
+                "compact_prompt_tokens": new_tokens,
+                "tokens_saved_pct": round(100 * (old_tokens - new_tokens) / old_tokens, 1),
+                "prefill_ms_saved": round(1000 * (old_tokens - new_tokens) / prefill_tokens_per_second, 1),
+            })
+    return {"prefill_tokens_per_second": prefill_tokens_per_second, "prompts": results}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=2000.0,
+                        help="Assumed prompt processing speed used to convert tokens to time")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    write_report(run(args.prefill_tokens_per_second), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
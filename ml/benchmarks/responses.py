@@ -0,0 +1,73 @@
+"""Encoding cost and wire size of a generate-plan response.
+
+Compares FastAPI's default path (``jsonable_encoder`` + stdlib JSON), orjson
+encoding of the plan dict, and splicing the engine's cached plan bytes, then
+reports the body size uncompressed, gzipped and (when installed) brotli'd.
+
+    python -m benchmarks.responses -n 2000 -o responses.json
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import environment, write_report
+from benchmarks.micro import measure
+
+
+def run(iterations: int) -> Dict[str, Any]:
+    from fastapi.encoders import jsonable_encoder
+    from starlette.responses import JSONResponse
+
+    import compression
+    import serialization
+    from models import plan_engine
+    from serialization import ORJSONResponse, RawJSON
+
+    profile = {"diet_pref": "balanced", "allergies": ["peanuts"]}
+    plan = plan_engine.generate_plan(2000, {}, profile)
+    plan_id = "0b9f3c1e-5d1a-4f7e-9a55-6f0d2c1b7e42"
+
+    def default():
+        return JSONResponse(jsonable_encoder({"plan_id": plan_id, "plan": plan, "source": "demo"})).body
+
+    def orjson_dict():
+        return ORJSONResponse({"plan_id": plan_id, "plan": plan, "source": "demo"}).body
+
+    def cached_bytes():
+        plan_json = plan_engine.generate_plan_json(2000, profile)
+        return ORJSONResponse({"plan_id": plan_id, "plan": RawJSON(plan_json), "source": "demo"}).body
+
+    assert json.loads(default()) == json.loads(orjson_dict()) == json.loads(cached_bytes())
+
+    body = cached_bytes()
+    sizes = {"identity": len(body), "gzip": len(compression.compress(body, "gzip"))}
+    encodings = {"gzip": lambda: compression.compress(body, "gzip")}
+    if compression.brotli is not None:
+        sizes["br"] = len(compression.compress(body, "br"))
+        encodings["br"] = lambda: compression.compress(body, "br")
+
+    return {
+        "orjson": serialization.orjson is not None,
+        "encode": {
+            "fastapi_default": measure(default, iterations),
+            "orjson_dict": measure(orjson_dict, iterations),
+            "cached_bytes": measure(cached_bytes, iterations),
+        },
+        "compress": {name: measure(fn, iterations) for name, fn in encodings.items()},
+        "body_bytes": sizes,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    write_report({"environment": environment(), "responses": run(args.iterations)}, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Throughput of run_backend.py's production mode by worker count.
+
+For each worker count, starts ``run_backend.py --production --workers N`` as
+a subprocess against the fake OpenAI/SMTP upstreams and a throwaway
+database, drives the ``benchmarks.load`` scenarios over HTTP and stops the
+server with SIGTERM. ``--workers 0`` runs the single-process development
+mode as the baseline.
+
+    python -m benchmarks.serving -w 0 -w 1 -w 4 -s predict_nlp -s generate_plan -o serving.json
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import environment, write_report
+from benchmarks.fakes import FakeOpenAIServer, FakeSMTPServer, LatencyProfile, free_port
+from benchmarks.load import PROFILES, build_scenarios, run_scenarios
+
+RUN_BACKEND = os.path.join(os.path.dirname(__file__), "..", "..", "run_backend.py")
+
+
+def start_server(workers: int, port: int, env: Dict[str, str], log, timeout: float = 120.0) -> subprocess.Popen:
+    """Start run_backend.py and wait until /health answers."""
+    import httpx
+
+    command = [sys.executable, RUN_BACKEND, "--host", "127.0.0.1", "--port", str(port)]
+    if workers:
+        command += ["--production", "--workers", str(workers)]
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=2).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    process.kill()
+    raise RuntimeError("Server failed to start")
+
+
+def stop_server(process: subprocess.Popen, timeout: float = 60.0) -> Optional[int]:
+    process.send_signal(signal.SIGTERM)
+    try:
+        return process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-w", "--workers", type=int, action="append",
+                        help="Worker counts to compare (repeatable; 0 = development mode)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-s", "--scenario", action="append", help="Run only these scenarios (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seed-plans", type=int, default=20)
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    worker_counts = args.workers or [0, os.cpu_count() or 1]
+    names = args.scenario or list(build_scenarios({"plan_ids": [""]}))
+    llm_cfg, smtp_cfg = PROFILES[args.profile]["llm"], PROFILES[args.profile]["smtp"]
+    openai_server = FakeOpenAIServer(LatencyProfile(seed=args.seed, **llm_cfg), seed=args.seed).start()
+    smtp_server = FakeSMTPServer(LatencyProfile(seed=args.seed + 1, **smtp_cfg)).start()
+    workdir = tempfile.mkdtemp(prefix="foodgene-bench-")
+
+    runs = {}
+    try:
+        for workers in worker_counts:
+            env = dict(os.environ, **{
+                "FOODGENE_DB_PATH": os.path.join(workdir, f"bench-{workers}.db"),
+                "JWT_SECRET_KEY": "bench-secret",
+                "OPENAI_API_KEY": "bench-key",
+                "OPENAI_BASE_URL": openai_server.base_url,
+                "EMAIL_PROVIDER": "smtp",
+                "SMTP_SERVER": "127.0.0.1",
+                "SMTP_PORT": str(smtp_server.port),
+                "SENDER_EMAIL": "bench@example.com",
+                "SENDER_PASSWORD": "bench",
+            })
+            port = free_port()
+            label = f"workers_{workers}" if workers else "development"
+            with open(os.path.join(workdir, f"{label}.log"), "wb") as log:
+                process = start_server(workers, port, env, log)
+                try:
+                    print(f"{label}:", file=sys.stderr)
+                    scenarios = asyncio.run(run_scenarios(f"http://127.0.0.1:{port}", names, args.requests,
+                                                          args.concurrency, args.seed, args.seed_plans))
+                finally:
+                    exit_code = stop_server(process)
+            runs[label] = {"workers": workers, "scenarios": scenarios, "exit_code": exit_code}
+    finally:
+        openai_server.stop()
+        smtp_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report: Dict[str, Any] = {
+        "environment": environment(),
+        "config": {"profile": args.profile, "requests": args.requests, "concurrency": args.concurrency,
+                   "seed": args.seed, "workers": worker_counts},
+        "runs": runs,
+    }
+    baseline = runs.get("development") or next(iter(runs.values()))
+    report["speedup"] = {
+        label: {name: round(run["scenarios"][name]["throughput_rps"] / baseline["scenarios"][name]["throughput_rps"], 2)
+                for name in names}
+        for label, run in runs.items()
+    }
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Circuit breaker for slow or failing upstream providers."""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _percentile(sorted_values, pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Ticket(NamedTuple):
+    """Permission for one call, handed back to ``record()`` with its outcome."""
+    probe: bool
+    generation: int
+
+
+class CircuitBreaker:
+    """Track outcomes of recent calls and short-circuit while a provider is unhealthy.
+
+    A call counts as a failure when it raises or takes longer than
+    ``slow_call_seconds``. Once at least ``min_calls`` of the last
+    ``window_size`` calls are recorded and the failure rate reaches
+    ``failure_rate_threshold``, or the p95 latency of the window exceeds
+    ``p95_threshold_seconds`` (a provider that still answers, but too slowly
+    to be worth waiting for), the breaker opens and ``allow()`` returns None
+    for ``open_seconds``. It then half-opens and lets a single probe through:
+    success closes the breaker, failure re-opens it.
+
+    Every trip starts a new generation. Outcomes of calls admitted in an
+    earlier generation (still in flight when the breaker opened) are ignored,
+    and only the probe's own outcome can close a half-open breaker.
+    """
+
+    def __init__(self, name: str, window_size: int = 20, min_calls: int = 5,
+                 failure_rate_threshold: float = 0.5, slow_call_seconds: float = 15.0,
+                 open_seconds: float = 30.0, p95_threshold_seconds: float = 0.0):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.p95_threshold_seconds = p95_threshold_seconds
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window_size)
+        self._latencies = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._generation = 0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "CircuitBreaker":
+        """Build a breaker configured by ``<prefix>_*`` environment variables."""
+        return cls(
+            name,
+            window_size=int(os.getenv(f"{prefix}_WINDOW", "20")),
+            min_calls=int(os.getenv(f"{prefix}_MIN_CALLS", "5")),
+            failure_rate_threshold=float(os.getenv(f"{prefix}_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv(f"{prefix}_SLOW_CALL_SECONDS", "15")),
+            open_seconds=float(os.getenv(f"{prefix}_OPEN_SECONDS", "30")),
+            p95_threshold_seconds=float(os.getenv(f"{prefix}_P95_SECONDS", "0")),
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> Optional[Ticket]:
+        """Return a ticket if a call may go to the provider now, else None."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return Ticket(False, self._generation)
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return Ticket(True, self._generation)
+            return None
+
+    def record(self, ticket: Ticket, success: bool, latency: float) -> None:
+        """Record the outcome of a call that allow() let through with ``ticket``."""
+        failed = not success or latency > self.slow_call_seconds
+        with self._lock:
+            if ticket.generation != self._generation:
+                return
+            if ticket.probe:
+                self._probe_in_flight = False
+                if failed:
+                    self._trip()
+                else:
+                    logger.info("Circuit %s closed after successful probe", self.name)
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    self._latencies.append(latency)
+                return
+            if self._state != CLOSED:
+                return
+
+            self._latencies.append(latency)
+            self._outcomes.append(failed)
+            if len(self._outcomes) < self.min_calls:
+                return
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate_threshold:
+                self._trip("failure rate")
+            elif (self.p95_threshold_seconds > 0
+                    and _percentile(sorted(self._latencies), 95) > self.p95_threshold_seconds):
+                self._trip("p95 latency")
+
+    def _trip(self, reason: str = "failed probe") -> None:
+        logger.warning("Circuit %s opened for %.0fs (%s)", self.name, self.open_seconds, reason)
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._generation += 1
+        self._outcomes.clear()
+        # Latencies from before the trip must not re-open the breaker once it closes
+        self._latencies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return state, recent failure rate and latency percentiles (seconds)."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            outcomes = list(self._outcomes)
+            return {
+                "state": self._current_state(),
+                "failure_rate": sum(outcomes) / len(outcomes) if outcomes else 0.0,
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+            }
@@ -0,0 +1,183 @@
+"""Negotiated brotli/gzip compression of response bodies.
+
+A plan response (seven days of meals plus a grocery list) is 5-10 KB of
+repetitive JSON that compresses 5-8x, which matters most to mobile clients on
+slow links. Brotli is preferred when the client accepts it and the
+``brotli`` package is installed; gzip otherwise. Small bodies, non-text
+content types and responses that already carry a Content-Encoding are passed
+through untouched.
+
+Levels are tuned for dynamic content: brotli quality 4 and gzip level 6
+compress a plan in well under a millisecond while getting most of the size
+reduction of the maximum settings.
+"""
+import logging
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Pick "br", "gzip" or None for an Accept-Encoding header.
+
+    Brotli wins ties since it is smaller at similar CPU cost.
+    """
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 16+15 writes a gzip header and trailer
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body with "br" or "gzip"."""
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if b"accept-encoding" in vary.lower():
+        return headers
+    return [(k, v + b", Accept-Encoding" if k.lower() == b"vary" else v) for k, v in headers]
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses with brotli or gzip."""
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for key, value in scope.get("headers", ()):
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            start = state["start"]
+            if start is not None:
+                # First body message decides how the response is sent
+                state["start"] = None
+                headers = list(start.get("headers", []))
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+                compressible = (
+                    _header(headers, b"content-encoding") is None
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                    and start["status"] not in (204, 304)
+                    and (more or len(body) >= self.minimum_size)
+                )
+                if not compressible:
+                    state["passthrough"] = True
+                    if content_type.startswith(COMPRESSIBLE_TYPES):
+                        headers = _add_vary(headers)
+                    await send({**start, "headers": headers})
+                    await send(message)
+                    return
+
+                headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+                headers = _add_vary(headers) + [(b"content-encoding", encoding.encode())]
+                if not more:
+                    data = compress(body, encoding)
+                    headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                state["compressor"] = _Compressor(encoding)
+                await send({**start, "headers": headers})
+
+            compressor = state["compressor"]
+            data = compressor.compress(body)
+            if not more:
+                data += compressor.flush()
+            if data or not more:
+                await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
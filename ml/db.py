@@ -0,0 +1,34 @@
+"""SQLite connection helpers shared by the ML service."""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "foodgene.db"
+
+_local = threading.local()
+
+
+def get_db_path() -> str:
+    """Return the SQLite database path (override with FOODGENE_DB_PATH)."""
+    return os.getenv("FOODGENE_DB_PATH", str(DEFAULT_DB_PATH))
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return a per-thread connection to the FoodGene database.
+
+    Connections are opened in WAL mode so readers never block the writer,
+    and are reused for the lifetime of the thread.
+    """
+    path = get_db_path()
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == path:
+        return conn
+
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+    _local.path = path
+    return conn
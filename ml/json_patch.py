@@ -0,0 +1,154 @@
+"""Minimal JSON Patch (RFC 6902) diff and apply for plan revisions.
+
+``diff`` produces ``add``/``remove``/``replace`` operations. Lists are
+compared after stripping their common prefix and suffix, so replacing one
+meal or adding a grocery item touches only that element. When the
+operations for a changed object or list would be larger than the new value
+itself, a single ``replace`` of the whole value is emitted instead.
+"""
+from typing import Any, Dict, List
+
+from serialization import dumps
+
+Operation = Dict[str, Any]
+
+
+class PatchError(ValueError):
+    """Raised when a patch does not apply to a document."""
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _pointer(parent: str, token: Any) -> str:
+    return f"{parent}/{_escape(str(token))}"
+
+
+def _diff_dict(old: Dict[str, Any], new: Dict[str, Any], path: str, ops: List[Operation]) -> None:
+    for key in old:
+        if key not in new:
+            ops.append({"op": "remove", "path": _pointer(path, key)})
+    for key, value in new.items():
+        if key not in old:
+            ops.append({"op": "add", "path": _pointer(path, key), "value": value})
+        else:
+            _diff(old[key], value, _pointer(path, key), ops)
+
+
+def _diff_list(old: List[Any], new: List[Any], path: str, ops: List[Operation]) -> None:
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+
+    common = min(old_end, new_end) - start
+    for offset in range(common):
+        _diff(old[start + offset], new[start + offset], _pointer(path, start + offset), ops)
+    # Remove from the end so earlier indices stay valid
+    for index in range(old_end - 1, start + common - 1, -1):
+        ops.append({"op": "remove", "path": _pointer(path, index)})
+    for index in range(start + common, new_end):
+        ops.append({"op": "add", "path": _pointer(path, index), "value": new[index]})
+
+
+def _diff(old: Any, new: Any, path: str, ops: List[Operation]) -> None:
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        nested: List[Operation] = []
+        _diff_dict(old, new, path, nested)
+    elif isinstance(old, list) and isinstance(new, list):
+        nested = []
+        _diff_list(old, new, path, nested)
+    else:
+        ops.append({"op": "replace", "path": path, "value": new})
+        return
+    replace = {"op": "replace", "path": path, "value": new}
+    if path and len(dumps(nested)) >= len(dumps([replace])):
+        ops.append(replace)
+    else:
+        ops.extend(nested)
+
+
+def diff(old: Any, new: Any) -> List[Operation]:
+    """Return the operations that turn old into new."""
+    ops: List[Operation] = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def _resolve(doc: Any, path: str):
+    """Return (container, last token) for a pointer."""
+    if not path.startswith("/"):
+        raise PatchError(f"Invalid pointer {path!r}")
+    tokens = [_unescape(t) for t in path[1:].split("/")]
+    container = doc
+    try:
+        for token in tokens[:-1]:
+            container = container[int(token)] if isinstance(container, list) else container[token]
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise PatchError(f"Path {path!r} does not exist")
+    return container, tokens[-1]
+
+
+def _index(container: List[Any], token: str, path: str, insert: bool = False) -> int:
+    if insert and token == "-":
+        return len(container)
+    try:
+        index = int(token)
+    except ValueError:
+        raise PatchError(f"Invalid list index in {path!r}")
+    if not 0 <= index <= len(container) - (0 if insert else 1):
+        raise PatchError(f"List index out of range in {path!r}")
+    return index
+
+
+def apply(doc: Any, ops: List[Operation]) -> Any:
+    """Apply operations to doc in place and return the result.
+
+    A replace of the root ("" path) returns the new value.
+
+    Raises:
+        PatchError: If an operation's path does not exist or is invalid
+    """
+    for op in ops:
+        kind, path = op.get("op"), op.get("path", "")
+        if path == "":
+            if kind not in ("add", "replace"):
+                raise PatchError(f"Cannot {kind} the document root")
+            doc = op["value"]
+            continue
+        container, token = _resolve(doc, path)
+        if isinstance(container, list):
+            if kind == "add":
+                container.insert(_index(container, token, path, insert=True), op["value"])
+            elif kind == "remove":
+                del container[_index(container, token, path)]
+            elif kind == "replace":
+                container[_index(container, token, path)] = op["value"]
+            else:
+                raise PatchError(f"Unsupported operation {kind!r}")
+        elif isinstance(container, dict):
+            if kind == "add":
+                container[token] = op["value"]
+            elif kind in ("remove", "replace"):
+                if token not in container:
+                    raise PatchError(f"Path {path!r} does not exist")
+                if kind == "remove":
+                    del container[token]
+                else:
+                    container[token] = op["value"]
+            else:
+                raise PatchError(f"Unsupported operation {kind!r}")
+        else:
+            raise PatchError(f"Path {path!r} does not exist")
+    return doc
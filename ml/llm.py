@@ -2,8 +2,16 @@
 import os
 import json
 import re
+import time
 import logging
 
+from circuit_breaker import CircuitBreaker
+from metrics import LLM_RESULTS, STAGE_SECONDS, timed
+from models import plan_engine
+from models.grocery import build_grocery_list
+from models.meal_index import ALTERNATIVE_MEALS, get_index
+from prompts import plan_prompt, swap_prompt, token_meter
+
 try:
     from openai import OpenAI
 except ImportError:
@@ -11,7 +19,33 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Requests fail fast instead of waiting out the SDK's 10 minute default
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+
+llm_breaker = CircuitBreaker.from_env("openai", "LLM_BREAKER")
+
+
+def _client(api_key: str):
+    return OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+
+
+def _complete(client, call: str, prompt: str, max_tokens: int) -> str:
+    """Run a chat completion and record its token usage and latency."""
+    started = time.monotonic()
+    with STAGE_SECONDS.time(stage=f"llm_{call}"):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.25,
+            max_tokens=max_tokens
+        )
+    text = response.choices[0].message.content.strip()
+    token_meter.record(call, prompt, text, time.monotonic() - started, getattr(response, "usage", None))
+    return text
+
 
+@timed("extract_json")
 def _extract_json(text: str):
     """Robust JSON extraction from LLM response.
     
@@ -32,83 +66,36 @@ def _extract_json(text: str):
 
 
 def _get_demo_plan(calories: int, macros: dict, profile: dict) -> dict:
-    """Return a demo meal plan when API key is not available."""
-    diet_pref = profile.get('diet_pref', 'balanced').lower()
-    
-    # Demo meals based on diet preference
-    demo_meals = {
-        'vegetarian': {
-            'breakfast': [
-                {'name': 'Oatmeal with Berries', 'serving': '1 cup', 'cal': 350, 'protein_g': 12, 'carbs_g': 60, 'fat_g': 8},
-                {'name': 'Egg Scramble with Toast', 'serving': '2 eggs', 'cal': 320, 'protein_g': 18, 'carbs_g': 40, 'fat_g': 10}
-            ],
-            'lunch': [
-                {'name': 'Chickpea Buddha Bowl', 'serving': '350g', 'cal': 480, 'protein_g': 18, 'carbs_g': 65, 'fat_g': 15},
-                {'name': 'Lentil Soup', 'serving': '500ml', 'cal': 320, 'protein_g': 15, 'carbs_g': 50, 'fat_g': 5}
-            ],
-            'dinner': [
-                {'name': 'Tofu Stir Fry', 'serving': '400g', 'cal': 420, 'protein_g': 25, 'carbs_g': 45, 'fat_g': 18},
-                {'name': 'Vegetable Risotto', 'serving': '300g', 'cal': 380, 'protein_g': 12, 'carbs_g': 65, 'fat_g': 10}
-            ]
-        },
-        'balanced': {
-            'breakfast': [
-                {'name': 'Grilled Chicken Eggs', 'serving': '150g', 'cal': 380, 'protein_g': 35, 'carbs_g': 30, 'fat_g': 12},
-                {'name': 'Salmon Toast', 'serving': '150g', 'cal': 420, 'protein_g': 30, 'carbs_g': 35, 'fat_g': 15}
-            ],
-            'lunch': [
-                {'name': 'Grilled Chicken Breast', 'serving': '150g', 'cal': 280, 'protein_g': 40, 'carbs_g': 35, 'fat_g': 8},
-                {'name': 'Lean Beef Burger', 'serving': '180g', 'cal': 350, 'protein_g': 38, 'carbs_g': 30, 'fat_g': 12}
-            ],
-            'dinner': [
-                {'name': 'Salmon Fillet', 'serving': '180g', 'cal': 400, 'protein_g': 45, 'carbs_g': 25, 'fat_g': 18},
-                {'name': 'Turkey Meatballs', 'serving': '200g', 'cal': 350, 'protein_g': 42, 'carbs_g': 20, 'fat_g': 14}
-            ]
-        },
-        'keto': {
-            'breakfast': [
-                {'name': 'Bacon & Eggs', 'serving': '3 eggs + 4 strips', 'cal': 420, 'protein_g': 30, 'carbs_g': 5, 'fat_g': 32},
-                {'name': 'Avocado & Salmon', 'serving': '150g', 'cal': 450, 'protein_g': 28, 'carbs_g': 8, 'fat_g': 35}
-            ],
-            'lunch': [
-                {'name': 'Steak with Butter', 'serving': '200g', 'cal': 480, 'protein_g': 45, 'carbs_g': 0, 'fat_g': 35},
-                {'name': 'Cheese & Nuts', 'serving': '200g', 'cal': 420, 'protein_g': 20, 'carbs_g': 10, 'fat_g': 32}
-            ],
-            'dinner': [
-                {'name': 'Ribeye Steak', 'serving': '220g', 'cal': 520, 'protein_g': 50, 'carbs_g': 0, 'fat_g': 38},
-                {'name': 'Cod with Olive Oil', 'serving': '180g', 'cal': 380, 'protein_g': 40, 'carbs_g': 5, 'fat_g': 22}
-            ]
-        }
-    }
-    
-    meals_choice = demo_meals.get(diet_pref, demo_meals['balanced'])
-    
-    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    plan_days = []
-    
-    for day in days:
-        day_meals = [
-            meals_choice['breakfast'][0] if day != 'Wed' else meals_choice['breakfast'][1],
-            meals_choice['lunch'][0] if day != 'Thu' else meals_choice['lunch'][1],
-            meals_choice['dinner'][0] if day != 'Sat' else meals_choice['dinner'][1]
-        ]
-        plan_days.append({'day': day, 'meals': day_meals})
-    
-    grocery_list = [
-        {'item': 'Chicken Breast', 'quantity': '1.5 kg'},
-        {'item': 'Salmon', 'quantity': '1 kg'},
-        {'item': 'Eggs', 'quantity': '2 dozen'},
-        {'item': 'Broccoli', 'quantity': '1 kg'},
-        {'item': 'Rice', 'quantity': '1 kg'},
-        {'item': 'Olive Oil', 'quantity': '500ml'},
-        {'item': 'Tomatoes', 'quantity': '1 kg'},
-        {'item': 'Spinach', 'quantity': '500g'},
-    ]
-    
-    return {
-        'days': plan_days,
-        'grocery_list': grocery_list
-    }
+    """Return a demo meal plan when API key is not available.
+
+    Served by the offline plan engine, which honours the calorie and macro
+    targets and allergies using precomputed templates (NoSafeMealError if no
+    meal avoids the allergies).
+    """
+    return plan_engine.generate_plan(calories, macros, profile)
+
+
+def _get_demo_meal(plan_json: dict, day: str, meal_index: int, profile: dict) -> dict:
+    """Return the closest-macro local alternative for a meal in the plan.
+
+    Falls back to cycling the demo alternatives when the meal can't be found.
+
+    Raises:
+        plan_engine.NoSafeMealError: If no alternative avoids the allergies
+    """
+    day_meals = next((d.get('meals', []) for d in plan_json.get('days', []) if d.get('day') == day), [])
+    if 0 <= meal_index < len(day_meals):
+        swaps = get_index().suggest_swaps(
+            day_meals[meal_index], profile, k=1, exclude=[m.get('name', '') for m in day_meals]
+        )
+        if swaps:
+            return swaps[0]
+
+    allergies = plan_engine.normalize_allergies(profile.get('allergies', []))
+    options = [m for m in ALTERNATIVE_MEALS if plan_engine.is_safe(m, allergies)]
+    if not options:
+        raise plan_engine.NoSafeMealError(f"No alternative meal avoids {', '.join(sorted(allergies))}")
+    return options[meal_index % len(options)]
 
 
 def call_llm_for_plan(calories: int, macros: dict, profile: dict) -> dict:
@@ -126,8 +113,10 @@ def call_llm_for_plan(calories: int, macros: dict, profile: dict) -> dict:
             {"day":"Mon","meals":[{"name":"","serving":"","cal":0,"protein_g":0,"carbs_g":0,"fat_g":0}]},
             ...
           ],
-          "grocery_list":[{"item":"","quantity":""}]
+          "grocery_list":[{"item":"","quantity":"","amount":0,"unit":""}]
         }
+        The grocery list is aggregated locally from the meals rather than
+        generated by the model.
     
     Raises:
         ValueError: If OpenAI API fails or response is malformed
@@ -141,38 +130,11 @@ def call_llm_for_plan(calories: int, macros: dict, profile: dict) -> dict:
         logger.warning("DEMO MODE: No OpenAI API key set. Returning demo meal plan.")
         return _get_demo_plan(calories, macros, profile)
     
-    client = OpenAI(api_key=api_key)
+    client = _client(api_key)
     
-    prompt = f"""You are a professional dietitian. Produce a 7-day meal plan for one adult.
-Constraints:
-- daily calories target: {calories}
-- macros per day: protein {macros.get('protein_g', 150)} g, fat {macros.get('fat_g', 65)} g, carbs {macros.get('carbs_g', 250)} g
-- preference: {profile.get('diet_pref', 'balanced')}
-- allergies: {', '.join(profile.get('allergies', [])) if profile.get('allergies') else 'none'}
-
-Output ONLY valid JSON matching this structure, no other text:
-{{
-  "days": [
-    {{"day": "Mon", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}},
-    {{"day": "Tue", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}},
-    {{"day": "Wed", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}},
-    {{"day": "Thu", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}},
-    {{"day": "Fri", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}},
-    {{"day": "Sat", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}},
-    {{"day": "Sun", "meals": [{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}]}}
-  ],
-  "grocery_list": [{{"item": "", "quantity": ""}}]
-}}
-Be concise. Return JSON only."""
-
+    prompt = plan_prompt(calories, macros, profile)
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.25,
-            max_tokens=2000
-        )
-        text = response.choices[0].message.content.strip()
+        text = _complete(client, "plan", prompt, max_tokens=2000)
     except Exception as e:
         logger.exception(f"OpenAI API call failed: {e}")
         raise ValueError(f"OpenAI API error: {str(e)}")
@@ -184,12 +146,13 @@ Be concise. Return JSON only."""
         raise ValueError("LLM produced invalid JSON for meal plan")
     
     # Validate structure
-    if "days" not in plan or "grocery_list" not in plan:
-        raise ValueError("LLM JSON missing required keys: 'days' and 'grocery_list'")
+    if "days" not in plan:
+        raise ValueError("LLM JSON missing required key: 'days'")
     
     if not isinstance(plan["days"], list) or len(plan["days"]) == 0:
         raise ValueError("'days' must be a non-empty list")
     
+    plan["grocery_list"] = build_grocery_list(plan)
     return plan
 
 
@@ -217,42 +180,13 @@ def call_llm_for_single_meal(plan_json: dict, day: str, meal_index: int, calorie
     if not api_key:
         # DEMO MODE: Return alternative meal without API key
         logger.warning("DEMO MODE: No OpenAI API key set. Returning demo alternative meal.")
-        alternative_meals = [
-            {'name': 'Baked Tilapia', 'serving': '180g', 'cal': 280, 'protein_g': 38, 'carbs_g': 15, 'fat_g': 8},
-            {'name': 'Turkey Meatballs', 'serving': '200g', 'cal': 350, 'protein_g': 42, 'carbs_g': 20, 'fat_g': 14},
-            {'name': 'Grilled Vegetables & Tofu', 'serving': '350g', 'cal': 320, 'protein_g': 22, 'carbs_g': 45, 'fat_g': 12},
-            {'name': 'Mushroom Pasta', 'serving': '300g', 'cal': 380, 'protein_g': 15, 'carbs_g': 60, 'fat_g': 10},
-            {'name': 'Quinoa Buddha Bowl', 'serving': '350g', 'cal': 420, 'protein_g': 18, 'carbs_g': 65, 'fat_g': 12},
-            {'name': 'Shrimp Stir Fry', 'serving': '280g', 'cal': 310, 'protein_g': 35, 'carbs_g': 25, 'fat_g': 10},
-        ]
-        return alternative_meals[meal_index % len(alternative_meals)]
-    
-    client = OpenAI(api_key=api_key)
+        return _get_demo_meal(plan_json, day, meal_index, profile)
     
-    # Truncate plan summary to avoid token limits
-    plan_summary = json.dumps(plan_json)[:1500]
+    client = _client(api_key)
     
-    prompt = f"""You are a professional dietitian. Given the following meal plan, replace the meal at day '{day}', meal index {meal_index} with a single alternative meal.
-
-Plan (truncated): {plan_summary}
-
-Constraints:
-- daily calories: {calories}
-- macros: protein {macros.get('protein_g', 150)}g, fat {macros.get('fat_g', 65)}g, carbs {macros.get('carbs_g', 250)}g
-- diet preference: {profile.get('diet_pref', 'balanced')}
-- allergies: {', '.join(profile.get('allergies', [])) if profile.get('allergies') else 'none'}
-
-Return ONLY valid JSON of the single meal, no other text:
-{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}"""
-
+    prompt = swap_prompt(plan_json, day, meal_index, calories, macros, profile)
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.25,
-            max_tokens=500
-        )
-        text = response.choices[0].message.content.strip()
+        text = _complete(client, "swap", prompt, max_tokens=500)
     except Exception as e:
         logger.exception(f"OpenAI API call for meal swap failed: {e}")
         raise ValueError(f"OpenAI API error: {str(e)}")
@@ -269,44 +203,74 @@ Return ONLY valid JSON of the single meal, no other text:
         missing = required - set(meal.keys())
         raise ValueError(f"Returned meal missing keys: {missing}")
     
-    # Truncate plan summary to avoid token limits
-    plan_summary = json.dumps(plan_json)[:1500]
-    
-    prompt = f"""You are a professional dietitian. Given the following meal plan, replace the meal at day '{day}', meal index {meal_index} with a single alternative meal.
+    return meal
 
-Plan (truncated): {plan_summary}
 
-Constraints:
-- daily calories: {calories}
-- macros: protein {macros.get('protein_g', 150)}g, fat {macros.get('fat_g', 65)}g, carbs {macros.get('carbs_g', 250)}g
-- diet preference: {profile.get('diet_pref', 'balanced')}
-- allergies: {', '.join(profile.get('allergies', [])) if profile.get('allergies') else 'none'}
+def _llm_available() -> bool:
+    return OpenAI is not None and bool(os.getenv("OPENAI_API_KEY"))
 
-Return ONLY valid JSON of the single meal, no other text:
-{{"name": "", "serving": "", "cal": 0, "protein_g": 0, "carbs_g": 0, "fat_g": 0}}"""
 
+def _call_with_breaker(fn, *args):
+    """Run an LLM call through the circuit breaker.
+
+    Returns the result, or None when the breaker is open or the call failed
+    (the failure is recorded so repeated errors open the breaker).
+    """
+    ticket = llm_breaker.allow()
+    if ticket is None:
+        return None
+    started = time.monotonic()
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.25,
-            max_tokens=500
-        )
-        text = response.choices[0].message.content.strip()
-    except Exception as e:
-        logger.exception(f"OpenAI API call for meal swap failed: {e}")
-        raise ValueError(f"OpenAI API error: {str(e)}")
-    
-    try:
-        meal = _extract_json(text)
+        result = fn(*args)
     except Exception as e:
-        logger.exception(f"Failed to parse LLM meal JSON: {e}")
-        raise ValueError("LLM produced invalid meal JSON")
-    
-    # Validate required keys
-    required = {"name", "serving", "cal", "protein_g", "carbs_g", "fat_g"}
-    if not required.issubset(set(meal.keys())):
-        missing = required - set(meal.keys())
-        raise ValueError(f"Returned meal missing keys: {missing}")
-    
-    return meal
+        llm_breaker.record(ticket, False, time.monotonic() - started)
+        logger.warning(f"LLM call failed, falling back to local generation: {e}")
+        return None
+    llm_breaker.record(ticket, True, time.monotonic() - started)
+    return result
+
+
+def generate_plan(calories: int, macros: dict, profile: dict) -> dict:
+    """Generate a 7-day plan, falling back to the local engine when the LLM is unhealthy.
+
+    Returns:
+        Dict with "plan" and "source": "ai" for an LLM plan, "demo" when no
+        API key is configured, or "fallback" when the circuit breaker is open
+        or the call failed. Fallback responses set "upgrade_available" so the
+        client can offer to regenerate with AI later.
+    """
+    if not _llm_available():
+        LLM_RESULTS.inc(operation="generate_plan", source="demo")
+        return {"plan": _get_demo_plan(calories, macros, profile), "source": "demo"}
+
+    plan = _call_with_breaker(call_llm_for_plan, calories, macros, profile)
+    if plan is not None:
+        LLM_RESULTS.inc(operation="generate_plan", source="ai")
+        return {"plan": plan, "source": "ai"}
+    LLM_RESULTS.inc(operation="generate_plan", source="fallback")
+    return {
+        "plan": _get_demo_plan(calories, macros, profile),
+        "source": "fallback",
+        "upgrade_available": True,
+    }
+
+
+def swap_meal(plan_json: dict, day: str, meal_index: int, calories: int, macros: dict, profile: dict) -> dict:
+    """Replace a single meal, falling back to a local alternative when the LLM is unhealthy.
+
+    Returns:
+        Dict with "meal" and "source" ("ai", "demo" or "fallback").
+
+    Raises:
+        plan_engine.NoSafeMealError: If the local fallback has no safe meal
+    """
+    if not _llm_available():
+        LLM_RESULTS.inc(operation="swap_meal", source="demo")
+        return {"meal": _get_demo_meal(plan_json, day, meal_index, profile), "source": "demo"}
+
+    meal = _call_with_breaker(call_llm_for_single_meal, plan_json, day, meal_index, calories, macros, profile)
+    if meal is not None:
+        LLM_RESULTS.inc(operation="swap_meal", source="ai")
+        return {"meal": meal, "source": "ai"}
+    LLM_RESULTS.inc(operation="swap_meal", source="fallback")
+    return {"meal": _get_demo_meal(plan_json, day, meal_index, profile), "source": "fallback", "upgrade_available": True}
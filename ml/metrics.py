@@ -0,0 +1,293 @@
+"""In-process metrics with Prometheus text exposition.
+
+Histograms and counters are plain Python objects guarded by a lock, cheap
+enough (a bisect and a few additions per observation) to leave on in
+production. ``render()`` produces the Prometheus text format served on
+``/metrics``.
+
+Instrument a function with one line:
+
+    @timed("db_get_plan")
+    def get_plan(plan_id): ...
+
+Metrics are per process: anything recorded inside the inference worker pool
+would stay in the worker's registry. The dispatcher therefore measures each
+model call in the worker, ships the duration back with the result and
+records it from the serving process.
+"""
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; spans in-memory stages (~0.1 ms) up to slow LLM calls (~30 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _header(self) -> List[str]:
+        name = f"{self.name}_total"
+        return [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {value:g}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        """Return the label sets observed so far."""
+        with self._lock:
+            keys = sorted(self._values)
+        return [dict(zip(self.labelnames, key)) for key in keys]
+
+    def snapshot(self, **labels) -> Dict[str, Any]:
+        """Return count, sum and estimated p50/p95/p99 (bucket upper bounds)."""
+        with self._lock:
+            row = list(self._values.get(self._key(labels), ()))
+        if not row:
+            return {"count": 0, "sum": 0.0, "p50": None, "p95": None, "p99": None}
+        counts, total = row[:-1], row[-1]
+        n = sum(counts)
+        out = {"count": n, "sum": total}
+        for pct in (50, 95, 99):
+            rank, seen = pct / 100 * n, 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                seen += count
+                if seen >= rank:
+                    out[f"p{pct}"] = bound
+                    break
+        return out
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(row)) for key, row in self._values.items())
+        lines = self._header()
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {row[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Named collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "foodgene_http_request_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "foodgene_stage_seconds", "Latency of internal processing stages", ("stage",),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "foodgene_cache_requests", "Cache lookups by cache and result (hit/miss)", ("cache", "result"),
+)
+LLM_RESULTS = REGISTRY.counter(
+    "foodgene_llm_results", "LLM-backed operations by where the result came from (ai/demo/fallback)",
+    ("operation", "source"),
+)
+
+
+def render() -> str:
+    """Render the default registry in Prometheus text format."""
+    return REGISTRY.render()
+
+
+def timed(stage: Optional[str] = None, histogram: Histogram = STAGE_SECONDS) -> Callable:
+    """Decorator recording a function's duration under ``stage`` (defaults to its name).
+
+    Works for both regular and ``async`` functions.
+    """
+    def decorator(fn: Callable) -> Callable:
+        label = stage or fn.__name__
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, stage=label)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, stage=label)
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request latency.
+
+    Requests are labelled by route template (``/predict/{task}``) rather than
+    raw path so label cardinality stays bounded; unmatched paths share one
+    label.
+    """
+
+    def __init__(self, app, histogram: Histogram = HTTP_REQUEST_SECONDS):
+        self.app = app
+        self.histogram = histogram
+        self._routes: Dict[Any, str] = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            routes = getattr(scope.get("app"), "routes", ())
+            for route in routes:
+                if getattr(route, "endpoint", None) is not None:
+                    self._routes.setdefault(route.endpoint, route.path)
+            path = self._routes.setdefault(endpoint, "unmatched")
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.histogram.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=self._route(scope), status=status["code"],
+            )
@@ -1,6 +1,6 @@
 """Diet plan generator ML stub model."""
 from typing import Dict, List, Any
-from ml.models.food_scanner import FOOD_NUTRITION_DB
+from .food_scanner import FOOD_NUTRITION_DB
 
 
 def generate(profile: Dict[str, Any], food_items: List[Dict[str, Any]], 
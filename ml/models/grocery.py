@@ -0,0 +1,154 @@
+"""Grocery list aggregation computed from a plan's meals.
+
+Each meal is decomposed into ingredients via ``RECIPES`` (quantities for the
+meal's base serving, scaled by the meal's calories relative to that base).
+Meals without a recipe are decomposed by ingredient keywords in their name,
+and as a last resort listed as a whole serving. Quantities are normalized to
+g / ml / pcs and summed across the week.
+
+List items carry their raw ``amount`` and ``unit`` next to the display
+``quantity``, so a single meal swap can update the list incrementally
+without re-reading the whole plan.
+"""
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+# meal name (lowercase) -> (base calories, [(ingredient, amount, unit)])
+RECIPES: Dict[str, Tuple[int, List[Tuple[str, float, str]]]] = {
+    "oatmeal with berries": (350, [("Rolled Oats", 80, "g"), ("Mixed Berries", 120, "g"), ("Honey", 15, "g")]),
+    "egg scramble with toast": (320, [("Eggs", 2, "pcs"), ("Whole Wheat Bread", 60, "g"), ("Butter", 5, "g")]),
+    "fruit & quinoa porridge": (340, [("Quinoa", 70, "g"), ("Bananas", 1, "pcs"), ("Mixed Berries", 80, "g")]),
+    "chickpea buddha bowl": (480, [("Chickpeas", 150, "g"), ("Brown Rice", 80, "g"), ("Spinach", 50, "g"), ("Tahini", 15, "g")]),
+    "lentil soup": (320, [("Red Lentils", 90, "g"), ("Carrots", 80, "g"), ("Onions", 50, "g"), ("Vegetable Stock", 400, "ml")]),
+    "tofu stir fry": (420, [("Tofu", 200, "g"), ("Mixed Vegetables", 150, "g"), ("Rice", 60, "g"), ("Soy Sauce", 15, "ml")]),
+    "vegetable risotto": (380, [("Arborio Rice", 80, "g"), ("Mixed Vegetables", 150, "g"), ("Parmesan", 20, "g"), ("Vegetable Stock", 300, "ml")]),
+    "black bean chili": (410, [("Black Beans", 200, "g"), ("Tomatoes", 150, "g"), ("Onions", 50, "g"), ("Bell Peppers", 80, "g")]),
+    "grilled chicken eggs": (380, [("Chicken Breast", 100, "g"), ("Eggs", 2, "pcs"), ("Spinach", 30, "g")]),
+    "salmon toast": (420, [("Salmon", 100, "g"), ("Whole Wheat Bread", 60, "g"), ("Avocados", 0.5, "pcs")]),
+    "turkey & sweet potato hash": (390, [("Ground Turkey", 120, "g"), ("Sweet Potatoes", 150, "g"), ("Onions", 40, "g")]),
+    "grilled chicken breast": (280, [("Chicken Breast", 150, "g"), ("Broccoli", 100, "g")]),
+    "lean beef burger": (350, [("Lean Ground Beef", 130, "g"), ("Burger Buns", 1, "pcs"), ("Lettuce", 20, "g"), ("Tomatoes", 40, "g")]),
+    "chicken & rice bowl": (450, [("Chicken Breast", 150, "g"), ("Rice", 80, "g"), ("Broccoli", 80, "g")]),
+    "salmon fillet": (400, [("Salmon", 180, "g"), ("Asparagus", 100, "g"), ("Olive Oil", 10, "ml")]),
+    "turkey meatballs": (350, [("Ground Turkey", 160, "g"), ("Eggs", 1, "pcs"), ("Breadcrumbs", 20, "g"), ("Tomato Sauce", 100, "ml")]),
+    "roast chicken & vegetables": (420, [("Chicken Breast", 180, "g"), ("Mixed Vegetables", 170, "g"), ("Olive Oil", 10, "ml")]),
+    "bacon & eggs": (420, [("Eggs", 3, "pcs"), ("Bacon", 60, "g")]),
+    "avocado & salmon": (450, [("Avocados", 1, "pcs"), ("Smoked Salmon", 100, "g")]),
+    "avocado & bacon plate": (430, [("Avocados", 1, "pcs"), ("Bacon", 80, "g"), ("Spinach", 50, "g")]),
+    "steak with butter": (480, [("Sirloin Steak", 200, "g"), ("Butter", 15, "g")]),
+    "cheese & nuts": (420, [("Cheddar Cheese", 60, "g"), ("Almonds", 40, "g")]),
+    "grilled chicken thighs & greens": (450, [("Chicken Thighs", 200, "g"), ("Mixed Greens", 80, "g"), ("Olive Oil", 15, "ml")]),
+    "ribeye steak": (520, [("Ribeye Steak", 220, "g")]),
+    "cod with olive oil": (380, [("Cod", 180, "g"), ("Olive Oil", 15, "ml"), ("Zucchini", 100, "g")]),
+    "herb roast chicken": (480, [("Chicken Breast", 250, "g"), ("Fresh Herbs", 10, "g")]),
+    "baked tilapia": (280, [("Tilapia", 180, "g"), ("Lemons", 0.5, "pcs")]),
+    "grilled vegetables & tofu": (320, [("Tofu", 150, "g"), ("Mixed Vegetables", 200, "g")]),
+    "mushroom pasta": (380, [("Pasta", 90, "g"), ("Mushrooms", 150, "g"), ("Olive Oil", 10, "ml")]),
+    "quinoa buddha bowl": (420, [("Quinoa", 80, "g"), ("Chickpeas", 100, "g"), ("Spinach", 50, "g")]),
+    "shrimp stir fry": (310, [("Shrimp", 180, "g"), ("Mixed Vegetables", 100, "g"), ("Soy Sauce", 10, "ml")]),
+}
+
+# Name keyword -> ingredient, for meals without a recipe (e.g. LLM plans)
+KEYWORD_INGREDIENTS = {
+    "chicken": "Chicken Breast", "turkey": "Ground Turkey", "beef": "Lean Ground Beef",
+    "steak": "Sirloin Steak", "salmon": "Salmon", "cod": "Cod", "tuna": "Tuna",
+    "shrimp": "Shrimp", "egg": "Eggs", "tofu": "Tofu", "lentil": "Red Lentils",
+    "chickpea": "Chickpeas", "bean": "Black Beans", "rice": "Rice", "quinoa": "Quinoa",
+    "oat": "Rolled Oats", "pasta": "Pasta", "potato": "Potatoes", "broccoli": "Broccoli",
+    "spinach": "Spinach", "tomato": "Tomatoes", "avocado": "Avocados", "yogurt": "Greek Yogurt",
+    "cheese": "Cheddar Cheese", "bread": "Whole Wheat Bread", "toast": "Whole Wheat Bread",
+    "apple": "Apples", "banana": "Bananas", "berr": "Mixed Berries", "milk": "Milk",
+    "vegetable": "Mixed Vegetables", "salad": "Mixed Greens", "mushroom": "Mushrooms",
+}
+# Grams per piece when a keyword ingredient is counted rather than weighed
+PIECE_GRAMS = {"Eggs": 50, "Avocados": 150, "Bananas": 120, "Apples": 180}
+
+_GRAMS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(kg|g|ml|l)\b", re.IGNORECASE)
+
+Totals = Dict[Tuple[str, str], float]
+
+
+def _serving_grams(meal: Dict[str, Any]) -> float:
+    match = _GRAMS_RE.search(str(meal.get("serving", "")))
+    if match:
+        value, unit = float(match.group(1)), match.group(2).lower()
+        return value * 1000 if unit in ("kg", "l") else value
+    # Rough energy density of a mixed meal when the serving isn't weighed
+    return float(meal.get("cal") or 300) / 1.5
+
+
+def meal_ingredients(meal: Dict[str, Any]) -> List[Tuple[str, float, str]]:
+    """Decompose a meal into (ingredient, amount, unit) for its actual serving."""
+    name = str(meal.get("name", "")).strip()
+    recipe = RECIPES.get(name.lower())
+    if recipe is not None:
+        base_cal, ingredients = recipe
+        factor = float(meal.get("cal") or base_cal) / base_cal
+        return [(item, amount * factor, unit) for item, amount, unit in ingredients]
+
+    lowered = name.lower()
+    matched = []
+    for keyword, item in KEYWORD_INGREDIENTS.items():
+        if keyword in lowered and item not in matched:
+            matched.append(item)
+    if not matched:
+        return [(name or "Meal", 1.0, "serving")]
+
+    share = _serving_grams(meal) / len(matched)
+    return [
+        (item, share / PIECE_GRAMS[item], "pcs") if item in PIECE_GRAMS else (item, share, "g")
+        for item in matched
+    ]
+
+
+def _add(totals: Totals, meals: Iterable[Dict[str, Any]], sign: float = 1.0) -> None:
+    for meal in meals:
+        for item, amount, unit in meal_ingredients(meal):
+            totals[(item, unit)] += sign * amount
+
+
+def format_quantity(amount: float, unit: str) -> str:
+    """Render an amount for display, e.g. (1500, 'g') -> '1.5 kg'."""
+    if unit in ("g", "ml"):
+        if amount >= 1000:
+            big = math.ceil(amount / 100) / 10
+            return f"{big:g} {'kg' if unit == 'g' else 'L'}"
+        return f"{max(10, math.ceil(amount / 10) * 10)}{unit}"
+    count = math.ceil(amount - 1e-9)
+    if unit == "serving":
+        return f"{count} serving{'s' if count != 1 else ''}"
+    return f"{count} {unit}"
+
+
+def _to_list(totals: Totals) -> List[Dict[str, Any]]:
+    return [
+        {"item": item, "quantity": format_quantity(amount, unit),
+         "amount": round(amount, 2), "unit": unit}
+        for (item, unit), amount in sorted(totals.items())
+        if amount > 1e-6
+    ]
+
+
+def build_grocery_list(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aggregate the grocery list for every meal in the plan."""
+    totals: Totals = defaultdict(float)
+    _add(totals, (m for day in plan.get("days", []) for m in day.get("meals", [])))
+    return _to_list(totals)
+
+
+def apply_swap(grocery_list: List[Dict[str, Any]], old_meal: Dict[str, Any],
+               new_meal: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Update a computed grocery list for one replaced meal.
+
+    Only the two meals are decomposed; the rest of the list is carried over
+    from its stored amounts.
+    """
+    totals: Totals = defaultdict(float)
+    for entry in grocery_list:
+        if "amount" in entry and "unit" in entry:
+            totals[(entry["item"], entry["unit"])] += float(entry["amount"])
+    _add(totals, [old_meal], sign=-1.0)
+    _add(totals, [new_meal])
+    return _to_list(totals)
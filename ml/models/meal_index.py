@@ -0,0 +1,322 @@
+"""Macro-vector nearest-neighbour index for local meal swaps.
+
+The catalogue is seeded from the offline plan engine's meal library, the demo
+alternative meals, single-food servings from ``FOOD_NUTRITION_DB`` and meals
+from previously generated plans in ``food_requests``. Meals are indexed by
+their (cal, protein_g, carbs_g, fat_g) vector, standardized per dimension, in
+one KD-tree per diet so a swap is a k-nearest-neighbour query filtered by
+allergens.
+
+Meals that arrive without allergen tags (e.g. from AI-generated plans) are
+tagged from their ingredient list when they have one. Meals tagged from the
+name alone are unverified and never offered to a user with allergies.
+"""
+import heapq
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .food_scanner import FOOD_NUTRITION_DB
+from .plan_engine import (MACRO_KEYS, MEAL_LIBRARY, normalize_allergies, is_safe,
+                          resolve_diet, scale_meal)
+
+logger = logging.getLogger(__name__)
+
+DIETS = tuple(MEAL_LIBRARY)
+
+ALTERNATIVE_MEALS = [
+    {'name': 'Baked Tilapia', 'serving': '180g', 'cal': 280, 'protein_g': 38, 'carbs_g': 15, 'fat_g': 8, 'allergens': ['fish']},
+    {'name': 'Turkey Meatballs', 'serving': '200g', 'cal': 350, 'protein_g': 42, 'carbs_g': 20, 'fat_g': 14, 'allergens': ['egg', 'gluten']},
+    {'name': 'Grilled Vegetables & Tofu', 'serving': '350g', 'cal': 320, 'protein_g': 22, 'carbs_g': 45, 'fat_g': 12, 'allergens': ['soy']},
+    {'name': 'Mushroom Pasta', 'serving': '300g', 'cal': 380, 'protein_g': 15, 'carbs_g': 60, 'fat_g': 10, 'allergens': ['gluten']},
+    {'name': 'Quinoa Buddha Bowl', 'serving': '350g', 'cal': 420, 'protein_g': 18, 'carbs_g': 65, 'fat_g': 12, 'allergens': []},
+    {'name': 'Shrimp Stir Fry', 'serving': '280g', 'cal': 310, 'protein_g': 35, 'carbs_g': 25, 'fat_g': 10, 'allergens': ['shellfish', 'soy']},
+]
+
+# Name and ingredient keywords used to tag meals that arrive without diet/allergen data
+MEAT_WORDS = ("chicken", "beef", "steak", "turkey", "bacon", "pork", "lamb", "ham",
+              "salmon", "cod", "tilapia", "tuna", "fish", "shrimp", "prawn", "ribeye", "burger")
+ALLERGEN_WORDS = {
+    "egg": ("egg", "omelet", "frittata"),
+    "dairy": ("cheese", "butter", "yogurt", "milk", "cream", "risotto", "paneer"),
+    "gluten": ("bread", "toast", "pasta", "burger", "wrap", "sandwich", "oat", "noodle"),
+    "fish": ("salmon", "cod", "tilapia", "tuna", "fish"),
+    "shellfish": ("shrimp", "prawn", "crab", "lobster"),
+    "nuts": ("nut", "almond", "peanut", "cashew"),
+    "soy": ("tofu", "soy", "tempeh", "edamame"),
+}
+
+# Max share of calories from carbs for a meal to count as keto
+KETO_CARB_SHARE = 0.15
+# Single-food catalogue entries are sized to roughly one meal
+FOOD_PORTION_CAL = 350
+
+
+def _ingredient_names(ingredients: Any) -> List[str]:
+    if not isinstance(ingredients, list):
+        return []
+    names = []
+    for item in ingredients:
+        if isinstance(item, dict):
+            item = item.get("name") or item.get("item")
+        if isinstance(item, str) and item.strip():
+            names.append(item)
+    return names
+
+
+def infer_allergens(name: str, ingredients: Sequence[str] = ()) -> Tuple[str, ...]:
+    lowered = " ".join([name, *ingredients]).lower()
+    return tuple(sorted(tag for tag, words in ALLERGEN_WORDS.items()
+                        if any(w in lowered for w in words)))
+
+
+def infer_diets(meal: Dict[str, Any]) -> Tuple[str, ...]:
+    """Return the diets a meal is compatible with, based on name and macros."""
+    name = meal["name"].lower()
+    diets = ["balanced"]
+    if not any(w in name for w in MEAT_WORDS):
+        diets.append("vegetarian")
+    cal = float(meal.get("cal") or 0)
+    if cal and float(meal.get("carbs_g") or 0) * 4 / cal <= KETO_CARB_SHARE:
+        diets.append("keto")
+    return tuple(diets)
+
+
+def _food_meals() -> List[Dict[str, Any]]:
+    meals = []
+    for label, per_100g in FOOD_NUTRITION_DB.items():
+        if not per_100g["cal"]:
+            continue
+        grams = min(400, round(FOOD_PORTION_CAL / per_100g["cal"] * 100 / 10) * 10)
+        factor = grams / 100
+        meals.append({
+            "name": label.capitalize(),
+            "serving": f"{grams}g",
+            "cal": int(round(per_100g["cal"] * factor)),
+            "protein_g": int(round(per_100g["protein"] * factor)),
+            "carbs_g": int(round(per_100g["carbs"] * factor)),
+            "fat_g": int(round(per_100g["fat"] * factor)),
+            # The name is the whole ingredient list
+            "allergens": infer_allergens(label),
+        })
+    return meals
+
+
+class KDTree:
+    """Static KD-tree over small fixed-dimension points."""
+
+    def __init__(self, points: Sequence[Sequence[float]]):
+        self.points = [tuple(p) for p in points]
+        self.dims = len(self.points[0]) if self.points else 0
+        # Node layout: (point_index, axis, left, right); -1 marks no child
+        self.nodes: List[Tuple[int, int, int, int]] = []
+        self.root = self._build(list(range(len(self.points))), 0)
+
+    def _build(self, indices: List[int], depth: int) -> int:
+        if not indices:
+            return -1
+        axis = depth % self.dims
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        node_id = len(self.nodes)
+        self.nodes.append((indices[mid], axis, -1, -1))
+        left = self._build(indices[:mid], depth + 1)
+        right = self._build(indices[mid + 1:], depth + 1)
+        self.nodes[node_id] = (indices[mid], axis, left, right)
+        return node_id
+
+    def query(self, target: Sequence[float], k: int, accept=None) -> List[Tuple[float, int]]:
+        """Return up to k (squared_distance, index) pairs nearest to target.
+
+        Points for which accept(index) is False are skipped, so filtering
+        happens during the search instead of over-fetching.
+        """
+        best: List[Tuple[float, int]] = []  # max-heap via negated distance
+        # Depth-first, pruning subtrees whose splitting plane is farther
+        # than the current k-th best
+        pending: List[Tuple[int, float]] = [(self.root, 0.0)] if self.root != -1 else []
+        while pending:
+            node_id, plane_dist = pending.pop()
+            if len(best) == k and plane_dist >= -best[0][0]:
+                continue
+            index, axis, left, right = self.nodes[node_id]
+            point = self.points[index]
+            dist = sum((a - b) ** 2 for a, b in zip(point, target))
+            if accept is None or accept(index):
+                if len(best) < k:
+                    heapq.heappush(best, (-dist, index))
+                elif dist < -best[0][0]:
+                    heapq.heapreplace(best, (-dist, index))
+            delta = target[axis] - point[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            if far != -1:
+                pending.append((far, delta * delta))
+            if near != -1:
+                pending.append((near, 0.0))
+        return sorted((-d, i) for d, i in best)
+
+
+class MealIndex:
+    """Catalogue of meals with a per-diet KD-tree over standardized macros."""
+
+    def __init__(self, load_history: bool = True):
+        self._lock = threading.Lock()
+        self._meals: Dict[str, Dict[str, Any]] = {}
+        self._trees: Dict[str, Tuple[KDTree, List[Dict[str, Any]]]] = {}
+        self._scale = (1.0,) * len(MACRO_KEYS)
+        self._dirty = True
+        self._history_loaded = not load_history
+
+        for diet, slots in MEAL_LIBRARY.items():
+            for meals in slots.values():
+                self.add_meals(meals, diets=(diet,))
+        self.add_meals(ALTERNATIVE_MEALS)
+        self.add_meals(_food_meals())
+
+    def add_meals(self, meals: Iterable[Dict[str, Any]], diets: Optional[Sequence[str]] = None,
+                  infer_vegetarian: bool = True) -> None:
+        """Add meals to the catalogue; duplicates (by name) extend their diet tags.
+
+        Args:
+            meals: Meal dicts with name and MACRO_KEYS
+            diets: Diets the meals are known to fit, in addition to inferred ones
+            infer_vegetarian: Whether a name without meat keywords is enough to
+                tag a meal vegetarian. Disabled for meals from non-vegetarian
+                plans, where names such as "Pad Thai" are ambiguous.
+        """
+        with self._lock:
+            for meal in meals:
+                if not all(k in meal for k in MACRO_KEYS) or not meal.get("name"):
+                    continue
+                key = meal["name"].strip().lower()
+                meal_diets = set(infer_diets(meal))
+                if not infer_vegetarian:
+                    meal_diets.discard("vegetarian")
+                meal_diets |= set(diets or ())
+                existing = self._meals.get(key)
+                if existing is not None:
+                    existing["diets"] = tuple(sorted(set(existing["diets"]) | meal_diets))
+                    continue
+                entry = {k: meal[k] for k in ("name", "serving", *MACRO_KEYS) if k in meal}
+                ingredients = _ingredient_names(meal.get("ingredients"))
+                if "allergens" in meal:
+                    entry["allergens"] = tuple(meal["allergens"] or ())
+                    entry["verified"] = True
+                else:
+                    entry["allergens"] = infer_allergens(meal["name"], ingredients)
+                    entry["verified"] = bool(ingredients)
+                entry["diets"] = tuple(sorted(meal_diets))
+                self._meals[key] = entry
+            self._dirty = True
+
+    def add_plan(self, plan: Dict[str, Any], diet: Optional[str] = None) -> None:
+        """Add every meal of a generated plan to the catalogue."""
+        meals = [m for day in plan.get("days", []) for m in day.get("meals", [])
+                 if isinstance(m, dict)]
+        self.add_meals(meals, diets=(diet,) if diet in DIETS else None,
+                       infer_vegetarian=diet == "vegetarian")
+
+    def load_history(self, limit: int = 5000) -> None:
+        """Seed the catalogue from plans stored in food_requests."""
+        from db import get_connection
+
+        try:
+            rows = get_connection().execute(
+                "SELECT generated_plan, constraints FROM food_requests "
+                "WHERE generated_plan IS NOT NULL ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        except Exception as e:
+            logger.warning(f"Could not load plan history into meal index: {e}")
+            rows = []
+        for row in rows:
+            try:
+                plan = json.loads(row["generated_plan"])
+                profile = json.loads(row["constraints"] or "{}").get("profile", {})
+            except (TypeError, ValueError):
+                continue
+            self.add_plan(plan, resolve_diet(profile))
+        self._history_loaded = True
+
+    def _vector(self, meal: Dict[str, Any]) -> Tuple[float, ...]:
+        return tuple(float(meal.get(k) or 0) / s for k, s in zip(MACRO_KEYS, self._scale))
+
+    def _rebuild(self) -> None:
+        meals = list(self._meals.values())
+        n = len(meals) or 1
+        scale = []
+        for k in MACRO_KEYS:
+            values = [float(m[k]) for m in meals]
+            mean = sum(values) / n
+            std = (sum((v - mean) ** 2 for v in values) / n) ** 0.5
+            scale.append(std or 1.0)
+        self._scale = tuple(scale)
+        self._trees = {}
+        for diet in DIETS:
+            members = [m for m in meals if diet in m["diets"]]
+            self._trees[diet] = (KDTree([self._vector(m) for m in members]), members)
+        self._dirty = False
+
+    def nearest(self, meal: Dict[str, Any], k: int = 3, diet: str = "balanced",
+                allergies: Iterable[str] = (), exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Return up to k catalogue meals closest in macros to the given meal.
+
+        Args:
+            meal: Reference meal with cal/protein_g/carbs_g/fat_g
+            k: Number of alternatives
+            diet: Diet preference the alternatives must fit
+            allergies: Allergies to avoid (free text, normalized internally);
+                with any allergies, unverified meals are skipped
+            exclude: Meal names to skip, e.g. the meal being replaced
+
+        Returns:
+            Meals (copies) ordered nearest first.
+        """
+        if not self._history_loaded:
+            self.load_history()
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            tree, members = self._trees.get(diet) or self._trees["balanced"]
+            target = self._vector(meal)
+
+        avoid = normalize_allergies(allergies)
+        skip = {name.strip().lower() for name in exclude}
+
+        def accept(i):
+            if members[i]["name"].lower() in skip:
+                return False
+            # A name alone can't rule out an allergen
+            return not avoid or (members[i]["verified"] and is_safe(members[i], avoid))
+
+        return [
+            {key: value for key, value in members[i].items() if key not in ("diets", "verified")}
+            for _, i in tree.query(target, k, accept)
+        ]
+
+    def suggest_swaps(self, meal: Dict[str, Any], profile: Dict[str, Any], k: int = 3,
+                      exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Return k alternatives for a meal, with portions scaled to its calories."""
+        options = self.nearest(meal, k=k, diet=resolve_diet(profile),
+                               allergies=profile.get("allergies", []),
+                               exclude=[meal.get("name", ""), *exclude])
+        target_cal = float(meal.get("cal") or 0)
+        swaps = []
+        for option in options:
+            factor = target_cal / option["cal"] if option["cal"] and target_cal else 1.0
+            swaps.append(dict(scale_meal(option, min(1.6, max(0.6, factor)))))
+        return swaps
+
+
+_index: Optional[MealIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> MealIndex:
+    """Return the process-wide meal index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MealIndex()
+    return _index
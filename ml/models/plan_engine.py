@@ -0,0 +1,306 @@
+"""Offline meal plan engine used when the LLM is unavailable.
+
+Plan templates for every diet preference are built once at import time from an
+immutable meal library. Allergen filtering is cached per (diet, allergens) and
+portion scaling and the grocery list per (diet, allergens, calories, macros),
+so a request only pays for a thin overlay of fresh day dicts around shared,
+read-only meal records. A meal containing one of the user's allergens is never
+served: when no option suits, generation fails with NoSafeMealError. The
+encoded JSON of each scaled plan is cached alongside it, so responses and
+storage of engine plans skip serialization.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from serialization import dumps
+
+from .grocery import build_grocery_list
+
+logger = logging.getLogger(__name__)
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+SLOTS = ("breakfast", "lunch", "dinner")
+DEFAULT_DIET = "balanced"
+
+# Day on which each slot rotates to its second option
+ROTATION_DAYS = {"breakfast": "Wed", "lunch": "Thu", "dinner": "Sat"}
+
+MACRO_KEYS = ("cal", "protein_g", "carbs_g", "fat_g")
+
+
+class FrozenDict(dict):
+    """Read-only dict shared between requests.
+
+    Subclassing dict keeps it JSON-serializable; mutation raises TypeError so
+    a caller cannot corrupt the cached templates.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Shared plan data is read-only; copy it before modifying")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+def _meal(name: str, serving: str, cal: int, protein_g: int, carbs_g: int, fat_g: int,
+          allergens: Iterable[str] = ()) -> FrozenDict:
+    return FrozenDict(name=name, serving=serving, cal=cal, protein_g=protein_g,
+                      carbs_g=carbs_g, fat_g=fat_g, allergens=tuple(sorted(allergens)))
+
+
+# Options per slot; the last entry of each slot has no tagged allergens.
+MEAL_LIBRARY: Dict[str, Dict[str, Tuple[FrozenDict, ...]]] = {
+    "vegetarian": {
+        "breakfast": (
+            _meal("Oatmeal with Berries", "1 cup", 350, 12, 60, 8, {"gluten"}),
+            _meal("Egg Scramble with Toast", "2 eggs", 320, 18, 40, 10, {"egg", "gluten", "dairy"}),
+            _meal("Fruit & Quinoa Porridge", "300g", 340, 10, 62, 6),
+        ),
+        "lunch": (
+            _meal("Chickpea Buddha Bowl", "350g", 480, 18, 65, 15, {"sesame"}),
+            _meal("Lentil Soup", "500ml", 320, 15, 50, 5),
+        ),
+        "dinner": (
+            _meal("Tofu Stir Fry", "400g", 420, 25, 45, 18, {"soy"}),
+            _meal("Vegetable Risotto", "300g", 380, 12, 65, 10, {"dairy"}),
+            _meal("Black Bean Chili", "400g", 410, 22, 60, 9),
+        ),
+    },
+    "balanced": {
+        "breakfast": (
+            _meal("Grilled Chicken Eggs", "150g", 380, 35, 30, 12, {"egg"}),
+            _meal("Salmon Toast", "150g", 420, 30, 35, 15, {"fish", "gluten"}),
+            _meal("Turkey & Sweet Potato Hash", "300g", 390, 30, 38, 12),
+        ),
+        "lunch": (
+            _meal("Grilled Chicken Breast", "150g", 280, 40, 35, 8),
+            _meal("Lean Beef Burger", "180g", 350, 38, 30, 12, {"gluten"}),
+            _meal("Chicken & Rice Bowl", "350g", 450, 38, 50, 10),
+        ),
+        "dinner": (
+            _meal("Salmon Fillet", "180g", 400, 45, 25, 18, {"fish"}),
+            _meal("Turkey Meatballs", "200g", 350, 42, 20, 14, {"egg", "gluten"}),
+            _meal("Roast Chicken & Vegetables", "350g", 420, 42, 30, 14),
+        ),
+    },
+    "keto": {
+        "breakfast": (
+            _meal("Bacon & Eggs", "3 eggs + 4 strips", 420, 30, 5, 32, {"egg"}),
+            _meal("Avocado & Salmon", "150g", 450, 28, 8, 35, {"fish"}),
+            _meal("Avocado & Bacon Plate", "200g", 430, 18, 8, 38),
+        ),
+        "lunch": (
+            _meal("Steak with Butter", "200g", 480, 45, 0, 35, {"dairy"}),
+            _meal("Cheese & Nuts", "200g", 420, 20, 10, 32, {"dairy", "nuts"}),
+            _meal("Grilled Chicken Thighs & Greens", "250g", 450, 40, 6, 30),
+        ),
+        "dinner": (
+            _meal("Ribeye Steak", "220g", 520, 50, 0, 38),
+            _meal("Cod with Olive Oil", "180g", 380, 40, 5, 22, {"fish"}),
+            _meal("Herb Roast Chicken", "250g", 480, 48, 2, 30),
+        ),
+    },
+}
+
+# Maps free-text allergy entries to the allergen tags used in MEAL_LIBRARY
+ALLERGEN_ALIASES = {
+    "peanut": "nuts", "peanuts": "nuts", "nut": "nuts", "tree nuts": "nuts", "almonds": "nuts",
+    "milk": "dairy", "lactose": "dairy", "cheese": "dairy", "butter": "dairy",
+    "eggs": "egg",
+    "salmon": "fish", "cod": "fish", "seafood": "fish",
+    "shrimp": "shellfish", "prawns": "shellfish",
+    "wheat": "gluten", "bread": "gluten", "celiac": "gluten",
+    "soya": "soy", "tofu": "soy",
+}
+
+# Diets whose meals also suit a diet, in order of preference, for substitutes
+# when none of the diet's own options for a slot avoid the user's allergens
+COMPATIBLE_DIETS = {
+    "vegetarian": ("vegetarian",),
+    "balanced": ("balanced", "vegetarian"),
+    "keto": ("keto",),
+}
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_allergies(allergies: Iterable[str]) -> FrozenSet[str]:
+    """Return canonical, lowercase allergy terms for cache keys and matching."""
+    terms = set()
+    for allergy in allergies or ():
+        term = str(allergy).strip().lower()
+        if term and term != "none":
+            terms.add(ALLERGEN_ALIASES.get(term, term))
+    return frozenset(terms)
+
+
+class NoSafeMealError(ValueError):
+    """Raised when no meal in the library suits a diet and avoids the user's allergens."""
+
+
+def is_safe(meal: Dict[str, Any], allergies: FrozenSet[str]) -> bool:
+    """Check a meal against canonical allergy terms (tags and name words)."""
+    if not allergies:
+        return True
+    if allergies.intersection(meal.get("allergens", ())):
+        return False
+    name = meal["name"].lower()
+    return not any(term in name for term in allergies)
+
+
+def resolve_diet(profile: Dict[str, Any]) -> str:
+    diet_pref = str(profile.get("diet_pref") or DEFAULT_DIET).lower()
+    return diet_pref if diet_pref in MEAL_LIBRARY else DEFAULT_DIET
+
+
+def scale_serving(serving: str, factor: float) -> str:
+    """Scale every quantity in a serving description, e.g. '150g' -> '180g'."""
+    def repl(match):
+        value = float(match.group()) * factor
+        if value >= 20:
+            return str(int(round(value / 5) * 5))
+        rounded = round(value * 2) / 2
+        return str(int(rounded)) if rounded == int(rounded) else str(rounded)
+    return _NUMBER_RE.sub(repl, serving) if abs(factor - 1) > 0.01 else serving
+
+
+def scale_meal(meal: Dict[str, Any], factor: float) -> FrozenDict:
+    """Return a copy of a meal with its serving and nutrition scaled by factor."""
+    scaled = dict(meal)
+    scaled["serving"] = scale_serving(meal["serving"], factor)
+    for key in MACRO_KEYS:
+        scaled[key] = int(round(meal[key] * factor))
+    return FrozenDict(scaled)
+
+
+def _safe_options(diet: str, slot: str, allergies: FrozenSet[str]) -> Tuple[FrozenDict, ...]:
+    """Options for a slot that avoid the allergens, borrowing from compatible diets and slots if needed.
+
+    Raises:
+        NoSafeMealError: If no meal of a compatible diet is safe
+    """
+    candidates = [MEAL_LIBRARY[source][slot] for source in COMPATIBLE_DIETS[diet]]
+    candidates += [MEAL_LIBRARY[source][other] for source in COMPATIBLE_DIETS[diet]
+                   for other in SLOTS if other != slot]
+    for meals in candidates:
+        safe = tuple(m for m in meals if is_safe(m, allergies))
+        if safe:
+            if meals is not MEAL_LIBRARY[diet][slot]:
+                logger.info("No %s option for %s avoids %s; substituting", slot, diet, sorted(allergies))
+            return safe
+    raise NoSafeMealError(f"No {slot} meal suits a {diet} diet and avoids {', '.join(sorted(allergies))}")
+
+
+@lru_cache(maxsize=4096)
+def _template(diet: str, allergies: FrozenSet[str]) -> Tuple[Tuple[FrozenDict, ...], ...]:
+    """Build the unscaled 7-day template for a diet with allergens removed.
+
+    Raises:
+        NoSafeMealError: If a slot has no safe option
+    """
+    options = {slot: _safe_options(diet, slot, allergies) for slot in SLOTS}
+
+    return tuple(
+        tuple(
+            options[slot][(1 if day == ROTATION_DAYS[slot] else 0) % len(options[slot])]
+            for slot in SLOTS
+        )
+        for day in DAYS
+    )
+
+
+def _macro_key(macros: Dict[str, Any]) -> Tuple[int, ...]:
+    """Round macro targets to whole grams (0 = not set) so they can key the caches."""
+    return tuple(int(round(float((macros or {}).get(k) or 0))) for k in MACRO_KEYS[1:])
+
+
+@lru_cache(maxsize=1024)
+def _scaled_plan(diet: str, allergies: FrozenSet[str], calories: int, macros: Tuple[int, ...] = ()):
+    """Scale each day of a template to the targets and aggregate its groceries.
+
+    Without macro targets every meal of a day gets the same calorie factor;
+    with them, per-meal factors are fitted (as plan_rescaler does) so the
+    day also lands as close to the macros as its meals allow.
+
+    Returns:
+        (days, grocery_list) as tuples of FrozenDict.
+    """
+    # Imported here: plan_rescaler builds on this module
+    from .plan_rescaler import fit_day
+
+    targets = {k: v for k, v in zip(MACRO_KEYS[1:], macros) if v}
+    days = []
+    for meals in _template(diet, allergies):
+        day_cal = sum(m["cal"] for m in meals)
+        factor = calories / day_cal if day_cal and calories else 1.0
+        if targets and calories:
+            factors, _ = fit_day(list(meals), {"cal": calories, **targets})
+        else:
+            factors = [factor] * len(meals)
+        days.append(tuple(scale_meal(m, f) for m, f in zip(meals, factors)))
+    grocery = build_grocery_list({"days": [{"meals": meals} for meals in days]})
+    return tuple(days), tuple(FrozenDict(item) for item in grocery)
+
+
+def generate_plan(calories: int, macros: Dict[str, Any], profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate a 7-day plan from the precomputed templates.
+
+    Args:
+        calories: Daily calorie target
+        macros: Daily 'protein_g', 'carbs_g', 'fat_g' targets; portions are
+            fitted to them within the limits of the template's meals
+        profile: Dict with 'diet_pref' and 'allergies'
+
+    Returns:
+        Dict with the same schema as call_llm_for_plan. Meal records and the
+        grocery list are shared and read-only; the day dicts and lists are
+        fresh per call, so callers may replace meals in place.
+
+    Raises:
+        NoSafeMealError: If the library has no meal for a slot that avoids
+            the allergies
+    """
+    diet = resolve_diet(profile)
+    allergies = normalize_allergies(profile.get("allergies", []))
+    days, grocery = _scaled_plan(diet, allergies, int(calories or 0), _macro_key(macros))
+    return {
+        "days": [{"day": day, "meals": list(meals)} for day, meals in zip(DAYS, days)],
+        "grocery_list": list(grocery),
+    }
+
+
+@lru_cache(maxsize=1024)
+def _plan_json(diet: str, allergies: FrozenSet[str], calories: int, macros: Tuple[int, ...] = ()) -> bytes:
+    days, grocery = _scaled_plan(diet, allergies, calories, macros)
+    return dumps({
+        "days": [{"day": day, "meals": meals} for day, meals in zip(DAYS, days)],
+        "grocery_list": grocery,
+    })
+
+
+def generate_plan_json(calories: int, profile: Dict[str, Any], macros: Optional[Dict[str, Any]] = None) -> bytes:
+    """Return the encoded JSON of the plan generate_plan builds for these inputs.
+
+    The bytes are cached, so repeated requests for the same diet, allergies
+    and targets are served without encoding the plan again.
+
+    Raises:
+        NoSafeMealError: As generate_plan
+    """
+    diet = resolve_diet(profile)
+    allergies = normalize_allergies(profile.get("allergies", []))
+    return _plan_json(diet, allergies, int(calories or 0), _macro_key(macros))
+
+
+def warm() -> None:
+    """Precompute the allergen-free template for every diet."""
+    for diet in MEAL_LIBRARY:
+        _template(diet, frozenset())
+
+
+warm()
@@ -0,0 +1,192 @@
+"""Local portion rescaling for existing meal plans.
+
+Changing the calorie target keeps the same meals and only changes how much of
+each is eaten. For every day we solve a small bounded least-squares problem
+for per-meal serving factors so that the day's calories and macros land on the
+new targets, and report whether the result is within tolerance so the caller
+can escalate to the LLM when the meals simply cannot fit.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from .plan_engine import scale_serving
+
+MACRO_KEYS = ("cal", "protein_g", "carbs_g", "fat_g")
+
+# Calories are what the user asked for; macros are matched as closely as
+# the meals allow
+WEIGHTS = {"cal": 50.0, "protein_g": 1.0, "carbs_g": 1.0, "fat_g": 1.0}
+
+# Relative error allowed per target before the plan needs regenerating
+TOLERANCE = {"cal": 0.05, "protein_g": 0.2, "carbs_g": 0.2, "fat_g": 0.2}
+# Extra error allowed on top of what the plan already had at its old targets
+BASELINE_SLACK = 0.05
+
+# Per-meal factors stay within this range of the uniform calorie scale and
+# are pulled towards it, so portions stay proportionate
+MIN_RATIO = 0.6
+MAX_RATIO = 1.6
+SMOOTHING = 0.2
+
+
+class RescaleError(ValueError):
+    """Raised when a plan cannot be rescaled to the targets within tolerance."""
+
+    def __init__(self, day: str, errors: Dict[str, float], message: Optional[str] = None):
+        if message is None:
+            worst = max(errors, key=errors.get)
+            message = f"{day}: {worst} off by {errors[worst]:.0%} after rescaling"
+        super().__init__(message)
+        self.day = day
+        self.errors = errors
+
+
+def _solve(matrix: List[List[float]], rhs: List[float]) -> List[float]:
+    """Solve a small dense linear system by Gaussian elimination with pivoting."""
+    n = len(rhs)
+    a = [row[:] + [rhs[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        if abs(a[col][col]) < 1e-12:
+            continue
+        for r in range(col + 1, n):
+            f = a[r][col] / a[col][col]
+            for c in range(col, n + 1):
+                a[r][c] -= f * a[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        if abs(a[r][r]) < 1e-12:
+            continue
+        x[r] = (a[r][n] - sum(a[r][c] * x[c] for c in range(r + 1, n))) / a[r][r]
+    return x
+
+
+def fit_day(meals: List[Dict[str, Any]], targets: Dict[str, float]) -> Tuple[List[float], Dict[str, float]]:
+    """Find per-meal serving factors that best hit the day's targets.
+
+    Minimizes the weighted relative squared error of calories and macros,
+    with factors bounded to [MIN_RATIO, MAX_RATIO] times the uniform scale
+    that alone would hit the calorie target. Bounds are handled with
+    a small active-set loop: meals that hit a bound are fixed there and the
+    rest are re-solved.
+
+    Args:
+        meals: The day's meals with cal/protein_g/carbs_g/fat_g
+        targets: Dict keyed by MACRO_KEYS with the day's targets
+
+    Returns:
+        (factors, relative_errors) where relative_errors is keyed by MACRO_KEYS.
+    """
+    keys = [k for k in MACRO_KEYS if targets.get(k)]
+    n = len(meals)
+    day_cal = sum(float(m.get("cal", 0)) for m in meals) or 1.0
+    uniform = targets.get("cal", day_cal) / day_cal
+    low, high = uniform * MIN_RATIO, uniform * MAX_RATIO
+    factors = [uniform] * n
+    fixed: Dict[int, float] = {}
+
+    for _ in range(n + 1):
+        free = [i for i in range(n) if i not in fixed]
+        if not free:
+            break
+        # Normal equations of sum_k w_k ((sum_i s_i v_ik - T_k) / T_k)^2
+        # + SMOOTHING * sum_i (s_i / uniform - 1)^2 over the free factors
+        ata = [[0.0] * len(free) for _ in free]
+        atb = [0.0] * len(free)
+        for k in keys:
+            t = float(targets[k])
+            w = WEIGHTS[k]
+            row = [float(meals[i].get(k, 0)) / t for i in free]
+            residual = 1.0 - sum(s * float(meals[i].get(k, 0)) / t for i, s in fixed.items())
+            for a, ra in enumerate(row):
+                atb[a] += w * ra * residual
+                for b, rb in enumerate(row):
+                    ata[a][b] += w * ra * rb
+        for a in range(len(free)):
+            ata[a][a] += SMOOTHING / uniform ** 2
+            atb[a] += SMOOTHING / uniform
+
+        solution = _solve(ata, atb)
+        out_of_bounds = False
+        for i, s in zip(free, solution):
+            if s < low or s > high:
+                fixed[i] = min(high, max(low, s))
+                out_of_bounds = True
+            else:
+                factors[i] = s
+        if not out_of_bounds:
+            break
+    for i, s in fixed.items():
+        factors[i] = s
+
+    errors = {}
+    for k in keys:
+        total = sum(s * float(m.get(k, 0)) for s, m in zip(factors, meals))
+        errors[k] = abs(total - targets[k]) / targets[k]
+    return factors, errors
+
+
+def _targets(calories: Optional[float], macros: Dict[str, Any]) -> Dict[str, float]:
+    targets = {"cal": calories, **{k: macros.get(k) for k in ("protein_g", "carbs_g", "fat_g")}}
+    return {k: float(v) for k, v in targets.items() if v}
+
+
+def _errors(meals: List[Dict[str, Any]], targets: Dict[str, float]) -> Dict[str, float]:
+    return {
+        k: abs(sum(float(m.get(k, 0)) for m in meals) - t) / t
+        for k, t in targets.items()
+    }
+
+
+def rescale_plan(plan: Dict[str, Any], calories: float, macros: Dict[str, Any],
+                 strict: bool = True, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Rescale every day of a plan to new calorie and macro targets.
+
+    Args:
+        plan: Plan dict with days[].meals[]
+        calories: New daily calorie target
+        macros: New daily 'protein_g', 'carbs_g', 'fat_g' targets (missing
+            keys are not fitted)
+        strict: Raise RescaleError when a day misses TOLERANCE
+        previous: The {"calories", "macros"} the plan was built for. A plan
+            that already missed a macro by more than TOLERANCE is only
+            rejected if rescaling makes that miss noticeably worse.
+
+    Returns:
+        A new plan dict (the input is not modified) with scaled servings and
+        nutrition. Extra top-level keys such as grocery_list are carried over.
+
+    Raises:
+        RescaleError: If a target is not positive, or if strict and a day
+            cannot be fitted within tolerance
+    """
+    if not calories or calories <= 0 or any(float(v) < 0 for v in macros.values() if v is not None):
+        raise RescaleError("targets", {}, f"Targets must be positive, got calories={calories} macros={macros}")
+    targets = _targets(calories, macros)
+    baseline = _targets(previous.get("calories"), previous.get("macros", {})) if previous else {}
+
+    days = []
+    for day in plan.get("days", []):
+        meals = day.get("meals", [])
+        if not meals:
+            days.append(dict(day))
+            continue
+        factors, errors = fit_day(meals, targets)
+        if strict:
+            allowed = dict(TOLERANCE)
+            for k, err in _errors(meals, baseline).items():
+                allowed[k] = max(allowed[k], err + BASELINE_SLACK)
+            if any(err > allowed[k] for k, err in errors.items()):
+                raise RescaleError(day.get("day", "?"), errors)
+
+        scaled = []
+        for meal, factor in zip(meals, factors):
+            new_meal = dict(meal)
+            new_meal["serving"] = scale_serving(str(meal.get("serving", "")), factor)
+            for k in MACRO_KEYS:
+                if k in meal:
+                    new_meal[k] = int(round(float(meal[k]) * factor))
+            scaled.append(new_meal)
+        days.append({**day, "meals": scaled})
+
+    return {**plan, "days": days}
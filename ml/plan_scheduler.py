@@ -0,0 +1,445 @@
+"""Off-peak pre-generation of next week's meal plans.
+
+Most users ask for their plan on Sunday evening or Monday morning, which
+puts all LLM latency and rate-limit pressure into a few hours. During
+off-peak windows (``PREGEN_WINDOW`` hours on ``PREGEN_DAYS``) the scheduler
+walks ``profiles`` with a completed questionnaire, generates next week's
+plan with ``call_llm_for_plan`` and stores it as a ready plan. LLM calls run
+under a global budget: at most ``PREGEN_CONCURRENCY`` at once and
+``PREGEN_RATE_PER_MINUTE`` per minute, and a pass stops early when the
+circuit breaker opens.
+
+``take_pregenerated`` hands the stored plan to ``/api/generate-plan`` for
+that user during the week, so peak-time requests become a database read (a
+local portion rescale when the requested calories differ from the profile).
+
+Users are claimed through a row in ``pregenerated_plans`` before their plan
+is generated, so several server workers (or a cron run) can run passes
+without generating a plan twice. The LLM budget is per process, though: with
+several workers, leave ``PREGEN_ENABLED`` off and run passes from cron.
+
+Run one pass by hand, ignoring the window:
+
+    python -m plan_scheduler --force
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import llm
+import plan_store
+from db import get_connection
+from metrics import CACHE_REQUESTS, LLM_RESULTS, STAGE_SECONDS
+from models import plan_engine
+from models.grocery import build_grocery_list
+from models.meal_index import get_index as get_meal_index
+from models.plan_rescaler import RescaleError, rescale_plan
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("PREGEN_ENABLED", "false").lower() in ("1", "true", "yes")
+WINDOW = os.getenv("PREGEN_WINDOW", "01:00-06:00")
+DAYS = os.getenv("PREGEN_DAYS", "Thu,Fri,Sat,Sun")
+CONCURRENCY = int(os.getenv("PREGEN_CONCURRENCY", "2"))
+RATE_PER_MINUTE = float(os.getenv("PREGEN_RATE_PER_MINUTE", "20"))
+CHECK_INTERVAL = float(os.getenv("PREGEN_CHECK_INTERVAL", "900"))
+MAX_ATTEMPTS = int(os.getenv("PREGEN_MAX_ATTEMPTS", "3"))
+# Claims older than this are assumed abandoned (worker restarted mid-call)
+CLAIM_TIMEOUT = timedelta(minutes=int(os.getenv("PREGEN_CLAIM_TIMEOUT_MINUTES", "30")))
+PAGE_SIZE = 100
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# Same factors as the dashboard's nutrition summary
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very active": 1.9,
+}
+
+PENDING, READY, FAILED, SERVED = "pending", "ready", "failed", "served"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id VARCHAR NOT NULL,
+    user_id VARCHAR,
+    name VARCHAR,
+    age INTEGER,
+    weight FLOAT,
+    height FLOAT,
+    activity_level VARCHAR,
+    dietary_preferences JSON,
+    allergies JSON,
+    medical_conditions JSON,
+    goals VARCHAR,
+    profile_complete BOOLEAN,
+    gamification_points INTEGER,
+    level INTEGER,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE TABLE IF NOT EXISTS pregenerated_plans (
+    user_id VARCHAR NOT NULL,
+    week_start DATE NOT NULL,
+    status VARCHAR NOT NULL,
+    plan_id VARCHAR,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_at DATETIME,
+    served_at DATETIME,
+    PRIMARY KEY (user_id, week_start)
+);
+"""
+
+_initialized = set()
+
+
+def _conn():
+    conn = get_connection()
+    if id(conn) not in _initialized:
+        conn.executescript(SCHEMA)
+        _initialized.add(id(conn))
+    return conn
+
+
+def parse_window(window: str) -> Tuple[int, int]:
+    """Parse "HH:MM-HH:MM" into minutes since midnight (the end may wrap past midnight)."""
+    start, end = (part.strip() for part in window.split("-", 1))
+
+    def minutes(value: str) -> int:
+        hours, _, mins = value.partition(":")
+        return int(hours) * 60 + int(mins or 0)
+
+    return minutes(start), minutes(end)
+
+
+def in_window(now: datetime, window: str = WINDOW, days: str = DAYS) -> bool:
+    """True if now falls inside the off-peak window on an enabled day."""
+    allowed = {d.strip().title()[:3] for d in days.split(",") if d.strip()}
+    start, end = parse_window(window)
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return WEEKDAYS[now.weekday()] in allowed and start <= minute < end
+    # Wrapping window: the part after midnight belongs to the previous day's window
+    if minute >= start:
+        return WEEKDAYS[now.weekday()] in allowed
+    return minute < end and WEEKDAYS[(now.weekday() - 1) % 7] in allowed
+
+
+def upcoming_week(today: date) -> date:
+    """The Monday after today: the week a pass generates plans for."""
+    return today + timedelta(days=7 - today.weekday())
+
+
+def serving_week(today: date) -> date:
+    """The week a plan request on this day is for.
+
+    From Saturday on, users are planning the week ahead; otherwise the
+    current week.
+    """
+    if today.weekday() >= 5:
+        return upcoming_week(today)
+    return today - timedelta(days=today.weekday())
+
+
+def _json_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            value = [v.strip() for v in value.split(",")]
+    if isinstance(value, str):
+        value = [value]
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def plan_inputs(profile: Dict[str, Any]) -> Tuple[int, Dict[str, float], Dict[str, Any]]:
+    """Derive (calories, macros, plan profile) from a profiles row.
+
+    Calories use Mifflin-St Jeor with the questionnaire's activity factor,
+    as the dashboard does; macros are a 25/50/25 protein/carbs/fat split.
+    """
+    weight = float(profile.get("weight") or 75)
+    height = float(profile.get("height") or 175)
+    age = float(profile.get("age") or 25)
+    factor = ACTIVITY_FACTORS.get(str(profile.get("activity_level") or "").strip().lower(), 1.55)
+    calories = int(round((10 * weight + 6.25 * height - 5 * age + 5) * factor / 50) * 50)
+    calories = max(1200, min(4000, calories))
+    macros = {
+        "protein_g": round(calories * 0.25 / 4),
+        "carbs_g": round(calories * 0.50 / 4),
+        "fat_g": round(calories * 0.25 / 9),
+    }
+    preferences = [p.lower() for p in _json_list(profile.get("dietary_preferences"))]
+    diet = next((p for p in preferences if p in plan_engine.MEAL_LIBRARY), plan_engine.DEFAULT_DIET)
+    return calories, macros, {"diet_pref": diet, "allergies": _json_list(profile.get("allergies"))}
+
+
+def _candidates(week: date, after: str, limit: int) -> List[Dict[str, Any]]:
+    """Completed profiles without a ready (or retry-exhausted) plan for the week."""
+    rows = _conn().execute(
+        "SELECT p.* FROM profiles p LEFT JOIN pregenerated_plans g "
+        "ON g.user_id = p.user_id AND g.week_start = ? "
+        "WHERE p.profile_complete AND p.user_id IS NOT NULL AND p.user_id > ? "
+        "AND (g.user_id IS NULL OR (g.status IN (?, ?) AND g.attempts < ?)) "
+        "ORDER BY p.user_id LIMIT ?",
+        (week.isoformat(), after, PENDING, FAILED, MAX_ATTEMPTS, limit),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _claim(user_id: str, week: date, now: datetime) -> bool:
+    """Take the user's slot for the week; False if another pass holds it."""
+    conn = _conn()
+    stale = (now - CLAIM_TIMEOUT).isoformat()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO pregenerated_plans (user_id, week_start, status, attempts, claimed_at) "
+            "VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT(user_id, week_start) DO UPDATE SET status = excluded.status, "
+            "attempts = attempts + 1, claimed_at = excluded.claimed_at "
+            "WHERE attempts < ? AND (status = ? OR (status = ? AND claimed_at < ?))",
+            (user_id, week.isoformat(), PENDING, now.isoformat(), MAX_ATTEMPTS, FAILED, PENDING, stale),
+        )
+        return cursor.rowcount > 0
+
+
+def _finish(user_id: str, week: date, status: str, plan_id: Optional[str] = None) -> None:
+    conn = _conn()
+    with conn:
+        conn.execute(
+            "UPDATE pregenerated_plans SET status = ?, plan_id = ? WHERE user_id = ? AND week_start = ?",
+            (status, plan_id, user_id, week.isoformat()),
+        )
+
+
+class RateLimiter:
+    """Space calls evenly so at most rate_per_minute start in any minute."""
+
+    def __init__(self, rate_per_minute: float):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class PlanPregenerator:
+    """Generate next week's plans for completed profiles under an LLM budget."""
+
+    def __init__(self, concurrency: int = CONCURRENCY, rate_per_minute: float = RATE_PER_MINUTE):
+        self.concurrency = max(1, concurrency)
+        self.rate_per_minute = rate_per_minute
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    async def _generate(self, profile: Dict[str, Any], week: date, limiter: RateLimiter,
+                        counts: Dict[str, int]) -> None:
+        user_id = profile["user_id"]
+        if not await asyncio.to_thread(_claim, user_id, week, datetime.now()):
+            counts["skipped"] += 1
+            return
+        calories, macros, plan_profile = plan_inputs(profile)
+        await limiter.wait()
+        with STAGE_SECONDS.time(stage="pregenerate_plan"):
+            plan = await asyncio.to_thread(llm._call_with_breaker, llm.call_llm_for_plan,
+                                           calories, macros, plan_profile)
+        if plan is None:
+            LLM_RESULTS.inc(operation="pregenerate_plan", source="fallback")
+            await asyncio.to_thread(_finish, user_id, week, FAILED)
+            counts["failed"] += 1
+            return
+        LLM_RESULTS.inc(operation="pregenerate_plan", source="ai")
+        get_meal_index().add_plan(plan, plan_profile["diet_pref"])
+        constraints = {"calories": calories, "macros": macros, "profile": plan_profile,
+                       "source": "ai", "pregenerated_for": week.isoformat()}
+        plan_id = await asyncio.to_thread(plan_store.save_plan, plan, constraints, user_id)
+        await asyncio.to_thread(_finish, user_id, week, READY, plan_id)
+        counts["generated"] += 1
+
+    async def run_once(self, today: Optional[date] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Generate plans for every eligible profile for the upcoming week.
+
+        Stops early when the LLM circuit breaker opens (remaining users are
+        picked up by the next pass) or after limit users.
+
+        Returns:
+            Counts of generated, failed and skipped users, and the week.
+        """
+        week = upcoming_week(today or date.today())
+        counts = {"generated": 0, "failed": 0, "skipped": 0}
+        if not llm._llm_available():
+            # Without the LLM the local engine is instant; nothing to pre-generate
+            return {"week_start": week.isoformat(), **counts, "stopped": "llm_unavailable"}
+
+        started = time.monotonic()
+        limiter = RateLimiter(self.rate_per_minute)
+        slots = asyncio.Semaphore(self.concurrency)
+        stopped = None
+        after, seen = "", 0
+
+        async def bounded(profile):
+            async with slots:
+                if llm.llm_breaker.state != "open":
+                    await self._generate(profile, week, limiter, counts)
+
+        while stopped is None:
+            page = await asyncio.to_thread(_candidates, week, after, PAGE_SIZE)
+            if not page:
+                break
+            if limit is not None:
+                page = page[:max(0, limit - seen)]
+            await asyncio.gather(*(bounded(profile) for profile in page))
+            seen += len(page)
+            after = page[-1]["user_id"] if page else after
+            if llm.llm_breaker.state == "open":
+                stopped = "circuit_open"
+            elif limit is not None and seen >= limit:
+                stopped = "limit"
+        self.last_run = {"week_start": week.isoformat(), **counts, "stopped": stopped,
+                         "seconds": round(time.monotonic() - started, 2)}
+        logger.info("Plan pre-generation pass: %s", self.last_run)
+        return self.last_run
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if in_window(datetime.now()):
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Plan pre-generation pass failed")
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    def start(self) -> None:
+        """Run passes in the background whenever the off-peak window is open."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _targets_differ(calories: float, macros: Dict[str, Any], constraints: Dict[str, Any]) -> bool:
+    """True if calories or any requested macro is more than 1% off the stored targets."""
+    stored = {"calories": constraints.get("calories"), **constraints.get("macros", {})}
+    for key, value in {"calories": calories, **macros}.items():
+        if value is None:
+            continue
+        if stored.get(key) is None or abs(value - stored[key]) > 0.01 * max(abs(value), 1):
+            return True
+    return False
+
+
+def take_pregenerated(user_id: str, calories: int, macros: Dict[str, Any],
+                      profile: Dict[str, Any], today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """Claim the user's ready plan for this week, adapted to the request.
+
+    The plan is only used when the request's diet and allergies match the
+    ones it was generated for; different calorie or macro targets are met
+    by rescaling portions locally, and a plan that can't be rescaled to
+    them within tolerance is not used. The plan is served once.
+
+    Args:
+        user_id: The authenticated user (never taken from the request body)
+
+    Returns:
+        {"plan_id", "plan", "constraints", "rescaled"} or None.
+    """
+    week = serving_week(today or date.today())
+    conn = _conn()
+    row = conn.execute(
+        "SELECT plan_id FROM pregenerated_plans WHERE user_id = ? AND week_start = ? AND status = ?",
+        (user_id, week.isoformat(), READY),
+    ).fetchone()
+    stored = plan_store.get_plan(row["plan_id"]) if row is not None else None
+    if stored is None:
+        CACHE_REQUESTS.inc(cache="pregenerated_plan", result="miss")
+        return None
+
+    plan, constraints = stored["plan"], stored["constraints"]
+    generated_for = constraints.get("profile", {})
+    if (plan_engine.resolve_diet(profile) != plan_engine.resolve_diet(generated_for)
+            or plan_engine.normalize_allergies(profile.get("allergies", []))
+            != plan_engine.normalize_allergies(generated_for.get("allergies", []))):
+        CACHE_REQUESTS.inc(cache="pregenerated_plan", result="miss")
+        return None
+
+    rescaled = False
+    if _targets_differ(calories, macros, constraints):
+        try:
+            plan = rescale_plan(plan, calories, macros, previous=constraints)
+        except RescaleError:
+            CACHE_REQUESTS.inc(cache="pregenerated_plan", result="miss")
+            return None
+        plan["grocery_list"] = build_grocery_list(plan)
+        constraints = {**constraints, "calories": calories, "macros": macros}
+        rescaled = True
+
+    with conn:
+        cursor = conn.execute(
+            "UPDATE pregenerated_plans SET status = ?, served_at = ? "
+            "WHERE user_id = ? AND week_start = ? AND status = ?",
+            (SERVED, datetime.utcnow().isoformat(), user_id, week.isoformat(), READY),
+        )
+    if cursor.rowcount == 0:
+        # Served to a concurrent request
+        CACHE_REQUESTS.inc(cache="pregenerated_plan", result="miss")
+        return None
+    if rescaled:
+        plan_store.update_plan(row["plan_id"], plan, constraints, reason="rescale")
+    CACHE_REQUESTS.inc(cache="pregenerated_plan", result="hit")
+    return {"plan_id": row["plan_id"], "plan": plan, "constraints": constraints, "rescaled": rescaled}
+
+
+_pregenerator: Optional[PlanPregenerator] = None
+
+
+def get_pregenerator() -> PlanPregenerator:
+    """Return the process-wide plan pre-generator."""
+    global _pregenerator
+    if _pregenerator is None:
+        _pregenerator = PlanPregenerator()
+    return _pregenerator
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-generate next week's meal plans")
+    parser.add_argument("--force", action="store_true", help="Run even outside the off-peak window")
+    parser.add_argument("--limit", type=int, help="Stop after this many users")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if not args.force and not in_window(datetime.now()):
+        logger.info("Outside the off-peak window (%s on %s); use --force to run anyway", WINDOW, DAYS)
+        return 0
+    result = asyncio.run(get_pregenerator().run_once(limit=args.limit))
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
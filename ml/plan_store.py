@@ -0,0 +1,267 @@
+"""Persistence of generated meal plans in the food_requests table.
+
+``food_requests.generated_plan`` always holds the current plan, so reading a
+plan is a single row. Every version is also kept in ``plan_revisions``:
+revision 0 is a full snapshot and each later edit (a swap, a rescale) is
+stored as a JSON Patch delta against the previous revision, typically a
+few hundred bytes instead of the whole plan. Revision data is
+zlib-compressed JSON.
+
+To bound the cost of rebuilding an old revision, a fresh snapshot is written
+instead of a delta every ``PLAN_SNAPSHOT_INTERVAL`` revisions, or sooner
+once the deltas since the last snapshot add up to more than a snapshot
+would. Reconstruction reads the nearest snapshot at or before the revision
+and replays at most that many deltas.
+"""
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_patch
+from db import get_connection
+from metrics import timed
+from serialization import dumps, loads
+
+SNAPSHOT_INTERVAL = int(os.getenv("PLAN_SNAPSHOT_INTERVAL", "10"))
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS food_requests (
+    id VARCHAR NOT NULL,
+    user_id VARCHAR,
+    goal VARCHAR,
+    allergies JSON,
+    constraints JSON,
+    preferred_cuisines JSON,
+    generated_plan JSON,
+    accepted BOOLEAN,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE TABLE IF NOT EXISTS plan_revisions (
+    plan_id VARCHAR NOT NULL,
+    revision INTEGER NOT NULL,
+    kind VARCHAR NOT NULL,
+    data BLOB NOT NULL,
+    constraints JSON,
+    reason VARCHAR,
+    created_at DATETIME,
+    PRIMARY KEY (plan_id, revision)
+);
+"""
+
+_initialized = set()
+
+
+def _conn():
+    conn = get_connection()
+    if id(conn) not in _initialized:
+        conn.executescript(SCHEMA)
+        _initialized.add(id(conn))
+    return conn
+
+
+def _pack(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"))
+
+
+def _unpack(data: bytes) -> Any:
+    return loads(zlib.decompress(data))
+
+
+def _insert_revision(conn, plan_id: str, revision: int, kind: str, data: bytes,
+                     constraints: Optional[Dict[str, Any]], reason: Optional[str]) -> None:
+    conn.execute(
+        "INSERT INTO plan_revisions (plan_id, revision, kind, data, constraints, reason, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (plan_id, revision, kind, data, json.dumps(constraints) if constraints is not None else None,
+         reason, datetime.utcnow().isoformat()),
+    )
+
+
+@timed("db_save_plan")
+def save_plan(plan: Dict[str, Any], constraints: Dict[str, Any],
+              user_id: Optional[str] = None, plan_json: Optional[bytes] = None) -> str:
+    """Store a generated plan as revision 0 and return its id.
+
+    Args:
+        plan: The plan dict ({"days": [...], "grocery_list": [...]})
+        constraints: The request that produced it (calories, macros, profile)
+        user_id: Owner of the plan, if known
+        plan_json: The plan already encoded as JSON, to store as is
+    """
+    plan_id = str(uuid.uuid4())
+    profile = constraints.get("profile", {})
+    text = (plan_json if plan_json is not None else dumps(plan)).decode()
+    conn = _conn()
+    with conn:
+        conn.execute(
+            "INSERT INTO food_requests (id, user_id, goal, allergies, constraints, "
+            "preferred_cuisines, generated_plan, accepted, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (plan_id, user_id, profile.get("goal"), json.dumps(profile.get("allergies", [])),
+             json.dumps(constraints), json.dumps([]), text, False,
+             datetime.utcnow().isoformat()),
+        )
+        _insert_revision(conn, plan_id, 0, SNAPSHOT, _pack(text), constraints, "generate")
+    return plan_id
+
+
+def get_owner(plan_id: str) -> Tuple[bool, Optional[str]]:
+    """Return (exists, user_id) for a plan id; user_id is None for anonymous plans."""
+    row = _conn().execute("SELECT user_id FROM food_requests WHERE id = ?", (plan_id,)).fetchone()
+    return (False, None) if row is None else (True, row["user_id"])
+
+
+@timed("db_get_plan")
+def get_plan(plan_id: str) -> Optional[Dict[str, Any]]:
+    """Return {"plan": ..., "constraints": ...} for a plan id, or None."""
+    row = _conn().execute(
+        "SELECT generated_plan, constraints FROM food_requests WHERE id = ?", (plan_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "plan": loads(row["generated_plan"]),
+        "constraints": json.loads(row["constraints"] or "{}"),
+    }
+
+
+@timed("db_update_plan")
+def update_plan(plan_id: str, plan: Dict[str, Any],
+                constraints: Optional[Dict[str, Any]] = None,
+                reason: Optional[str] = None) -> Optional[int]:
+    """Replace the stored plan for an id, and its constraints if given.
+
+    The change is recorded as a new revision (a delta, or a snapshot when one
+    is due).
+
+    Args:
+        plan_id: The plan to update
+        plan: The new plan
+        constraints: New constraints, if they changed
+        reason: Short label for the history ("swap", "rescale", ...)
+
+    Returns:
+        The new revision number, or None if the plan doesn't exist.
+    """
+    text = dumps(plan).decode()
+    conn = _conn()
+    with conn:
+        # Serialize writers per database so revision numbers don't collide
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        head = conn.execute(
+            "SELECT generated_plan, constraints FROM food_requests WHERE id = ?", (plan_id,)
+        ).fetchone()
+        if head is None:
+            return None
+        last = conn.execute(
+            "SELECT MAX(revision) AS revision FROM plan_revisions WHERE plan_id = ?", (plan_id,)
+        ).fetchone()["revision"]
+        if last is None:
+            # Stored before revisions were kept: the current plan becomes revision 0
+            _insert_revision(conn, plan_id, 0, SNAPSHOT, _pack(head["generated_plan"]),
+                             json.loads(head["constraints"] or "{}"), None)
+            last = 0
+
+        revision = last + 1
+        kind, data = _revision_data(conn, plan_id, loads(head["generated_plan"]), plan, text)
+        _insert_revision(conn, plan_id, revision, kind, data, constraints, reason)
+        if constraints is None:
+            conn.execute("UPDATE food_requests SET generated_plan = ? WHERE id = ?", (text, plan_id))
+        else:
+            conn.execute(
+                "UPDATE food_requests SET generated_plan = ?, constraints = ? WHERE id = ?",
+                (text, json.dumps(constraints), plan_id),
+            )
+    return revision
+
+
+def _revision_data(conn, plan_id: str, previous: Dict[str, Any], plan: Dict[str, Any], text: str):
+    """Return (kind, data) for a new revision: a delta, or a snapshot when one is due."""
+    delta = zlib.compress(dumps(json_patch.diff(previous, plan)))
+    snapshot = _pack(text)
+    since = conn.execute(
+        "SELECT COUNT(*) AS deltas, COALESCE(SUM(LENGTH(data)), 0) AS size FROM plan_revisions "
+        "WHERE plan_id = ? AND revision > (SELECT MAX(revision) FROM plan_revisions "
+        "WHERE plan_id = ? AND kind = ?)",
+        (plan_id, plan_id, SNAPSHOT),
+    ).fetchone()
+    if since["deltas"] + 1 >= SNAPSHOT_INTERVAL or since["size"] + len(delta) >= len(snapshot):
+        return SNAPSHOT, snapshot
+    return DELTA, delta
+
+
+@timed("db_plan_history")
+def list_revisions(plan_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Return the revision history of a plan without rebuilding any revision.
+
+    Returns:
+        [{"revision", "kind", "reason", "created_at", "bytes", "constraints_changed"}]
+        oldest first, or None if the plan doesn't exist. Plans stored before
+        revisions were kept report their current plan as revision 0.
+    """
+    conn = _conn()
+    rows = conn.execute(
+        "SELECT revision, kind, reason, created_at, LENGTH(data) AS bytes, "
+        "constraints IS NOT NULL AS constraints_changed "
+        "FROM plan_revisions WHERE plan_id = ? ORDER BY revision",
+        (plan_id,),
+    ).fetchall()
+    if rows:
+        return [dict(row, constraints_changed=bool(row["constraints_changed"])) for row in rows]
+    head = conn.execute(
+        "SELECT created_at, LENGTH(generated_plan) AS bytes FROM food_requests WHERE id = ?", (plan_id,)
+    ).fetchone()
+    if head is None:
+        return None
+    return [{"revision": 0, "kind": SNAPSHOT, "reason": None, "created_at": head["created_at"],
+             "bytes": head["bytes"], "constraints_changed": True}]
+
+
+@timed("db_get_revision")
+def get_revision(plan_id: str, revision: int) -> Optional[Dict[str, Any]]:
+    """Rebuild a plan as it was at a revision.
+
+    Reads the nearest snapshot at or before the revision and applies the
+    deltas after it.
+
+    Returns:
+        {"plan", "constraints", "revision"}, or None if the plan or revision
+        doesn't exist.
+    """
+    conn = _conn()
+    rows = conn.execute(
+        "SELECT revision, kind, data FROM plan_revisions WHERE plan_id = ? AND revision <= ? "
+        "AND revision >= (SELECT MAX(revision) FROM plan_revisions "
+        "WHERE plan_id = ? AND kind = ? AND revision <= ?) ORDER BY revision",
+        (plan_id, revision, plan_id, SNAPSHOT, revision),
+    ).fetchall()
+    if not rows:
+        if revision == 0:
+            # Stored before revisions were kept
+            stored = get_plan(plan_id)
+            return {**stored, "revision": 0} if stored is not None else None
+        return None
+    if rows[-1]["revision"] != revision:
+        return None
+
+    plan = _unpack(rows[0]["data"])
+    for row in rows[1:]:
+        plan = json_patch.apply(plan, _unpack(row["data"]))
+    constraints = conn.execute(
+        "SELECT constraints FROM plan_revisions WHERE plan_id = ? AND revision <= ? "
+        "AND constraints IS NOT NULL ORDER BY revision DESC LIMIT 1",
+        (plan_id, revision),
+    ).fetchone()
+    if constraints is None:
+        constraints = conn.execute("SELECT constraints FROM food_requests WHERE id = ?",
+                                   (plan_id,)).fetchone()
+    return {"plan": plan, "constraints": json.loads(constraints["constraints"] or "{}"),
+            "revision": revision}
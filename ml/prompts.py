@@ -0,0 +1,126 @@
+"""Compact prompt construction and token accounting for the LLM calls.
+
+Plans are sent to the model as pipe-separated tables rather than JSON: only
+the day being edited is listed meal by meal, and the rest of the week is
+summarized as per-day totals. Schemas are described once instead of being
+repeated for every day.
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MACRO_KEYS = ("cal", "protein_g", "carbs_g", "fat_g")
+
+MEAL_SCHEMA = '{"name":"","serving":"","cal":0,"protein_g":0,"carbs_g":0,"fat_g":0}'
+PLAN_SCHEMA = '{"days":[{"day":"Mon","meals":[MEAL]}, ...]}'
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when installed, else ~4 characters per token."""
+    try:
+        import tiktoken
+    except ImportError:
+        return max(1, len(text) // 4)
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
+def _constraints(calories: int, macros: Dict[str, Any], profile: Dict[str, Any]) -> str:
+    allergies = ", ".join(profile.get("allergies") or []) or "none"
+    return (
+        f"Daily target: {calories} kcal, protein {macros.get('protein_g', 150)}g, "
+        f"fat {macros.get('fat_g', 65)}g, carbs {macros.get('carbs_g', 250)}g. "
+        f"Diet: {profile.get('diet_pref', 'balanced')}. Allergies: {allergies}."
+    )
+
+
+def _totals(meals: List[Dict[str, Any]]) -> List[int]:
+    return [int(round(sum(float(m.get(k) or 0) for m in meals))) for k in MACRO_KEYS]
+
+
+def encode_day(day: Dict[str, Any]) -> str:
+    """Encode a day's meals as '#|name|serving|cal|P|C|F' rows."""
+    rows = ["#|name|serving|cal|P|C|F"]
+    for i, meal in enumerate(day.get("meals", [])):
+        values = "|".join(str(int(round(float(meal.get(k) or 0)))) for k in MACRO_KEYS)
+        rows.append(f"{i}|{meal.get('name', '')}|{meal.get('serving', '')}|{values}")
+    return "\n".join(rows)
+
+
+def encode_totals(plan: Dict[str, Any]) -> str:
+    """Encode each day's totals as 'day|cal|P|C|F' rows."""
+    rows = ["day|cal|P|C|F"]
+    for day in plan.get("days", []):
+        rows.append("|".join([str(day.get("day", "?"))] + [str(v) for v in _totals(day.get("meals", []))]))
+    return "\n".join(rows)
+
+
+def plan_prompt(calories: int, macros: Dict[str, Any], profile: Dict[str, Any]) -> str:
+    """Prompt for a full 7-day plan."""
+    return (
+        "You are a dietitian. Create a 7-day meal plan for one adult "
+        f"({', '.join(DAYS)}), 3 meals per day.\n"
+        f"{_constraints(calories, macros, profile)}\n"
+        f"Reply with JSON only: {PLAN_SCHEMA} where MEAL is {MEAL_SCHEMA}"
+    )
+
+
+def swap_prompt(plan: Dict[str, Any], day: str, meal_index: int, calories: int,
+                macros: Dict[str, Any], profile: Dict[str, Any]) -> str:
+    """Prompt for one replacement meal, with only the affected day in full."""
+    current = next((d for d in plan.get("days", []) if d.get("day") == day), {"meals": []})
+    return (
+        f"You are a dietitian. Replace meal #{meal_index} on {day} with one alternative "
+        "that keeps the day near its targets.\n"
+        f"{_constraints(calories, macros, profile)}\n"
+        f"{day} meals (P/C/F in g):\n{encode_day(current)}\n"
+        f"Week totals:\n{encode_totals(plan)}\n"
+        f"Reply with JSON only: {MEAL_SCHEMA}"
+    )
+
+
+class TokenMeter:
+    """Thread-safe per-call counters of prompt/completion tokens and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0,
+                                           "completion_tokens": 0, "latency_seconds": 0.0})
+
+    def record(self, call: str, prompt: str, completion: str, latency: float,
+               usage: Optional[Any] = None) -> Dict[str, Any]:
+        """Record one call and log it.
+
+        Uses the provider's reported ``usage`` when available and falls back
+        to counting the prompt and completion text.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or count_tokens(prompt)
+        completion_tokens = getattr(usage, "completion_tokens", None) or count_tokens(completion)
+        with self._lock:
+            totals = self._calls[call]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["latency_seconds"] += latency
+        logger.info(f"LLM {call}: {prompt_tokens} prompt + {completion_tokens} completion tokens in {latency:.2f}s")
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "latency": latency}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return totals and per-call averages for each call type."""
+        with self._lock:
+            out = {}
+            for call, totals in self._calls.items():
+                n = totals["calls"]
+                out[call] = {
+                    **totals,
+                    "avg_prompt_tokens": totals["prompt_tokens"] / n,
+                    "avg_completion_tokens": totals["completion_tokens"] / n,
+                    "avg_latency_seconds": totals["latency_seconds"] / n,
+                }
+            return out
+
+
+token_meter = TokenMeter()
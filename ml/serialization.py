@@ -0,0 +1,88 @@
+"""Fast JSON encoding for responses and stored plans.
+
+``dumps``/``loads`` use orjson when it is installed (several times faster
+than the stdlib encoder and producing bytes directly) and fall back to a
+compact stdlib encoding otherwise.
+
+Endpoints return ``ORJSONResponse`` directly, which skips FastAPI's
+``jsonable_encoder`` pass as well. Values wrapped in ``RawJSON`` are
+already-encoded JSON and are spliced into the response body unchanged, so a
+cached plan's bytes are written out without being serialized again.
+"""
+import json
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def _default(obj: Any) -> Any:
+    """Encode the non-JSON types our payloads contain."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if hasattr(obj, "item"):
+        # numpy scalars
+        return obj.item()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Decode JSON text or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+class RawJSON:
+    """Already-encoded JSON to embed in a response without re-encoding."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: Union[str, bytes]):
+        self.data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"RawJSON({len(self.data)} bytes)"
+
+
+def encode(content: Any) -> bytes:
+    """Encode a response body, splicing in top-level ``RawJSON`` values."""
+    if isinstance(content, RawJSON):
+        return content.data
+    if isinstance(content, dict) and any(isinstance(v, RawJSON) for v in content.values()):
+        parts = [
+            dumps(str(key)) + b":" + (value.data if isinstance(value, RawJSON) else dumps(value))
+            for key, value in content.items()
+        ]
+        return b"{" + b",".join(parts) + b"}"
+    return dumps(content)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson (or compact stdlib JSON) that understands RawJSON."""
+
+    def render(self, content: Any) -> bytes:
+        return encode(content)
+
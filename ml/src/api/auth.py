@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+
+import auth
+import user_store
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+bearer = HTTPBearer(auto_error=False)
+
+class Credentials(BaseModel):
+    email: Optional[str] = None
+    username: Optional[str] = None
+    password: str
+
+    @property
+    def login(self) -> str:
+        return (self.email or self.username or "").strip().lower()
+
+def _busy(e: auth.HashQueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _token_response(user_id: str, email: str) -> Dict[str, Any]:
+    return {
+        "access_token": auth.create_access_token(user_id, email),
+        "token_type": "bearer",
+        "user_id": user_id,
+        "user_email": email,
+    }
+
+async def _credentials(request: Request) -> Credentials:
+    # JSON from the API clients, form-encoded from the OAuth2-style login form
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            credentials = Credentials(**(await request.json()))
+        else:
+            credentials = Credentials(**dict(await request.form()))
+    except (ValidationError, ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="email (or username) and password are required")
+    if not credentials.login:
+        raise HTTPException(status_code=422, detail="email (or username) and password are required")
+    return credentials
+
+def current_user(token: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Dict[str, Any]:
+    """
+    Resolve the bearer token to its claims, using the verified-token cache.
+    """
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return auth.decode_access_token(token.credentials)
+    except auth.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+
+def optional_user(token: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Optional[Dict[str, Any]]:
+    """
+    Like current_user, but anonymous requests resolve to None.
+    A token that is present must still be valid.
+    """
+    if token is None:
+        return None
+    return current_user(token)
+
+@router.post("/auth/signup")
+async def signup(request: Request):
+    """
+    Create an account and return an access token.
+    """
+    credentials = await _credentials(request)
+    if len(credentials.password) < 6:
+        raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
+    if await asyncio.to_thread(user_store.get_user_by_username, credentials.login) is not None:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    try:
+        hashed = await auth.get_hasher().hash(credentials.password)
+    except auth.HashQueueFullError as e:
+        raise _busy(e)
+    try:
+        user_id = await asyncio.to_thread(user_store.create_user, credentials.login, hashed)
+    except user_store.UserExistsError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return _token_response(user_id, credentials.login)
+
+@router.post("/auth/login")
+async def login(request: Request):
+    """
+    Verify credentials and return an access token.
+    Hashes created with a different bcrypt cost are upgraded on success.
+    """
+    credentials = await _credentials(request)
+    user = await asyncio.to_thread(user_store.get_user_by_username, credentials.login)
+    hasher = auth.get_hasher()
+    try:
+        valid = await hasher.verify(credentials.password, user["hashed_password"] if user else None)
+    except auth.HashQueueFullError as e:
+        raise _busy(e)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect email or password",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if auth.needs_rehash(user["hashed_password"]):
+        try:
+            hashed = await hasher.hash(credentials.password)
+        except auth.HashQueueFullError:
+            # The password is already verified; upgrade the hash on a later login
+            logger.info("Hash pool full, skipping rehash for user %s", user["id"])
+        else:
+            await asyncio.to_thread(user_store.update_password_hash, user["id"], hashed)
+    return _token_response(user["id"], user["username"])
+
+@router.get("/auth/me")
+def me(claims: Dict[str, Any] = Depends(current_user)):
+    """
+    Return the authenticated user's id and email.
+    """
+    return {"user_id": claims["sub"], "email": claims.get("email")}
@@ -6,6 +6,8 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Optional
 
+from metrics import STAGE_SECONDS
+
 router = APIRouter()
 
 class EmailPlanRequest(BaseModel):
@@ -152,7 +154,7 @@ async def send_via_smtp(request: EmailPlanRequest):
         message.attach(part)
         
         # Send email via SMTP
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
+        with STAGE_SECONDS.time(stage="email_smtp"), smtplib.SMTP(smtp_server, smtp_port) as server:
             server.starttls()
             server.login(sender_email, sender_password)
             server.sendmail(sender_email, request.email, message.as_string())
@@ -295,7 +297,8 @@ async def send_via_sendgrid(request: EmailPlanRequest):
         
         # Send via SendGrid
         sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
+        with STAGE_SECONDS.time(stage="email_sendgrid"):
+            response = sg.send(message)
         
         return {
             "status": "success",
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+
+from llm import llm_breaker
+from prompts import token_meter
+from src.inference.run_inference import get_dispatcher
+
+router = APIRouter()
+
+@router.get("")
+def health():
+    """
+    Report service health with per-model readiness and inference queue depths,
+    plus LLM circuit state and token usage. Status is "degraded" when any model
+    failed to warm up.
+    """
+    models = get_dispatcher().stats()
+    ready = all(m["ready"] for m in models.values())
+    llm = {"circuit": llm_breaker.stats(), "tokens": token_meter.stats()}
+    return {"status": "ok" if ready else "degraded", "models": models, "llm": llm}
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import metrics
+
+router = APIRouter()
+
+@router.get("", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Expose request, stage, cache and LLM-source metrics in Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
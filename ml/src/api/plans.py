@@ -0,0 +1,203 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+import logging
+
+import llm
+import plan_scheduler
+import plan_store
+from models import plan_engine
+from models.grocery import apply_swap, build_grocery_list
+from models.meal_index import get_index as get_meal_index
+from models.plan_rescaler import RescaleError, rescale_plan as rescale_portions
+from serialization import ORJSONResponse, RawJSON, dumps
+from src.api.auth import optional_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+MAX_CALORIES = 10000
+MAX_MACRO_G = 1000
+MAX_SWAP_ALTERNATIVES = 10
+
+class Macros(BaseModel):
+    protein_g: float = Field(150, ge=0, le=MAX_MACRO_G)
+    fat_g: float = Field(65, ge=0, le=MAX_MACRO_G)
+    carbs_g: float = Field(250, ge=0, le=MAX_MACRO_G)
+
+class DietProfile(BaseModel):
+    diet_pref: str = "balanced"
+    allergies: List[str] = []
+
+class GeneratePlanRequest(BaseModel):
+    calories: int = Field(2000, gt=0, le=MAX_CALORIES)
+    macros: Macros = Macros()
+    profile: DietProfile = DietProfile()
+
+class RescalePlanRequest(BaseModel):
+    plan_id: str
+    calories: int = Field(gt=0, le=MAX_CALORIES)
+    macros: Optional[Macros] = None
+
+class SwapMealRequest(BaseModel):
+    plan_id: str
+    day: str
+    meal_index: int
+    profile: Optional[DietProfile] = None
+    surprise: bool = False
+    alternatives: int = Field(3, ge=1, le=MAX_SWAP_ALTERNATIVES)
+
+def _authorize(plan_id: str, user: Optional[Dict[str, Any]]) -> None:
+    # A plan with an owner is only visible to that user; to anyone else it
+    # doesn't exist. Anonymous plans stay open to whoever holds the id.
+    exists, owner = plan_store.get_owner(plan_id)
+    if not exists or (owner is not None and (user is None or user["sub"] != owner)):
+        raise HTTPException(status_code=404, detail="Plan not found")
+
+@router.post("/generate-plan")
+def generate_plan(request: GeneratePlanRequest, user: Optional[Dict[str, Any]] = Depends(optional_user)):
+    """
+    Generate and store a 7-day meal plan.
+    When the LLM is unavailable the plan comes from the local engine and the
+    response is tagged with source="fallback" and upgrade_available=True.
+    The plan is encoded once (engine plans come pre-encoded from its cache)
+    and the same bytes are stored and returned.
+    For an authenticated user, the plan pre-generated off-peak for them this
+    week is served instead when it matches the request (pregenerated=True).
+    The plan is owned by the token's user; anonymous plans have no owner.
+    """
+    constraints = {
+        "calories": request.calories,
+        "macros": request.macros.model_dump(),
+        "profile": request.profile.model_dump(),
+    }
+    if user is not None:
+        ready = plan_scheduler.take_pregenerated(user["sub"], request.calories,
+                                                 constraints["macros"], constraints["profile"])
+        if ready is not None:
+            return ORJSONResponse({"plan_id": ready["plan_id"], "plan": ready["plan"], "source": "ai",
+                                   "pregenerated": True})
+    try:
+        result = llm.generate_plan(request.calories, constraints["macros"], constraints["profile"])
+        constraints["source"] = result["source"]
+        if result["source"] == "ai":
+            get_meal_index().add_plan(result["plan"], request.profile.diet_pref.lower())
+            plan_json = dumps(result["plan"])
+        else:
+            plan_json = plan_engine.generate_plan_json(request.calories, constraints["profile"],
+                                                       constraints["macros"])
+    except plan_engine.NoSafeMealError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    plan_id = plan_store.save_plan(result["plan"], constraints, user_id=user["sub"] if user else None,
+                                   plan_json=plan_json)
+    return ORJSONResponse({"plan_id": plan_id, **result, "plan": RawJSON(plan_json)})
+
+@router.post("/swap-meal")
+def swap_meal(request: SwapMealRequest, user: Optional[Dict[str, Any]] = Depends(optional_user)):
+    """
+    Replace one meal in a stored plan and return the new meal.
+    By default the closest-macro alternatives matching the diet and allergies
+    are picked locally from the meal index; surprise=True asks the LLM instead.
+    """
+    _authorize(request.plan_id, user)
+    stored = plan_store.get_plan(request.plan_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+
+    plan, constraints = stored["plan"], stored["constraints"]
+    day = next((d for d in plan.get("days", []) if d.get("day") == request.day), None)
+    if day is None or not 0 <= request.meal_index < len(day.get("meals", [])):
+        raise HTTPException(status_code=400, detail="Invalid day or meal_index")
+
+    profile = request.profile.model_dump() if request.profile else constraints.get("profile", {})
+    result = None
+    if not request.surprise:
+        options = get_meal_index().suggest_swaps(
+            day["meals"][request.meal_index], profile, k=request.alternatives,
+            exclude=[m.get("name", "") for m in day["meals"]],
+        )
+        if options:
+            result = {"meal": options[0], "alternatives": options[1:], "source": "local"}
+    if result is None:
+        try:
+            result = llm.swap_meal(
+                plan, request.day, request.meal_index,
+                constraints.get("calories", 2000), constraints.get("macros", {}), profile,
+            )
+        except plan_engine.NoSafeMealError as e:
+            raise HTTPException(status_code=409, detail=f"No safe swap available: {e}")
+
+    new_meal = result.pop("meal")
+    old_meal = day["meals"][request.meal_index]
+    day["meals"][request.meal_index] = new_meal
+    grocery = plan.get("grocery_list") or []
+    if grocery and all("amount" in item for item in grocery):
+        plan["grocery_list"] = apply_swap(grocery, old_meal, new_meal)
+    else:
+        plan["grocery_list"] = build_grocery_list(plan)
+    revision = plan_store.update_plan(request.plan_id, plan, reason="swap")
+    return ORJSONResponse({"plan_id": request.plan_id, "revision": revision, "new_meal": new_meal, **result})
+
+@router.post("/rescale-plan")
+def rescale_plan(request: RescalePlanRequest, user: Optional[Dict[str, Any]] = Depends(optional_user)):
+    """
+    Adjust a stored plan to a new calorie target by rescaling portions locally.
+    Only when the existing meals cannot meet the targets within tolerance is
+    the plan regenerated (escalated=True).
+    """
+    _authorize(request.plan_id, user)
+    stored = plan_store.get_plan(request.plan_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+
+    plan, constraints = stored["plan"], stored["constraints"]
+    if request.macros is not None:
+        macros = request.macros.model_dump()
+    else:
+        # Keep the previous macro split, scaled to the new calorie target
+        previous_calories = constraints.get("calories")
+        ratio = request.calories / previous_calories if previous_calories else 1.0
+        macros = {k: v * ratio for k, v in constraints.get("macros", {}).items()}
+
+    previous = constraints
+    constraints = {**constraints, "calories": request.calories, "macros": macros}
+    try:
+        new_plan = rescale_portions(plan, request.calories, macros, previous=previous)
+        new_plan["grocery_list"] = build_grocery_list(new_plan)
+        result = {"source": "local", "escalated": False}
+    except RescaleError as e:
+        logger.info(f"Local rescale for plan {request.plan_id} out of tolerance ({e}); regenerating")
+        try:
+            result = llm.generate_plan(request.calories, macros, constraints.get("profile", {}))
+        except plan_engine.NoSafeMealError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        new_plan = result.pop("plan")
+        result["escalated"] = True
+
+    revision = plan_store.update_plan(request.plan_id, new_plan, constraints,
+                                      reason="regenerate" if result["escalated"] else "rescale")
+    return ORJSONResponse({"plan_id": request.plan_id, "revision": revision, "plan": new_plan, **result})
+
+@router.get("/plans/{plan_id}/history")
+def plan_history(plan_id: str, user: Optional[Dict[str, Any]] = Depends(optional_user)):
+    """
+    List a plan's revisions (generation, swaps, rescales), oldest first.
+    Served from revision metadata; no revision is rebuilt.
+    """
+    _authorize(plan_id, user)
+    revisions = plan_store.list_revisions(plan_id)
+    if revisions is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return ORJSONResponse({"plan_id": plan_id, "revisions": revisions})
+
+@router.get("/plans/{plan_id}/revisions/{revision}")
+def plan_revision(plan_id: str, revision: int, user: Optional[Dict[str, Any]] = Depends(optional_user)):
+    """
+    Return a plan as it was at a given revision.
+    """
+    _authorize(plan_id, user)
+    stored = plan_store.get_revision(plan_id, revision)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Plan or revision not found")
+    return ORJSONResponse({"plan_id": plan_id, **stored})
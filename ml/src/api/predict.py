@@ -0,0 +1,95 @@
+import asyncio
+
+from fastapi import APIRouter, Body, File, HTTPException, UploadFile
+from pydantic import BaseModel
+from typing import Any, Dict, List
+
+from serialization import ORJSONResponse
+from src.inference.run_inference import InvalidPayloadError, QueueFullError, get_dispatcher
+from src.vision_service.produce_quality_detection import ImageTooLargeError, get_grader
+from src.vision_service.scan_storage import UploadTooLargeError, get_scan_store
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+class BatchItem(BaseModel):
+    task: str
+    payload: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+def _queue_full(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+@router.post("/batch")
+async def predict_batch(request: BatchRequest):
+    """
+    Run a batch of mixed inference requests (scanner, diet, crop_yield, nlp).
+    Results are returned in request order with a per-item status.
+    """
+    try:
+        results = await get_dispatcher().submit_batch(
+            [item.model_dump() for item in request.requests]
+        )
+    except QueueFullError as e:
+        raise _queue_full(e)
+    except InvalidPayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse({"results": results})
+
+@router.post("/scanner/upload")
+async def predict_scanner_upload(file: UploadFile = File(...)):
+    """
+    Scan a multipart image upload.
+    The image is streamed into content-addressed storage (identical uploads are
+    stored once) and near-duplicate images reuse the cached detection.
+    """
+    try:
+        image = await asyncio.to_thread(get_scan_store().put_file, file.file)
+        scan = await get_dispatcher().scan_image(image)
+    except QueueFullError as e:
+        raise _queue_full(e)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await file.close()
+    return ORJSONResponse({"task": "scanner", "result": scan["result"], "cached": scan["cached"],
+                           "image": image.to_dict()})
+
+@router.post("/produce-quality")
+async def predict_produce_quality(file: UploadFile = File(...)):
+    """
+    Grade the produce in a crate or tray photo.
+    Returns per-item grades, quality scores, coverage and estimated counts with
+    nutrition for each detected label.
+    """
+    try:
+        result = await asyncio.to_thread(get_grader().grade_image, file.file)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable image: {str(e)}")
+    finally:
+        await file.close()
+    return ORJSONResponse({"task": "produce_quality", "result": result})
+
+@router.post("/{task}")
+async def predict(task: str, payload: Dict[str, Any] = Body(...)):
+    """Run a single inference request for the given task."""
+    try:
+        result = await get_dispatcher().submit(task, payload)
+    except QueueFullError as e:
+        raise _queue_full(e)
+    except InvalidPayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference error: {str(e)}")
+    return ORJSONResponse({"task": task, "result": result})
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from src.nlp.research_summary_generator import get_corpus
+
+router = APIRouter()
+
+class ResearchSummaryRequest(BaseModel):
+    text: str
+
+@router.post("/research/summarize")
+def summarize_research(request: ResearchSummaryRequest):
+    """
+    Summarize research text. Documents already in the corpus are served
+    from the cache by content hash.
+    """
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text must not be empty")
+    return get_corpus().summarize(request.text)
+
+@router.get("/research/search")
+def search_research(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=100)):
+    """Search previously summarized research by keyword, best match first."""
+    return {"query": q, "results": get_corpus().search(q, limit=limit)}
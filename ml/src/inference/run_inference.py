@@ -0,0 +1,414 @@
+"""Unified inference dispatcher for the ML models.
+
+Routes scanner, diet, crop-yield and NLP requests to their models. The models
+are CPU-bound, so they run in a process pool and never block the event loop.
+Each task type has a bounded number of in-flight requests; once a task is
+saturated new work is rejected with ``QueueFullError`` (HTTP 429) instead of
+piling up behind the pool.
+
+Run as a module for offline batch inference over JSONL files:
+
+    python -m src.inference.run_inference requests.jsonl -o results.jsonl
+
+Each input line is ``{"id": ..., "task": ..., "payload": {...}}``; results are
+written in input order, one JSON object per line.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from metrics import CACHE_REQUESTS, STAGE_SECONDS
+from models import crop_yield, diet_generator, food_scanner, nlp
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("scanner", "diet", "crop_yield", "nlp")
+
+DEFAULT_QUEUE_LIMIT = int(os.getenv("INFERENCE_QUEUE_LIMIT", "64"))
+
+# Stage label for the model's own compute time, measured in the worker
+MODEL_STAGES = {
+    "scanner": "scanner_predict",
+    "diet": "diet_generate",
+    "crop_yield": "crop_yield_predict",
+    "nlp": "nlp_summarize",
+}
+
+# Tiny payloads used to warm each worker and prove the model is loadable
+WARMUP_PAYLOADS = {
+    "scanner": {"detected_items": [{"label": "apple", "confidence": 1.0}]},
+    "diet": {"profile": {}, "food_items": [{"label": "rice"}], "constraints": {}},
+    "crop_yield": {"crop": "rice"},
+    "nlp": {"text": "FoodGene warmup sentence."},
+}
+
+
+# Payload fields only the dispatcher itself may set
+INTERNAL_FIELDS = {"scanner": ("image_path",)}
+
+
+class InvalidPayloadError(ValueError):
+    """Raised when a request payload sets a field reserved for internal use."""
+
+
+class QueueFullError(Exception):
+    """Raised when a task's in-flight limit is reached."""
+
+    def __init__(self, task: str, limit: int):
+        super().__init__(f"Inference queue for '{task}' is full ({limit} in flight)")
+        self.task = task
+        self.limit = limit
+
+
+def run_task(task: str, payload: Dict[str, Any]) -> Any:
+    """Run one inference request synchronously.
+
+    This is the function executed inside the worker processes, so it must
+    stay a picklable module-level function.
+
+    Args:
+        task: One of TASKS
+        payload: Task-specific request body
+
+    Returns:
+        The model's result.
+
+    Raises:
+        ValueError: If the task is unknown or the payload is malformed
+    """
+    if task == "scanner":
+        return food_scanner.predict(payload.get("image_base64") or payload)
+    if task == "diet":
+        return diet_generator.generate(
+            payload.get("profile", {}),
+            payload.get("food_items", []),
+            payload.get("constraints", {}),
+        )
+    if task == "crop_yield":
+        return crop_yield.predict(payload)
+    if task == "nlp":
+        text = payload.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("'text' is required for nlp requests")
+        return nlp.summarize(text)
+    raise ValueError(f"Unknown task '{task}'. Expected one of: {', '.join(TASKS)}")
+
+
+def check_payload(task: str, payload: Dict[str, Any]) -> None:
+    """Reject client payloads that set fields reserved for the dispatcher.
+
+    Raises:
+        InvalidPayloadError: If the payload contains one of INTERNAL_FIELDS
+    """
+    for field in INTERNAL_FIELDS.get(task, ()):
+        if field in payload:
+            raise InvalidPayloadError(f"'{field}' is not accepted in {task} requests")
+
+
+def _scan_stored_file(path: str) -> Any:
+    # Uploads are stored before dispatch; only the path crosses the process
+    # boundary. Only the dispatcher calls this, with a path from scan storage.
+    with open(path, "rb") as f:
+        return food_scanner.predict(f.read())
+
+
+def _call_timed(fn: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+    # Metrics recorded in a worker process never reach /metrics, so the
+    # compute time travels back with the result
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def _queue_limit(task: str) -> int:
+    return int(os.getenv(f"INFERENCE_QUEUE_LIMIT_{task.upper()}", DEFAULT_QUEUE_LIMIT))
+
+
+class InferenceDispatcher:
+    """Dispatch inference requests to a process pool with per-task admission limits."""
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 queue_limits: Optional[Dict[str, int]] = None):
+        self.max_workers = max_workers or int(os.getenv("INFERENCE_WORKERS", "0")) or os.cpu_count() or 1
+        self.queue_limits = {task: _queue_limit(task) for task in TASKS}
+        self.queue_limits.update(queue_limits or {})
+        self.depths = {task: 0 for task in TASKS}
+        self.ready = {task: False for task in TASKS}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def start(self) -> None:
+        """Start the worker pool and warm every model once."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.pool, run_task, task, payload)
+              for task, payload in WARMUP_PAYLOADS.items()),
+            return_exceptions=True,
+        )
+        for task, result in zip(WARMUP_PAYLOADS, results):
+            self.ready[task] = not isinstance(result, BaseException)
+            if not self.ready[task]:
+                logger.error("Warmup failed for %s: %s", task, result)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker pool, letting in-flight requests finish when wait is set."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+            self._pool = None
+        self.ready = {task: False for task in TASKS}
+
+    def _check_task(self, task: str) -> None:
+        if task not in self.depths:
+            raise ValueError(f"Unknown task '{task}'. Expected one of: {', '.join(TASKS)}")
+
+    def _admit(self, counts: Dict[str, int]) -> None:
+        """Reserve queue slots for all requested tasks or none of them."""
+        for task, count in counts.items():
+            self._check_task(task)
+            if self.depths[task] + count > self.queue_limits[task]:
+                raise QueueFullError(task, self.queue_limits[task])
+        for task, count in counts.items():
+            self.depths[task] += count
+
+    async def _run_in_pool(self, task: str, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        result, seconds = await loop.run_in_executor(self.pool, _call_timed, fn, *args)
+        STAGE_SECONDS.observe(seconds, stage=MODEL_STAGES[task])
+        return result
+
+    async def _execute(self, task: str, payload: Dict[str, Any]) -> Any:
+        # Includes pool queueing and IPC; the model's own time is recorded
+        # under MODEL_STAGES by _run_in_pool
+        with STAGE_SECONDS.time(stage=f"inference_{task}"):
+            if task == "nlp":
+                return await self._summarize(payload)
+            if task == "scanner" and isinstance(payload.get("image_base64"), str):
+                from src.vision_service.scan_storage import get_scan_store
+                image = await asyncio.to_thread(get_scan_store().put_base64, payload["image_base64"])
+                return (await self._scan_stored(image))["result"]
+            return await self._run_in_pool(task, run_task, task, payload)
+
+    async def _summarize(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Repeat submissions are a hash lookup in the research corpus; only
+        # misses are sent to the pool
+        from src.nlp.research_summary_generator import get_corpus
+        from src.nlp.text_analysis import content_hash
+
+        text = payload.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("'text' is required for nlp requests")
+
+        corpus = get_corpus()
+        cached = await asyncio.to_thread(corpus.lookup, content_hash(text))
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="research_summary", result="hit")
+            return {**cached, "cached": True}
+        CACHE_REQUESTS.inc(cache="research_summary", result="miss")
+
+        result = await self._run_in_pool("nlp", run_task, "nlp", payload)
+        doc_hash = await asyncio.to_thread(corpus.add, text, result)
+        return {**result, "document_id": doc_hash, "cached": False}
+
+    async def _scan_stored(self, image) -> Dict[str, Any]:
+        # Identical and near-duplicate images reuse the cached detection
+        from src.vision_service.scan_storage import get_scan_store
+
+        store = get_scan_store()
+        cached = await asyncio.to_thread(store.cached_result, image)
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="scan_result", result="hit")
+            return {"result": cached["result"], "cached": cached["match"], "distance": cached["distance"]}
+        CACHE_REQUESTS.inc(cache="scan_result", result="miss")
+
+        result = await self._run_in_pool("scanner", _scan_stored_file, image.path)
+        await asyncio.to_thread(store.save_result, image, result)
+        return {"result": result, "cached": None, "distance": None}
+
+    async def scan_image(self, image) -> Dict[str, Any]:
+        """Run the scanner on an image already in scan storage.
+
+        Returns:
+            {"result", "cached": None | "exact" | "similar", "distance"}
+
+        Raises:
+            QueueFullError: If the scanner task is saturated
+        """
+        self._admit({"scanner": 1})
+        try:
+            with STAGE_SECONDS.time(stage="inference_scanner"):
+                return await self._scan_stored(image)
+        finally:
+            self.depths["scanner"] -= 1
+
+    async def submit(self, task: str, payload: Dict[str, Any]) -> Any:
+        """Run a single request.
+
+        Raises:
+            InvalidPayloadError: If the payload sets an internal field
+            ValueError: If the task is unknown or the payload is invalid
+            QueueFullError: If the task is saturated
+        """
+        check_payload(task, payload)
+        self._admit({task: 1})
+        try:
+            return await self._execute(task, payload)
+        finally:
+            self.depths[task] -= 1
+
+    async def submit_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run a batch of mixed-task requests concurrently.
+
+        The batch is admitted as a whole: if any task lacks capacity for its
+        share of the batch, nothing is queued and QueueFullError is raised.
+        Individual request failures are reported per item.
+
+        Args:
+            requests: List of {"task": str, "payload": dict}
+
+        Returns:
+            List of {"task", "status", "result" | "error"} in request order.
+
+        Raises:
+            InvalidPayloadError: If any payload sets an internal field
+            QueueFullError: If a task lacks capacity for the batch
+        """
+        counts: Dict[str, int] = {}
+        for request in requests:
+            task = request.get("task")
+            check_payload(task, request.get("payload") or {})
+            counts[task] = counts.get(task, 0) + 1
+        self._admit(counts)
+
+        async def run_one(request: Dict[str, Any]) -> Dict[str, Any]:
+            task = request["task"]
+            try:
+                result = await self._execute(task, request.get("payload") or {})
+                return {"task": task, "status": "ok", "result": result}
+            except Exception as e:
+                logger.warning("Batch item for %s failed: %s", task, e)
+                return {"task": task, "status": "error", "error": str(e)}
+            finally:
+                self.depths[task] -= 1
+
+        return list(await asyncio.gather(*(run_one(r) for r in requests)))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return queue depth, limit and readiness per task."""
+        return {
+            task: {
+                "ready": self.ready[task],
+                "depth": self.depths[task],
+                "limit": self.queue_limits[task],
+            }
+            for task in TASKS
+        }
+
+
+_dispatcher: Optional[InferenceDispatcher] = None
+
+
+def get_dispatcher() -> InferenceDispatcher:
+    """Return the process-wide inference dispatcher."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = InferenceDispatcher()
+    return _dispatcher
+
+
+def _run_line(numbered_line) -> Dict[str, Any]:
+    """Parse and run one JSONL request, turning every failure into an error record."""
+    line_no, line = numbered_line
+    record: Dict[str, Any] = {"id": line_no}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise TypeError(f"Expected a JSON object, got {type(request).__name__}")
+        record.update(id=request.get("id", line_no), task=request.get("task"))
+        record["result"] = run_task(request.get("task"), request.get("payload") or {})
+        record["status"] = "ok"
+    except json.JSONDecodeError as e:
+        record.update(status="error", error=f"Invalid JSON: {e}")
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    return record
+
+
+def run_batch(lines: Iterable[str], workers: Optional[int] = None,
+              chunk_size: int = 16) -> Iterator[Dict[str, Any]]:
+    """Run JSONL requests across a process pool, yielding results in input order.
+
+    Input is consumed one window at a time (``workers * chunk_size * 4``
+    lines) so arbitrarily large files stream with bounded memory.
+
+    Args:
+        lines: Iterable of JSONL request lines; blank lines are skipped
+        workers: Worker process count (defaults to CPU count)
+        chunk_size: Requests sent to a worker per round trip
+
+    Yields:
+        One result record per request.
+
+    Raises:
+        ValueError: If chunk_size is less than 1
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    workers = workers or os.cpu_count() or 1
+    numbered = ((n, line) for n, line in enumerate(lines, 1) if line.strip())
+    window = workers * chunk_size * 4
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(itertools.islice(numbered, window))
+            if not batch:
+                break
+            yield from pool.map(_run_line, batch, chunksize=chunk_size)
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run FoodGene model inference over a JSONL file.")
+    parser.add_argument("input", help="JSONL file of requests, or '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results file (default: stdout)")
+    parser.add_argument("-w", "--workers", type=_positive_int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("-c", "--chunk-size", type=_positive_int, default=16, help="Requests per worker round trip")
+    args = parser.parse_args(argv)
+
+    infile: TextIO = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    outfile: TextIO = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    failed = 0
+    try:
+        for record in run_batch(infile, workers=args.workers, chunk_size=args.chunk_size):
+            failed += record["status"] != "ok"
+            outfile.write(json.dumps(record) + "\n")
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    if failed:
+        logger.warning("%d request(s) failed", failed)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Research corpus store with cached summaries and a keyword search index.
+
+Documents are keyed by the SHA-256 of their normalized text, so resubmitting a
+paper is a single indexed lookup instead of another ``nlp.summarize`` pass.
+Every stored document is also added to an inverted index
+(``research_postings``) ranked with BM25. The length-normalized term weight is
+computed once at insert time (against the corpus average length at that point),
+so a query only has to sum precomputed weights for the matching postings.
+The document count and total length behind idf and the average length live
+in a one-row ``research_stats`` table, updated in the same transaction as
+the postings, so every worker and connection sees the same corpus totals.
+"""
+import json
+import logging
+import math
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from db import get_connection
+from metrics import STAGE_SECONDS
+from models import nlp
+from src.nlp.text_analysis import content_hash, term_frequencies, tokenize
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS research_documents (
+    id INTEGER PRIMARY KEY,
+    content_hash VARCHAR NOT NULL UNIQUE,
+    summary TEXT,
+    highlights JSON,
+    length INTEGER,
+    created_at DATETIME
+);
+CREATE TABLE IF NOT EXISTS research_postings (
+    term VARCHAR NOT NULL,
+    doc_id INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS research_terms (
+    term VARCHAR PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS research_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    doc_count INTEGER NOT NULL,
+    total_length INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO research_stats (id, doc_count, total_length)
+SELECT 1, COUNT(*), COALESCE(SUM(length), 0) FROM research_documents;
+"""
+
+
+class ResearchCorpus:
+    """SQLite-backed store of summarized research documents."""
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None):
+        self._conn = conn
+        self._ready = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = self._conn or get_connection()
+        if not self._ready:
+            conn.executescript(SCHEMA)
+            self._ready = True
+        return conn
+
+    def lookup(self, doc_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the cached summary for a content hash, if present."""
+        row = self.conn.execute(
+            "SELECT summary, highlights FROM research_documents WHERE content_hash = ?",
+            (doc_hash,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "summary": row["summary"],
+            "highlights": json.loads(row["highlights"]),
+            "document_id": doc_hash,
+        }
+
+    def add(self, text: str, result: Dict[str, Any]) -> str:
+        """Store a summary and index its terms. Returns the content hash."""
+        doc_hash = content_hash(text)
+        tf = term_frequencies(text, result.get("highlights", []))
+        length = sum(tf.values())
+        conn = self.conn
+        with conn:
+            # Serialize writers so the corpus totals and the weights derived
+            # from them stay consistent across workers
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO research_documents "
+                "(content_hash, summary, highlights, length, created_at) VALUES (?, ?, ?, ?, ?)",
+                (doc_hash, result["summary"], json.dumps(result.get("highlights", [])),
+                 length, datetime.utcnow().isoformat()),
+            )
+            if cur.rowcount:
+                conn.execute(
+                    "UPDATE research_stats SET doc_count = doc_count + 1, "
+                    "total_length = total_length + ? WHERE id = 1",
+                    (length,),
+                )
+                doc_count, total_length = conn.execute(
+                    "SELECT doc_count, total_length FROM research_stats WHERE id = 1"
+                ).fetchone()
+                avg_length = total_length / doc_count if total_length else 1.0
+                norm = K1 * (1 - B + B * length / avg_length)
+                conn.executemany(
+                    "INSERT INTO research_postings (term, doc_id, weight) VALUES (?, ?, ?)",
+                    [(term, cur.lastrowid, count * (K1 + 1) / (count + norm))
+                     for term, count in tf.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO research_terms (term, df) VALUES (?, 1) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in tf],
+                )
+        return doc_hash
+
+    def summarize(self, text: str) -> Dict[str, Any]:
+        """Summarize text, serving repeat submissions from the cache.
+
+        Returns:
+            Dict with summary, highlights, document_id (content hash) and
+            cached (whether the summary came from the store).
+        """
+        doc_hash = content_hash(text)
+        cached = self.lookup(doc_hash)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+
+        with STAGE_SECONDS.time(stage="nlp_summarize"):
+            result = nlp.summarize(text)
+        self.add(text, result)
+        return {**result, "document_id": doc_hash, "cached": False}
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Rank stored documents against a keyword query using BM25.
+
+        Args:
+            query: Free-text keywords
+            limit: Maximum number of results
+
+        Returns:
+            List of dicts with document_id, summary, highlights and score,
+            best match first.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+
+        conn = self.conn
+        total = conn.execute("SELECT doc_count FROM research_stats WHERE id = 1").fetchone()[0]
+        if not total:
+            return []
+
+        placeholders = ",".join("?" * len(terms))
+        doc_freqs = dict(conn.execute(
+            f"SELECT term, df FROM research_terms WHERE term IN ({placeholders})",
+            terms,
+        ).fetchall())
+        if not doc_freqs:
+            return []
+
+        # Terms found in most documents dominate the posting scan, so when a
+        # more selective term is present only its postings pick the candidate
+        # documents. Common terms still add their (small) weight to each
+        # candidate's score through a primary-key lookup per document.
+        drives = any(df <= total / 2 for df in doc_freqs.values())
+
+        # idf is computed here because SQLite builds may lack math functions
+        idf_rows = [
+            (term, math.log(1 + (total - df + 0.5) / (df + 0.5)), not drives or df <= total / 2)
+            for term, df in doc_freqs.items()
+        ]
+        values = ",".join("(?, ?, ?)" for _ in idf_rows)
+        params = [v for row in idf_rows for v in row]
+        ranked = conn.execute(
+            f"""
+            WITH q(term, idf, selective) AS (VALUES {values}),
+            candidates AS (
+                SELECT DISTINCT p.doc_id
+                FROM q JOIN research_postings p ON p.term = q.term
+                WHERE q.selective
+            )
+            SELECT p.doc_id, SUM(q.idf * p.weight) AS score
+            FROM candidates c CROSS JOIN q
+            JOIN research_postings p ON p.term = q.term AND p.doc_id = c.doc_id
+            GROUP BY p.doc_id
+            ORDER BY score DESC
+            LIMIT ?
+            """,
+            params + [limit],
+        ).fetchall()
+        if not ranked:
+            return []
+
+        scores = {row["doc_id"]: row["score"] for row in ranked}
+        placeholders = ",".join("?" * len(scores))
+        docs = {
+            row["id"]: row for row in conn.execute(
+                f"SELECT id, content_hash, summary, highlights FROM research_documents "
+                f"WHERE id IN ({placeholders})",
+                list(scores),
+            )
+        }
+        return [
+            {
+                "document_id": docs[doc_id]["content_hash"],
+                "summary": docs[doc_id]["summary"],
+                "highlights": json.loads(docs[doc_id]["highlights"]),
+                "score": round(score, 4),
+            }
+            for doc_id, score in scores.items()
+        ]
+
+
+_corpus: Optional[ResearchCorpus] = None
+
+
+def get_corpus() -> ResearchCorpus:
+    """Return the process-wide research corpus."""
+    global _corpus
+    if _corpus is None:
+        _corpus = ResearchCorpus()
+    return _corpus
@@ -0,0 +1,51 @@
+"""Lightweight text analysis helpers for research documents."""
+import hashlib
+import re
+from collections import Counter
+from typing import Dict, Iterable, List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because
+been before being below between both but by can could did do does doing down
+during each few for from further had has have having he her here hers herself
+him himself his how i if in into is it its itself just me more most my myself
+no nor not now of off on once only or other our ours ourselves out over own
+same she should so some such than that the their theirs them themselves then
+there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours
+yourself yourselves
+""".split())
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted papers hash identically."""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def content_hash(text: str) -> str:
+    """Return the SHA-256 hex digest of the normalized document text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase index terms, dropping stopwords and 1-char tokens."""
+    return [
+        token for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def term_frequencies(text: str, highlights: Iterable[str] = ()) -> Dict[str, int]:
+    """Count index terms for a document.
+
+    Highlight terms are counted twice so that matches on extracted key phrases
+    rank above incidental mentions in the body text.
+    """
+    counts = Counter(tokenize(text))
+    for phrase in highlights:
+        for token in tokenize(phrase):
+            counts[token] += 2
+    return dict(counts)
@@ -0,0 +1,342 @@
+"""Produce quality grading for whole crate/tray photos.
+
+A large image is cut into square patches with a zero-copy strided view
+(``tile_view``) and the patches are classified in batches. For big images the
+decoded pixels are placed once in shared memory; worker processes attach to
+it and grade disjoint bands of patch rows, so only patch results cross the
+process boundary.
+
+The classifier is a colour model like the stub scanner's. Each patch is
+subsampled, background (neutral crate/tray pixels) is masked out, and the
+produce pixels are matched to reference colours of the produce labels in
+``FOOD_NUTRITION_DB``. Quality drops with the share of dark (bruised or rotten)
+pixels and with dull colour. Patch results are aggregated per label into
+coverage, an estimated item count (connected patch regions) and a grade.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from models.food_scanner import FOOD_NUTRITION_DB
+
+logger = logging.getLogger(__name__)
+
+PATCH_SIZE = int(os.getenv("PRODUCE_PATCH_SIZE", "64"))
+# Limits on the encoded upload and the decoded picture; a small compressed
+# file can expand to gigabytes of pixels
+MAX_UPLOAD_BYTES = int(os.getenv("PRODUCE_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_PIXELS = int(os.getenv("PRODUCE_MAX_PIXELS", str(50_000_000)))
+# Pixels sampled per patch axis; 16x16 keeps colour statistics stable at a
+# fraction of the cost of every pixel
+SAMPLES_PER_AXIS = 16
+# Patch rows graded per worker job
+ROWS_PER_JOB = 8
+# Below this many patches the pool's overhead outweighs the parallelism
+MIN_PARALLEL_PATCHES = 2000
+
+# Produce labels with reference colours (RGB of healthy produce); all are
+# FOOD_NUTRITION_DB keys
+REFERENCE_COLOURS = {
+    "tomato": (205, 45, 35),
+    "apple": (150, 25, 45),
+    "potato": (185, 150, 100),
+    "broccoli": (55, 115, 45),
+}
+LABELS = tuple(REFERENCE_COLOURS)
+BACKGROUND = -1
+
+# Produce pixels need this much chroma (max - min channel) and brightness;
+# crates and trays are assumed to be neutral
+MIN_CHROMA = 35
+MIN_VALUE = 40
+# A patch is produce when at least this fraction of its pixels are
+MIN_FOREGROUND = 0.5
+# A produce pixel darker than this fraction of the patch median is a defect
+DEFECT_DARKNESS = 0.55
+
+GRADES = (("A", 0.85), ("B", 0.65), ("C", 0.4))
+REJECT = "reject"
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds PRODUCE_MAX_UPLOAD_BYTES or PRODUCE_MAX_PIXELS."""
+
+
+def tile_view(image: np.ndarray, patch: int = PATCH_SIZE,
+              stride: Optional[int] = None) -> np.ndarray:
+    """Return a zero-copy (rows, cols, patch, patch, channels) view of the image's patches.
+
+    Edge pixels that don't fill a whole patch are left out.
+    """
+    stride = stride or patch
+    height, width, channels = image.shape
+    rows = (height - patch) // stride + 1
+    cols = (width - patch) // stride + 1
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Image {width}x{height} is smaller than one {patch}px patch")
+    sh, sw, sc = image.strides
+    return np.lib.stride_tricks.as_strided(
+        image, shape=(rows, cols, patch, patch, channels),
+        strides=(sh * stride, sw * stride, sh, sw, sc), writeable=False,
+    )
+
+
+def classify_patches(patches: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Classify a batch of patches.
+
+    Args:
+        patches: (n, patch, patch, 3) uint8 array or view
+
+    Returns:
+        (labels, quality, foreground): label index into LABELS or BACKGROUND
+        (int8), quality score in [0, 1] (float32), and the fraction of
+        produce pixels (float32), one entry per patch.
+    """
+    step = max(1, patches.shape[1] // SAMPLES_PER_AXIS)
+    # Only the subsample is copied out of the view
+    px = patches[:, ::step, ::step, :3].astype(np.float32).reshape(len(patches), -1, 3)
+
+    high = px.max(axis=2)
+    low = px.min(axis=2)
+    fg = ((high - low) >= MIN_CHROMA) & (high >= MIN_VALUE)
+    fg_count = fg.sum(axis=1)
+    fg_fraction = fg_count / px.shape[1]
+    weights = fg / np.maximum(fg_count, 1)[:, None]
+
+    # Mean produce colour per patch, compared in chromaticity plus brightness
+    mean = np.einsum("np,npc->nc", weights, px)
+    refs = np.array([REFERENCE_COLOURS[label] for label in LABELS], dtype=np.float32)
+
+    def chromaticity(rgb):
+        return rgb / np.maximum(rgb.sum(axis=-1, keepdims=True), 1.0)
+
+    distance = (np.linalg.norm(chromaticity(mean)[:, None, :] - chromaticity(refs)[None], axis=2)
+                + 0.1 * np.abs(mean.sum(axis=1)[:, None] - refs.sum(axis=1)[None]) / 765)
+    labels = distance.argmin(axis=1).astype(np.int8)
+
+    # Defects: produce pixels much darker than the patch's typical produce pixel
+    brightness = np.where(fg, high, np.nan)
+    with np.errstate(all="ignore"):
+        median = np.nanmedian(brightness, axis=1)
+        defects = np.nansum(brightness < DEFECT_DARKNESS * median[:, None], axis=1) / np.maximum(fg_count, 1)
+    # Dull colour relative to the matched reference (wilting, ageing)
+    ref_chroma = refs.max(axis=1) - refs.min(axis=1)
+    mean_chroma = mean.max(axis=1) - mean.min(axis=1)
+    dullness = np.clip(1 - mean_chroma / ref_chroma[labels], 0, 1)
+
+    quality = np.clip(1 - 2.5 * defects - 0.5 * dullness, 0, 1).astype(np.float32)
+    background = fg_fraction < MIN_FOREGROUND
+    labels[background] = BACKGROUND
+    quality[background] = 0
+    return labels, quality, fg_fraction.astype(np.float32)
+
+
+def _classify_rows(view: np.ndarray, start: int, stop: int):
+    labels, quality, foreground = [], [], []
+    for row in range(start, stop):
+        l, q, f = classify_patches(view[row])
+        labels.append(l)
+        quality.append(q)
+        foreground.append(f)
+    return np.stack(labels), np.stack(quality), np.stack(foreground)
+
+
+def _grade_band(shm_name: str, shape: Tuple[int, ...], patch: int, start: int, stop: int):
+    """Worker job: grade patch rows [start, stop) of an image in shared memory."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        view = tile_view(image, patch)
+        result = _classify_rows(view, start, stop)
+        # Views must be released before the segment can be closed
+        del view, image
+        return start, result
+    finally:
+        shm.close()
+
+
+def grade(score: float) -> str:
+    """Map a quality score to A/B/C/reject."""
+    for name, threshold in GRADES:
+        if score >= threshold:
+            return name
+    return REJECT
+
+
+def _regions(mask: np.ndarray) -> int:
+    """Count 4-connected regions in a boolean patch grid."""
+    seen = np.zeros_like(mask, dtype=bool)
+    rows, cols = mask.shape
+    count = 0
+    for r0, c0 in zip(*np.nonzero(mask)):
+        if seen[r0, c0]:
+            continue
+        count += 1
+        stack = [(r0, c0)]
+        seen[r0, c0] = True
+        while stack:
+            r, c = stack.pop()
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < rows and 0 <= nc < cols and mask[nr, nc] and not seen[nr, nc]:
+                    seen[nr, nc] = True
+                    stack.append((nr, nc))
+    return count
+
+
+def aggregate(labels: np.ndarray, quality: np.ndarray) -> Dict[str, Any]:
+    """Summarize a patch grid into per-label grades."""
+    total = labels.size
+    produce = labels != BACKGROUND
+    items = []
+    for index, label in enumerate(LABELS):
+        mask = labels == index
+        count = int(mask.sum())
+        if not count:
+            continue
+        scores = quality[mask]
+        score = float(scores.mean())
+        grade_counts = {name: 0 for name, _ in GRADES}
+        grade_counts[REJECT] = 0
+        for value in scores:
+            grade_counts[grade(float(value))] += 1
+        items.append({
+            "label": label,
+            "grade": grade(score),
+            "quality": round(score, 3),
+            "coverage": round(count / total, 4),
+            "estimated_items": _regions(mask),
+            "patch_grades": grade_counts,
+            "nutrition": FOOD_NUTRITION_DB.get(label),
+        })
+    items.sort(key=lambda item: item["coverage"], reverse=True)
+    overall = float(quality[produce].mean()) if produce.any() else None
+    return {
+        "items": items,
+        "overall_grade": grade(overall) if overall is not None else None,
+        "overall_quality": round(overall, 3) if overall is not None else None,
+        "produce_coverage": round(float(produce.mean()), 4),
+    }
+
+
+def load_image(source: Union[str, bytes, BinaryIO, np.ndarray]) -> np.ndarray:
+    """Decode an image path, bytes, file object or array to an (h, w, 3) uint8 array.
+
+    Raises:
+        ImageTooLargeError: If the encoded image or its pixel count is over the limit
+        ValueError: If the data is not a readable image
+    """
+    if isinstance(source, np.ndarray):
+        return source[..., :3] if source.dtype == np.uint8 else source[..., :3].astype(np.uint8)
+    from io import BytesIO
+    from PIL import Image, UnidentifiedImageError
+
+    if isinstance(source, str):
+        size = os.path.getsize(source)
+    else:
+        if not isinstance(source, bytes):
+            source = source.read(MAX_UPLOAD_BYTES + 1)
+        size = len(source)
+    if size > MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(f"Image exceeds {MAX_UPLOAD_BYTES} bytes")
+    try:
+        with Image.open(source if isinstance(source, str) else BytesIO(source)) as img:
+            # Only the header has been read so far; check before decoding
+            if img.width * img.height > MAX_PIXELS:
+                raise ImageTooLargeError(f"Image {img.width}x{img.height} exceeds {MAX_PIXELS} pixels")
+            return np.asarray(img.convert("RGB"))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except UnidentifiedImageError as e:
+        raise ValueError(f"Unreadable image: {e}")
+
+
+class ProduceGrader:
+    """Grade tray images, in a process pool for large images."""
+
+    def __init__(self, workers: Optional[int] = None, patch: int = PATCH_SIZE):
+        # The inference dispatcher already keeps INFERENCE_WORKERS processes
+        # busy; by default grading takes half as many rather than the whole CPU
+        inference_workers = int(os.getenv("INFERENCE_WORKERS", "0")) or os.cpu_count() or 1
+        self.workers = workers or int(os.getenv("PRODUCE_WORKERS", "0")) or max(1, inference_workers // 2)
+        self.patch = patch
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _grade_parallel(self, image: np.ndarray, rows: int, cols: int):
+        shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        try:
+            shared = np.ndarray(image.shape, dtype=np.uint8, buffer=shm.buf)
+            shared[:] = image
+            del shared
+            labels = np.empty((rows, cols), dtype=np.int8)
+            quality = np.empty((rows, cols), dtype=np.float32)
+            jobs = [
+                self.pool.submit(_grade_band, shm.name, image.shape, self.patch, start, min(start + ROWS_PER_JOB, rows))
+                for start in range(0, rows, ROWS_PER_JOB)
+            ]
+            for job in jobs:
+                start, (l, q, _) = job.result()
+                labels[start:start + len(l)] = l
+                quality[start:start + len(q)] = q
+            return labels, quality
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def grade_image(self, source: Union[str, bytes, BinaryIO, np.ndarray]) -> Dict[str, Any]:
+        """Grade every produce item visible in an image.
+
+        Args:
+            source: Image path, encoded bytes, file object or an (h, w, 3) uint8 array
+
+        Returns:
+            Dict with per-label "items" (grade, quality, coverage,
+            estimated_items, patch_grades, nutrition), "overall_grade",
+            "overall_quality", "produce_coverage" and the patch grid size.
+
+        Raises:
+            ImageTooLargeError: If the image is over the size or pixel limit
+            ValueError: If the image is unreadable or smaller than one patch
+        """
+        image = np.ascontiguousarray(load_image(source))
+        view = tile_view(image, self.patch)
+        rows, cols = view.shape[:2]
+        if self.workers > 1 and rows * cols >= MIN_PARALLEL_PATCHES:
+            del view
+            labels, quality = self._grade_parallel(image, rows, cols)
+        else:
+            labels, quality, _ = _classify_rows(view, 0, rows)
+        result = aggregate(labels, quality)
+        result.update({"patches": int(rows * cols), "grid": [int(rows), int(cols)], "patch_size": self.patch})
+        return result
+
+
+_grader: Optional[ProduceGrader] = None
+
+
+def get_grader() -> ProduceGrader:
+    """Return the process-wide produce grader."""
+    global _grader
+    if _grader is None:
+        _grader = ProduceGrader()
+    return _grader
+
+
+def shutdown_grader() -> None:
+    """Stop the grader's worker pool if it was started."""
+    if _grader is not None:
+        _grader.shutdown()
@@ -0,0 +1,341 @@
+"""Content-addressed storage for scan uploads with a perceptual-hash result cache.
+
+Uploads are streamed to disk in fixed-size chunks: base64 input is decoded
+chunk by chunk and hashed (SHA-256) as it is written, so a request never holds
+the decoded image next to its encoded form. Files are stored once under their
+digest (``<root>/ab/cd/<sha256>.<ext>``); re-uploading the same bytes only
+costs the hash.
+
+Detection results are cached per image together with a 64-bit difference hash
+(dHash) of the picture. A new upload whose dHash is within
+``SCAN_PHASH_DISTANCE`` bits of a cached one (the same plate rescanned,
+re-encoded or resized) reuses that result instead of running the scanner.
+Near neighbours are found with a multi-index over hash segments: with a
+distance limit of ``d`` the hash is split into ``d + 1`` segments, and any
+match within ``d`` bits must agree exactly on at least one of them.
+"""
+import base64
+import binascii
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+from db import get_connection
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORAGE_DIR = Path(__file__).resolve().parents[3] / "uploads" / "scans"
+
+# Bytes read per step; base64 input is consumed in multiples of 4 characters
+CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("SCAN_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+PHASH_DISTANCE = int(os.getenv("SCAN_PHASH_DISTANCE", "4"))
+
+_DATA_URL_RE = re.compile(rb"^data:[\w/+.-]+;base64,")
+_WHITESPACE_RE = re.compile(rb"\s+")
+
+# Leading bytes -> file extension
+MAGIC = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF8", "gif"),
+    (b"RIFF", "webp"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_images (
+    sha256 VARCHAR PRIMARY KEY,
+    path VARCHAR NOT NULL,
+    size INTEGER NOT NULL,
+    phash INTEGER,
+    result JSON,
+    created_at DATETIME
+) WITHOUT ROWID;
+"""
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds SCAN_MAX_UPLOAD_BYTES."""
+
+
+class StoredImage:
+    """An image in content-addressed storage."""
+
+    def __init__(self, digest: str, path: str, size: int, deduplicated: bool):
+        self.sha256 = digest
+        self.path = path
+        self.size = size
+        self.deduplicated = deduplicated
+
+    def to_dict(self) -> Dict[str, Any]:
+        # The storage path stays server-side; clients address images by digest
+        return {"sha256": self.sha256, "size": self.size, "deduplicated": self.deduplicated}
+
+
+def _extension(head: bytes) -> str:
+    for magic, ext in MAGIC:
+        if head.startswith(magic):
+            return ext
+    return "bin"
+
+
+def _base64_chunks(data: Union[str, bytes, BinaryIO]) -> Iterable[bytes]:
+    """Yield decoded bytes from base64 text, CHUNK_SIZE characters at a time."""
+    if isinstance(data, str):
+        # Encode one chunk at a time rather than copying the whole text
+        read = lambda offset: data[offset:offset + CHUNK_SIZE].encode("ascii", errors="strict")
+    elif isinstance(data, bytes):
+        view = memoryview(data)
+        read = lambda offset: bytes(view[offset:offset + CHUNK_SIZE])
+    else:
+        read = lambda offset: data.read(CHUNK_SIZE)
+
+    pending = b""
+    offset = 0
+    first = True
+    while True:
+        raw = read(offset)
+        offset += CHUNK_SIZE
+        if not raw:
+            break
+        raw = _WHITESPACE_RE.sub(b"", raw)
+        if first:
+            raw = _DATA_URL_RE.sub(b"", raw)
+            first = False
+        raw = pending + raw
+        usable = len(raw) - len(raw) % 4
+        pending = raw[usable:]
+        if usable:
+            yield base64.b64decode(raw[:usable], validate=True)
+    if pending:
+        raise binascii.Error("Truncated base64 image data")
+
+
+def _file_chunks(fileobj: BinaryIO) -> Iterable[bytes]:
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def dhash(path: str, size: int = 8) -> Optional[int]:
+    """64-bit difference hash of an image file, or None if it can't be decoded.
+
+    The image is reduced to a (size+1) x size grayscale thumbnail and each bit
+    records whether a pixel is brighter than its right neighbour, which is
+    stable under re-encoding, resizing and small colour changes.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as img:
+            # JPEG decoders can downscale while decoding, skipping most of the work
+            img.draft("L", (size * 8, size * 8))
+            pixels = list(img.convert("L").resize((size + 1, size), Image.BILINEAR).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class PHashIndex:
+    """In-memory multi-index for Hamming-distance lookups of 64-bit hashes."""
+
+    def __init__(self, max_distance: int = PHASH_DISTANCE):
+        self.max_distance = max_distance
+        segments = max_distance + 1
+        bounds = [round(i * 64 / segments) for i in range(segments + 1)]
+        self._segments: List[Tuple[int, int]] = [
+            (lo, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])
+        ]
+        self._tables: List[Dict[int, set]] = [{} for _ in self._segments]
+        self._digests: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def add(self, phash: int, digest: str) -> None:
+        with self._lock:
+            if phash in self._digests:
+                return
+            self._digests[phash] = digest
+            for table, (shift, mask) in zip(self._tables, self._segments):
+                table.setdefault((phash >> shift) & mask, set()).add(phash)
+
+    def nearest(self, phash: int) -> Optional[Tuple[str, int]]:
+        """Return (digest, distance) of the closest hash within max_distance."""
+        with self._lock:
+            candidates = set()
+            for table, (shift, mask) in zip(self._tables, self._segments):
+                candidates.update(table.get((phash >> shift) & mask, ()))
+            best = None
+            for candidate in candidates:
+                distance = bin(candidate ^ phash).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (self._digests[candidate], distance)
+            return best
+
+
+class ScanStore:
+    """Content-addressed image files plus their cached detection results."""
+
+    def __init__(self, root: Optional[str] = None, conn: Optional[sqlite3.Connection] = None,
+                 max_distance: int = PHASH_DISTANCE):
+        self.root = Path(root or os.getenv("SCAN_STORAGE_DIR", str(DEFAULT_STORAGE_DIR)))
+        self._conn = conn
+        self._ready = False
+        self._index = PHashIndex(max_distance)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = self._conn or get_connection()
+        if not self._ready:
+            conn.executescript(SCHEMA)
+            for row in conn.execute("SELECT sha256, phash FROM scan_images "
+                                    "WHERE phash IS NOT NULL AND result IS NOT NULL"):
+                self._index.add(_to_unsigned(row["phash"]), row["sha256"])
+            self._ready = True
+        return conn
+
+    def _write(self, chunks: Iterable[bytes]) -> StoredImage:
+        self.root.mkdir(parents=True, exist_ok=True)
+        digest = sha256()
+        size = 0
+        head = b""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise UploadTooLargeError(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                raise ValueError("Empty image upload")
+
+            hex_digest = digest.hexdigest()
+            target = self.root / hex_digest[:2] / hex_digest[2:4] / f"{hex_digest}.{_extension(head)}"
+            if target.exists():
+                os.unlink(tmp_path)
+                return StoredImage(hex_digest, str(target), size, deduplicated=True)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+            return StoredImage(hex_digest, str(target), size, deduplicated=False)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def put_base64(self, data: Union[str, bytes, BinaryIO]) -> StoredImage:
+        """Decode and store a base64 (optionally data-URL) image.
+
+        Raises:
+            ValueError: If the data is not valid base64, is empty or too large
+        """
+        try:
+            return self._write(_base64_chunks(data))
+        except (binascii.Error, UnicodeEncodeError) as e:
+            raise ValueError(f"Invalid base64 image data: {e}")
+
+    def put_file(self, fileobj: BinaryIO) -> StoredImage:
+        """Store raw image bytes read from a file object (e.g. a multipart upload)."""
+        return self._write(_file_chunks(fileobj))
+
+    def cached_result(self, image: StoredImage) -> Optional[Dict[str, Any]]:
+        """Return the cached detection for an identical or near-duplicate image.
+
+        Computes and records the image's dHash on first sight.
+
+        Returns:
+            {"result", "match": "exact" | "similar", "source_sha256", "distance"}
+            or None on a miss.
+        """
+        row = self.conn.execute("SELECT phash, result FROM scan_images WHERE sha256 = ?",
+                                (image.sha256,)).fetchone()
+        if row is not None and row["result"] is not None:
+            return {"result": loads(row["result"]), "match": "exact",
+                    "source_sha256": image.sha256, "distance": 0}
+
+        if row is not None and row["phash"] is not None:
+            phash = _to_unsigned(row["phash"])
+        else:
+            phash = dhash(image.path)
+            self.conn.execute(
+                "INSERT INTO scan_images (sha256, path, size, phash, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET phash = excluded.phash",
+                (image.sha256, image.path, image.size,
+                 None if phash is None else _to_signed(phash), datetime.utcnow().isoformat()),
+            )
+            self.conn.commit()
+        if phash is None:
+            return None
+
+        match = self._index.nearest(phash)
+        if match is None:
+            return None
+        source, distance = match
+        cached = self.conn.execute("SELECT result FROM scan_images WHERE sha256 = ?", (source,)).fetchone()
+        if cached is None or cached["result"] is None:
+            return None
+        return {"result": loads(cached["result"]), "match": "similar",
+                "source_sha256": source, "distance": distance}
+
+    def save_result(self, image: StoredImage, result: Any) -> None:
+        """Cache the detection result for an image."""
+        conn = self.conn
+        row = conn.execute("SELECT phash FROM scan_images WHERE sha256 = ?", (image.sha256,)).fetchone()
+        phash = _to_unsigned(row["phash"]) if row is not None and row["phash"] is not None else dhash(image.path)
+        conn.execute(
+            "INSERT INTO scan_images (sha256, path, size, phash, result, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(sha256) DO UPDATE SET result = excluded.result, phash = excluded.phash",
+            (image.sha256, image.path, image.size, None if phash is None else _to_signed(phash),
+             dumps(result).decode(), datetime.utcnow().isoformat()),
+        )
+        conn.commit()
+        if phash is not None:
+            self._index.add(phash, image.sha256)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return stored image count, bytes on disk and indexed hashes."""
+        count, total = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM scan_images").fetchone()
+        return {"images": count, "bytes": total, "indexed": len(self._index)}
+
+
+_store: Optional[ScanStore] = None
+
+
+def get_scan_store() -> ScanStore:
+    """Return the process-wide scan store."""
+    global _store
+    if _store is None:
+        _store = ScanStore()
+    return _store
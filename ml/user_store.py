@@ -0,0 +1,69 @@
+"""Persistence of user accounts in the users table."""
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from db import get_connection
+from metrics import timed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id VARCHAR NOT NULL,
+    username VARCHAR,
+    hashed_password VARCHAR,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username);
+"""
+
+_initialized = set()
+
+
+def _conn():
+    conn = get_connection()
+    if id(conn) not in _initialized:
+        conn.executescript(SCHEMA)
+        _initialized.add(id(conn))
+    return conn
+
+
+class UserExistsError(ValueError):
+    """Raised when signing up with a username that is already taken."""
+
+
+@timed("db_create_user")
+def create_user(username: str, hashed_password: str) -> str:
+    """Insert a user and return its id.
+
+    Raises:
+        UserExistsError: If the username is taken
+    """
+    user_id = str(uuid.uuid4())
+    conn = _conn()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO users (id, username, hashed_password, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, username, hashed_password, datetime.utcnow().isoformat()),
+            )
+    except sqlite3.IntegrityError:
+        raise UserExistsError(f"User '{username}' already exists")
+    return user_id
+
+
+@timed("db_get_user")
+def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+    """Return {"id", "username", "hashed_password"} or None."""
+    row = _conn().execute(
+        "SELECT id, username, hashed_password FROM users WHERE username = ?", (username,)
+    ).fetchone()
+    return dict(row) if row is not None else None
+
+
+def update_password_hash(user_id: str, hashed_password: str) -> None:
+    """Replace a user's stored hash (used when the bcrypt cost changes)."""
+    conn = _conn()
+    with conn:
+        conn.execute("UPDATE users SET hashed_password = ? WHERE id = ?", (hashed_password, user_id))
@@ -1,25 +1,270 @@
 #!/usr/bin/env python
-"""Simple startup script for FoodGene backend."""
-import sys
+"""Startup script for the FoodGene API.
+
+Development (default): one uvicorn process.
+
+    python run_backend.py
+
+Production: a pre-forking supervisor. The app, the models and the nutrition
+and meal tables are imported once in the parent, then N workers (default:
+CPU count) are forked and share those pages copy-on-write and one listening
+socket. Workers use uvloop and httptools when installed. On SIGTERM/SIGINT
+each worker stops accepting connections and finishes in-flight requests
+(LLM calls, email sends, queued inference) before exiting; stragglers are
+killed after the graceful timeout. Workers that die unexpectedly are
+restarted.
+
+    python run_backend.py --production --workers 4 --port 8000
+
+Options can also be set with FOODGENE_WORKERS, FOODGENE_HOST, FOODGENE_PORT
+and FOODGENE_GRACEFUL_TIMEOUT.
+"""
+import argparse
+import gc
+import logging
 import os
+import signal
+import socket
+import sys
+import time
 
-# Add the foodgene directory to the Python path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(ROOT, "ml")
 
-if __name__ == "__main__":
+# Add the foodgene directory and the service package to the Python path
+sys.path.insert(0, ROOT)
+sys.path.insert(0, APP_DIR)
+
+logger = logging.getLogger("foodgene.server")
+
+
+def _event_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return "asyncio"
+    return "uvloop"
+
+
+def _http_protocol() -> str:
+    try:
+        import httptools  # noqa: F401
+    except ImportError:
+        return "h11"
+    return "httptools"
+
+
+def _pool_defaults(workers: int) -> None:
+    """Split the per-process worker pools across server workers.
+
+    Each server worker starts its own inference, produce-grading and
+    password-hashing pools; without this N workers would each size theirs
+    to the whole machine.
+    """
+    share = str(max(1, (os.cpu_count() or 1) // workers))
+    for name in ("INFERENCE_WORKERS", "PRODUCE_WORKERS", "AUTH_HASH_WORKERS"):
+        os.environ.setdefault(name, share)
+
+
+def preload():
+    """Import the app and build every shared read-only table before forking.
+
+    Nothing here may open a database connection or start a thread: both
+    would be inherited by every worker. The meal index is built from the
+    static meal library; plan history is loaded lazily in each worker.
+    """
+    started = time.perf_counter()
+    from app import app
+    from models import meal_index
+    from src.inference.run_inference import WARMUP_PAYLOADS, run_task
+
+    # Models load their tables on first use; run each once in the parent
+    for task, payload in WARMUP_PAYLOADS.items():
+        try:
+            run_task(task, payload)
+        except Exception as e:
+            logger.warning("Preload of %s failed: %s", task, e)
+    meal_index.get_index()
+
+    # Move everything allocated so far out of the collector's reach so
+    # collections in the workers don't touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded app and models in %.2fs", time.perf_counter() - started)
+    return app
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(app, sock: socket.socket, graceful_timeout: int) -> None:
+    """Worker body: run uvicorn on the inherited socket until told to stop."""
     import uvicorn
-    from backend.app import app
-    
-    print("Starting FoodGene Backend API...")
-    print(f"API Title: {app.title}")
-    print(f"API Version: {app.version}")
-    print("Listening on http://0.0.0.0:8000")
-    print("API Docs available at http://localhost:8000/docs")
-    
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        reload=False,  # Disable reload to avoid import issues
-        log_level="info"
+
+    # The parent's handlers must not leak into the worker; uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(
+        app, loop=_event_loop(), http=_http_protocol(), lifespan="on", log_level="info",
+        timeout_graceful_shutdown=graceful_timeout,
     )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Fork and watch the worker processes."""
+
+    def __init__(self, app, sock: socket.socket, workers: int, graceful_timeout: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.children = {}
+        self.stopping = False
+        self.failed = False
+
+    def _spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _serve(self.app, self.sock, self.graceful_timeout)
+            except BaseException:
+                logger.exception("Worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = slot
+        logger.info("Started worker %d (slot %d)", pid, slot)
+
+    def _stop(self, signum, frame) -> None:
+        if not self.stopping:
+            logger.info("Received %s; draining workers", signal.Signals(signum).name)
+        self.stopping = True
+
+    def run(self) -> int:
+        """Serve until stopped; returns 0 after a requested stop, 1 if the workers could not be kept up."""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        restarts = []
+        while not self.stopping:
+            # Polled: a blocking waitpid is resumed after the signal handler
+            # runs, so it would never notice a stop request
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                logger.error("No workers left")
+                self.failed = True
+                break
+            if not pid:
+                time.sleep(0.2)
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            logger.warning("Worker %d exited with status %d; restarting", pid, os.waitstatus_to_exitcode(status))
+            # Back off if workers keep dying right after start
+            now = time.monotonic()
+            restarts = [t for t in restarts if now - t < 10] + [now]
+            if len(restarts) > self.workers * 3:
+                logger.error("Workers are crash-looping; giving up")
+                self.stopping = True
+                self.failed = True
+                break
+            self._spawn(slot)
+
+        return self._drain()
+
+    def _drain(self) -> int:
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # uvicorn waits graceful_timeout for connections, then runs shutdown
+        deadline = time.monotonic() + self.graceful_timeout + 15
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.children:
+            logger.warning("Worker %d did not stop in time; killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.sock.close()
+        logger.info("All workers stopped")
+        return 1 if self.failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the FoodGene API")
+    parser.add_argument("--host", default=os.getenv("FOODGENE_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("FOODGENE_PORT", "8000")))
+    parser.add_argument("--production", action="store_true",
+                        help="Pre-fork worker processes sharing preloaded models")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("FOODGENE_WORKERS", "0")),
+                        help="Worker processes in production mode (default: CPU count)")
+    parser.add_argument("--graceful-timeout", type=int,
+                        default=int(os.getenv("FOODGENE_GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds workers get to finish in-flight requests on shutdown")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if not args.production:
+        import uvicorn
+        from app import app
+
+        print("Starting FoodGene Backend API...")
+        print(f"API Title: {app.title}")
+        print(f"API Version: {app.version}")
+        print(f"Listening on http://{args.host}:{args.port}")
+        print(f"API Docs available at http://localhost:{args.port}/docs")
+        uvicorn.run(
+            app,
+            host=args.host,
+            port=args.port,
+            reload=False,  # Disable reload to avoid import issues
+            log_level="info",
+            timeout_graceful_shutdown=args.graceful_timeout,
+        )
+        return 0
+
+    workers = args.workers or os.cpu_count() or 1
+    if not hasattr(os, "fork"):
+        # No fork (Windows): uvicorn's spawn-based workers, without preloading
+        import uvicorn
+
+        logger.warning("os.fork is unavailable; starting %d workers without preloading", workers)
+        _pool_defaults(workers)
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=workers,
+                    loop=_event_loop(), http=_http_protocol(),
+                    timeout_graceful_shutdown=args.graceful_timeout)
+        return 0
+
+    _pool_defaults(workers)
+    app = preload()
+    sock = _bind(args.host, args.port)
+    logger.info("Serving on http://%s:%d with %d workers (%s, %s)",
+                args.host, args.port, workers, _event_loop(), _http_protocol())
+    return Supervisor(app, sock, workers, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
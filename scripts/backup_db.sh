@@ -0,0 +1,33 @@
+#!/bin/bash
+# Back up foodgene.db while the service is running.
+#
+# Uses SQLite's online backup API through ml/backup_db.py at low CPU and I/O
+# priority, so it can run hourly from cron without slowing requests down:
+#
+#   0 * * * * /path/to/foodgene/scripts/backup_db.sh >> /var/log/foodgene-backup.log 2>&1
+#
+# Settings (environment):
+#   BACKUP_DIR             where backups go (default: <repo>/backups)
+#   BACKUP_KEEP            number of backups to keep (default: 24)
+#   BACKUP_GZIP            1 to gzip backups (default: 1)
+#   BACKUP_MAX_MB_PER_SEC  copy throughput cap (default: 50)
+#   FOODGENE_DB_PATH       database to back up (default: <repo>/foodgene.db)
+set -euo pipefail
+
+ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+BACKUP_DIR="${BACKUP_DIR:-$ROOT/backups}"
+BACKUP_KEEP="${BACKUP_KEEP:-24}"
+PYTHON="${PYTHON:-python3}"
+
+args=(--output-dir "$BACKUP_DIR" --keep "$BACKUP_KEEP")
+if [ "${BACKUP_GZIP:-1}" = "1" ]; then
+    args+=(--gzip)
+fi
+
+priority=(nice -n 10)
+if command -v ionice >/dev/null 2>&1; then
+    priority+=(ionice -c 3)
+fi
+
+cd "$ROOT/ml"
+exec "${priority[@]}" "$PYTHON" -m backup_db "${args[@]}" "$@"
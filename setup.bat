@@ -43,7 +43,7 @@ cd ml
 REM Check Python
 python --version >nul 2>&1
 if !errorlevel! neq 0 (
-    echo ❌ Python is not installed. Please install Python 3.8+
+    echo ❌ Python is not installed. Please install Python 3.9+
     pause
     exit /b 1
 )
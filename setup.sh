@@ -42,7 +42,7 @@ cd ml
 
 # Check Python
 if ! command -v python3 &> /dev/null; then
-    echo "❌ Python3 is not installed. Please install Python 3.8+"
+    echo "❌ Python3 is not installed. Please install Python 3.9+"
     exit 1
 fi
 
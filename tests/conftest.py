@@ -0,0 +1,23 @@
+"""Shared setup for the ML service tests.
+
+The service's modules are imported the way the app runs them (from ml/),
+against a throwaway database and without an OpenAI key, so the LLM paths
+fall back to the local engine.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ML_DIR = os.path.join(ROOT_DIR, "ml")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, ML_DIR)
+
+_workdir = tempfile.mkdtemp(prefix="foodgene-test-")
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+os.environ["FOODGENE_DB_PATH"] = os.path.join(_workdir, "test.db")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.pop("OPENAI_API_KEY", None)
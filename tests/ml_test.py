@@ -0,0 +1,611 @@
+"""Tests for the ML service's plan, inference and storage paths."""
+import copy
+import json
+import random
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+import auth
+import plan_scheduler
+import plan_store
+import user_store
+from app import app
+from models import plan_engine
+
+client = TestClient(app)
+
+SUNDAY = date(2026, 10, 25)
+
+
+def _bearer(user_id: str) -> dict:
+    return {"Authorization": f"Bearer {auth.create_access_token(user_id, f'{user_id}@example.com')}"}
+
+
+def _pregenerated(user_id: str, calories: int = 2000, macros: dict = None, profile: dict = None) -> str:
+    """Store a ready pre-generated plan for the user's week containing SUNDAY."""
+    macros = macros or {"protein_g": 125, "carbs_g": 250, "fat_g": 56}
+    profile = profile or {"diet_pref": "balanced", "allergies": []}
+    plan = plan_engine.generate_plan(calories, macros, profile)
+    plan = {"days": [{"day": d["day"], "meals": [dict(m) for m in d["meals"]]} for d in plan["days"]],
+            "grocery_list": [dict(g) for g in plan["grocery_list"]]}
+    plan_id = plan_store.save_plan(plan, {"calories": calories, "macros": macros, "profile": profile,
+                                          "source": "ai"}, user_id)
+    conn = plan_scheduler._conn()
+    with conn:
+        conn.execute(
+            "INSERT INTO pregenerated_plans (user_id, week_start, status, plan_id, attempts) VALUES (?, ?, ?, ?, 1)",
+            (user_id, plan_scheduler.serving_week(SUNDAY).isoformat(), plan_scheduler.READY, plan_id),
+        )
+    return plan_id
+
+
+def test_pregenerated_plan_is_only_served_to_its_authenticated_owner(monkeypatch):
+    plan_id = _pregenerated("pregen-owner")
+    monkeypatch.setattr(plan_scheduler, "serving_week", lambda today: plan_scheduler.upcoming_week(SUNDAY))
+    body = {"calories": 2000, "macros": {"protein_g": 125, "carbs_g": 250, "fat_g": 56}}
+
+    # Naming the user in the body is not enough
+    anonymous = client.post("/api/generate-plan", json={**body, "user_id": "pregen-owner"})
+    assert anonymous.status_code == 200
+    assert not anonymous.json().get("pregenerated")
+    assert client.post("/api/generate-plan", json=body, headers=_bearer("someone-else")).json()["plan_id"] != plan_id
+
+    owner = client.post("/api/generate-plan", json=body, headers=_bearer("pregen-owner"))
+    assert owner.json()["pregenerated"] is True
+    assert owner.json()["plan_id"] == plan_id
+
+
+def test_pregenerated_plan_rejects_invalid_token():
+    response = client.post("/api/generate-plan", json={}, headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+
+def test_pregenerated_plan_is_rescaled_to_requested_macros():
+    _pregenerated("pregen-macros")
+    high_protein = {"protein_g": 175, "carbs_g": 200, "fat_g": 56}
+    ready = plan_scheduler.take_pregenerated("pregen-macros", 2000, high_protein,
+                                             {"diet_pref": "balanced", "allergies": []}, today=SUNDAY)
+    assert ready["rescaled"] is True
+    assert ready["constraints"]["macros"] == high_protein
+    assert [r["reason"] for r in plan_store.list_revisions(ready["plan_id"])] == ["generate", "rescale"]
+
+
+def test_pregenerated_plan_out_of_reach_of_requested_macros_is_kept():
+    _pregenerated("pregen-unreachable")
+    ready = plan_scheduler.take_pregenerated("pregen-unreachable", 2000,
+                                             {"protein_g": 400, "carbs_g": 20, "fat_g": 10},
+                                             {"diet_pref": "balanced", "allergies": []}, today=SUNDAY)
+    assert ready is None
+    row = plan_scheduler._conn().execute(
+        "SELECT status FROM pregenerated_plans WHERE user_id = ?", ("pregen-unreachable",)).fetchone()
+    assert row["status"] == plan_scheduler.READY
+
+
+def test_pregenerated_plan_with_matching_targets_is_served_as_is():
+    plan_id = _pregenerated("pregen-same")
+    ready = plan_scheduler.take_pregenerated("pregen-same", 2000, {"protein_g": 125, "carbs_g": 250, "fat_g": 56},
+                                             {"diet_pref": "balanced", "allergies": []}, today=SUNDAY)
+    assert ready["plan_id"] == plan_id and ready["rescaled"] is False
+    # Served once
+    assert plan_scheduler.take_pregenerated("pregen-same", 2000, {}, {"diet_pref": "balanced"},
+                                            today=SUNDAY) is None
+
+
+def test_pregenerated_plan_with_other_diet_is_not_served():
+    _pregenerated("pregen-diet")
+    assert plan_scheduler.take_pregenerated("pregen-diet", 2000, {}, {"diet_pref": "keto", "allergies": []},
+                                            today=SUNDAY) is None
+
+
+def _meals(plan: dict) -> list:
+    return [meal for day in plan["days"] for meal in day["meals"]]
+
+
+@pytest.mark.parametrize("diet,allergies", [
+    ("balanced", ["chicken", "gluten"]),
+    ("balanced", ["chicken", "turkey", "egg", "fish", "gluten"]),
+    ("keto", ["egg", "fish", "dairy"]),
+    ("vegetarian", ["gluten", "dairy", "egg"]),
+])
+def test_engine_never_serves_an_allergen(diet, allergies):
+    terms = plan_engine.normalize_allergies(allergies)
+    response = client.post("/api/generate-plan", json={"calories": 2000, "profile": {"diet_pref": diet,
+                                                                                      "allergies": allergies}})
+    assert response.status_code == 200
+    for meal in _meals(response.json()["plan"]):
+        assert plan_engine.is_safe(meal, terms), meal["name"]
+
+
+def test_engine_fails_loudly_when_no_meal_is_safe():
+    allergies = ["lentil", "bean", "quinoa", "chickpea", "oatmeal", "gluten", "dairy", "egg", "soy", "sesame"]
+    with pytest.raises(plan_engine.NoSafeMealError):
+        plan_engine.generate_plan(2000, {}, {"diet_pref": "vegetarian", "allergies": allergies})
+    response = client.post("/api/generate-plan", json={"profile": {"diet_pref": "vegetarian",
+                                                                   "allergies": allergies}})
+    assert response.status_code == 422
+
+
+def test_engine_fits_portions_to_macros():
+    def protein_error(plan, target):
+        days = [sum(m["protein_g"] for m in d["meals"]) for d in plan["days"]]
+        return sum(abs(p - target) for p in days) / len(days)
+
+    profile = {"diet_pref": "balanced", "allergies": []}
+    uniform = plan_engine.generate_plan(2000, {}, profile)
+    fitted = plan_engine.generate_plan(2000, {"protein_g": 170, "carbs_g": 180, "fat_g": 60}, profile)
+    assert protein_error(fitted, 170) < protein_error(uniform, 170)
+    for day in fitted["days"]:
+        assert abs(sum(m["cal"] for m in day["meals"]) - 2000) <= 0.05 * 2000
+    assert plan_engine.generate_plan_json(2000, profile, {"protein_g": 170, "carbs_g": 180, "fat_g": 60}) \
+        == plan_engine.generate_plan_json(2000, profile, {"protein_g": 170, "carbs_g": 180, "fat_g": 60})
+
+
+@pytest.mark.parametrize("body", [
+    {"calories": 0},
+    {"calories": -500},
+    {"calories": 2000, "macros": {"protein_g": -10}},
+])
+def test_rescale_rejects_non_positive_targets(body):
+    from models.plan_rescaler import RescaleError, rescale_plan
+
+    plan = plan_engine.generate_plan(2000, {}, {"diet_pref": "balanced", "allergies": []})
+    # No stored calories: the old ratio was 0 / 0
+    plan_id = plan_store.save_plan(plan, {}, None)
+    response = client.post("/api/rescale-plan", json={"plan_id": plan_id, **body})
+    assert response.status_code == 422
+    assert plan_store.list_revisions(plan_id)[-1]["revision"] == 0
+    with pytest.raises(RescaleError):
+        rescale_plan(plan, body["calories"], body.get("macros", {}))
+
+
+def test_rescale_without_stored_calories_keeps_macros():
+    plan = plan_engine.generate_plan(2000, {}, {"diet_pref": "balanced", "allergies": []})
+    plan_id = plan_store.save_plan(plan, {"macros": {"protein_g": 125, "carbs_g": 250, "fat_g": 56}}, None)
+    response = client.post("/api/rescale-plan", json={"plan_id": plan_id, "calories": 2100})
+    assert response.status_code == 200
+    assert plan_store.get_plan(plan_id)["constraints"]["macros"] == {"protein_g": 125, "carbs_g": 250, "fat_g": 56}
+
+
+class _NoSwaps:
+    def suggest_swaps(self, *args, **kwargs):
+        return []
+
+
+def test_swap_fallback_never_serves_an_allergen(monkeypatch):
+    import llm
+
+    monkeypatch.setattr(llm, "get_index", lambda: _NoSwaps())
+    monkeypatch.setattr(llm, "ALTERNATIVE_MEALS", [
+        {"name": "Peanut Noodles", "serving": "300g", "cal": 500, "protein_g": 20, "carbs_g": 60,
+         "fat_g": 20, "allergens": ["nuts"]},
+    ])
+    with pytest.raises(plan_engine.NoSafeMealError):
+        llm._get_demo_meal({"days": []}, "Mon", 0, {"allergies": ["peanuts"]})
+
+    plan_id = client.post("/api/generate-plan", json={}).json()["plan_id"]
+    response = client.post("/api/swap-meal", json={"plan_id": plan_id, "day": "Mon", "meal_index": 0,
+                                                   "surprise": True, "profile": {"allergies": ["peanuts"]}})
+    assert response.status_code == 409
+    # The stored plan is unchanged
+    assert plan_store.list_revisions(plan_id)[-1]["revision"] == 0
+
+
+def test_meal_index_only_offers_verified_meals_to_allergic_users():
+    from models.meal_index import MealIndex
+
+    index = MealIndex(load_history=False)
+    macros = {"cal": 455, "protein_g": 21, "carbs_g": 61, "fat_g": 13}
+    index.add_plan({"days": [{"day": "Mon", "meals": [
+        {"name": "Garden Noodle Bowl", "serving": "350g", **macros},
+        {"name": "Harvest Bowl", "serving": "350g", **macros, "ingredients": ["tofu", "rice", {"name": "kale"}]},
+    ]}]}, "balanced")
+
+    def names(allergies):
+        return [m["name"] for m in index.nearest(macros, k=100, allergies=allergies)]
+
+    assert {"Garden Noodle Bowl", "Harvest Bowl"} <= set(names([]))
+    assert "Garden Noodle Bowl" not in names(["dairy"])
+    assert "Harvest Bowl" in names(["dairy"])
+    assert "Harvest Bowl" not in names(["soy"])
+    assert all("verified" not in m for m in index.nearest(macros, k=5))
+
+
+@pytest.mark.parametrize("alternatives", [0, 11])
+def test_swap_rejects_unbounded_alternatives(alternatives):
+    plan_id = client.post("/api/generate-plan", json={}).json()["plan_id"]
+    response = client.post("/api/swap-meal", json={"plan_id": plan_id, "day": "Mon", "meal_index": 0,
+                                                   "alternatives": alternatives})
+    assert response.status_code == 422
+
+
+def test_circuit_breaker_opens_on_slow_successful_calls():
+    from circuit_breaker import CLOSED, OPEN, CircuitBreaker
+
+    breaker = CircuitBreaker("test", min_calls=5, slow_call_seconds=30, p95_threshold_seconds=5)
+    for _ in range(5):
+        ticket = breaker.allow()
+        assert ticket
+        breaker.record(ticket, True, 1.0)
+    assert breaker.state == CLOSED
+    breaker.record(breaker.allow(), True, 8.0)
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+
+
+def test_circuit_breaker_ignores_calls_from_before_a_trip():
+    from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+    breaker = CircuitBreaker("test", min_calls=2, open_seconds=0)
+    stale = [breaker.allow() for _ in range(3)]
+    breaker.record(stale[0], False, 1.0)
+    breaker.record(stale[1], False, 1.0)
+    assert breaker.state == HALF_OPEN
+    breaker.record(stale[2], False, 1.0)
+    assert breaker.stats()["p50"] is None
+
+    probe = breaker.allow()
+    assert probe.probe and breaker.allow() is None
+    breaker.record(stale[2], True, 1.0)
+    assert breaker.state == HALF_OPEN
+    breaker.record(probe, True, 2.0)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["p50"] == 2.0
+
+    breaker.open_seconds = 60
+    for ticket in [breaker.allow(), breaker.allow()]:
+        breaker.record(ticket, False, 1.0)
+    assert breaker.state == OPEN
+
+
+def test_batch_cli_reports_bad_lines_and_keeps_going(tmp_path):
+    from src.inference import run_inference
+
+    source = tmp_path / "batch.jsonl"
+    source.write_text("\n".join([
+        '{"id": "crop", "task": "crop_yield", "payload": {"crop": "wheat", "rainfall": 1400}}',
+        "[1, 2]",
+        "not json",
+        '"a string"',
+        '{"id": "unknown", "task": "nope"}',
+        '{"task": "crop_yield", "payload": {"crop": "rice"}}',
+    ]) + "\n")
+    output = tmp_path / "out.jsonl"
+    assert run_inference.main([str(source), "-o", str(output), "-w", "1", "-c", "2"]) == 1
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["status"] for r in records] == ["ok", "error", "error", "error", "error", "ok"]
+    assert [r["id"] for r in records] == ["crop", 2, 3, 4, "unknown", 6]
+    assert "JSON object" in records[1]["error"]
+    assert records[2]["error"].startswith("Invalid JSON")
+
+
+@pytest.mark.parametrize("flag", ["--chunk-size", "--workers"])
+def test_batch_cli_rejects_non_positive_sizes(tmp_path, flag):
+    from src.inference import run_inference
+
+    with pytest.raises(SystemExit) as exc:
+        run_inference.main([str(tmp_path / "in.jsonl"), flag, "0"])
+    assert exc.value.code == 2
+    with pytest.raises(ValueError):
+        next(run_inference.run_batch(["{}"], workers=1, chunk_size=0))
+
+
+def test_worker_model_timings_reach_metrics():
+    def count(text):
+        line = [l for l in text.splitlines()
+                if l.startswith('foodgene_stage_seconds_count{stage="crop_yield_predict"}')]
+        return float(line[0].split()[-1]) if line else 0.0
+
+    before = count(client.get("/metrics").text)
+    response = client.post("/predict/crop_yield", json={"crop": "wheat", "rainfall": 900})
+    assert response.status_code == 200
+    assert count(client.get("/metrics").text) == before + 1
+
+
+def test_full_task_queue_is_rejected_with_retry_after(monkeypatch):
+    from src.inference.run_inference import get_dispatcher
+
+    dispatcher = get_dispatcher()
+    monkeypatch.setitem(dispatcher.queue_limits, "crop_yield", 2)
+    monkeypatch.setitem(dispatcher.depths, "crop_yield", 2)
+    response = client.post("/predict/crop_yield", json={"crop": "rice"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+    # A batch needing more slots than are left reserves none of them
+    monkeypatch.setitem(dispatcher.depths, "crop_yield", 1)
+    batch = client.post("/predict/batch", json={"requests": [
+        {"task": "diet", "payload": {"food_items": [{"label": "rice"}]}},
+        {"task": "crop_yield", "payload": {"crop": "rice"}},
+        {"task": "crop_yield", "payload": {"crop": "wheat"}},
+    ]})
+    assert batch.status_code == 429
+    assert batch.headers["Retry-After"] == "1"
+    assert dispatcher.depths["crop_yield"] == 1 and dispatcher.depths["diet"] == 0
+
+    # Other tasks keep their own capacity
+    monkeypatch.setitem(dispatcher.depths, "crop_yield", 2)
+    assert client.post("/predict/diet", json={"food_items": [{"label": "rice"}]}).status_code == 200
+
+
+def test_mixed_batch_reports_results_and_errors_per_item():
+    from src.inference.run_inference import get_dispatcher
+
+    response = client.post("/predict/batch", json={"requests": [
+        {"task": "crop_yield", "payload": {"crop": "rice"}},
+        {"task": "nlp", "payload": {"text": "   "}},
+        {"task": "diet", "payload": {"food_items": [{"label": "rice"}]}},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(r["task"], r["status"]) for r in results] == [
+        ("crop_yield", "ok"), ("nlp", "error"), ("diet", "ok")]
+    assert "result" in results[0] and "result" in results[2]
+    assert "'text' is required" in results[1]["error"]
+    assert all(depth == 0 for depth in get_dispatcher().depths.values())
+
+
+def test_supervisor_exits_non_zero_when_workers_crash_loop(monkeypatch):
+    import signal
+
+    import run_backend
+
+    def crash(app, sock, graceful_timeout):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(run_backend, "_serve", crash)
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        supervisor = run_backend.Supervisor(None, run_backend._bind("127.0.0.1", 0), workers=1, graceful_timeout=1)
+        assert supervisor.run() == 1
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+
+def _plain_plan(diet: str = "balanced", calories: int = 2000) -> dict:
+    return json.loads(json.dumps(plan_engine.generate_plan(calories, {}, {"diet_pref": diet, "allergies": []})))
+
+
+def _edit(plan: dict, rng: random.Random) -> dict:
+    """Return a copy of plan with one random edit of the kinds the service makes (and a few it doesn't)."""
+    plan = copy.deepcopy(plan)
+    day = rng.choice(plan["days"])
+    meals = day["meals"]
+    action = rng.randrange(8)
+    if action == 0 and meals:
+        meals[rng.randrange(len(meals))] = {"name": f"Meal {rng.random():.6f}", "serving": "200g",
+                                            "cal": rng.randrange(200, 800), "protein_g": 20, "carbs_g": 40,
+                                            "fat_g": 10}
+    elif action == 1 and meals:
+        del meals[rng.randrange(len(meals))]
+    elif action == 2:
+        meals.insert(rng.randrange(len(meals) + 1), {"name": "Snack", "serving": "1 piece", "cal": 95})
+    elif action == 3 and meals:
+        meal = rng.choice(meals)
+        meal["cal"] = rng.randrange(100, 900)
+        meal["serving"] = f"{rng.randrange(50, 400)}g"
+    elif action == 4:
+        # Keys that need escaping in a JSON pointer
+        day[rng.choice(["note/1", "a~b", "~1", ""])] = rng.random()
+    elif action == 5 and plan.get("grocery_list"):
+        grocery = plan["grocery_list"]
+        rng.shuffle(grocery)
+        del grocery[rng.randrange(len(grocery) + 1):]
+    elif action == 6:
+        plan["days"].reverse()
+    elif "grocery_list" in plan and rng.random() < 0.5:
+        del plan["grocery_list"]
+    else:
+        plan["grocery_list"] = [{"item": "Rice", "quantity": "1 kg"}]
+    return plan
+
+
+def test_json_patch_round_trips_random_plan_edits():
+    import json_patch
+
+    rng = random.Random(42)
+    for diet in plan_engine.MEAL_LIBRARY:
+        old = _plain_plan(diet)
+        for _ in range(150):
+            new = _edit(old, rng)
+            for _ in range(rng.randrange(3)):
+                new = _edit(new, rng)
+            before = copy.deepcopy(old)
+            ops = json_patch.diff(old, new)
+            assert old == before
+            assert json_patch.apply(copy.deepcopy(old), ops) == new
+            assert json_patch.apply(copy.deepcopy(new), json_patch.diff(new, old)) == old
+            old = new
+    assert json_patch.diff(old, old) == []
+    with pytest.raises(json_patch.PatchError):
+        json_patch.apply({"days": []}, [{"op": "replace", "path": "/days/3", "value": 1}])
+
+
+def test_plan_revisions_rebuild_across_snapshot_boundaries(monkeypatch):
+    monkeypatch.setattr(plan_store, "SNAPSHOT_INTERVAL", 3)
+    rng = random.Random(7)
+    versions = [_plain_plan()]
+    constraints = [{"calories": 2000, "macros": {}, "profile": {"diet_pref": "balanced"}}]
+    plan_id = plan_store.save_plan(versions[0], constraints[0])
+    for revision in range(1, 11):
+        versions.append(_edit(versions[-1], rng))
+        changed = {**constraints[-1], "calories": 2000 + revision} if revision % 4 == 0 else None
+        constraints.append(changed or constraints[-1])
+        assert plan_store.update_plan(plan_id, versions[-1], changed, reason="edit") == revision
+
+    history = plan_store.list_revisions(plan_id)
+    assert [r["revision"] for r in history] == list(range(11))
+    kinds = [r["kind"] for r in history]
+    assert kinds[0] == plan_store.SNAPSHOT and plan_store.DELTA in kinds and kinds.count(plan_store.SNAPSHOT) > 1
+    run = 0
+    for kind in kinds:
+        run = run + 1 if kind == plan_store.DELTA else 0
+        # Never more than SNAPSHOT_INTERVAL - 1 deltas in a row
+        assert run < 3
+    for revision, (plan, expected) in enumerate(zip(versions, constraints)):
+        rebuilt = plan_store.get_revision(plan_id, revision)
+        assert rebuilt["revision"] == revision
+        assert rebuilt["plan"] == plan
+        assert rebuilt["constraints"] == expected
+    assert plan_store.get_revision(plan_id, 11) is None
+    assert plan_store.get_plan(plan_id)["plan"] == versions[-1]
+
+
+def test_legacy_plan_without_revisions_becomes_revision_zero():
+    plan = _plain_plan("keto")
+    plan_id = plan_store.save_plan(plan, {"calories": 2000})
+    conn = plan_store._conn()
+    with conn:
+        # As stored before revisions were kept
+        conn.execute("DELETE FROM plan_revisions WHERE plan_id = ?", (plan_id,))
+
+    assert [r["revision"] for r in plan_store.list_revisions(plan_id)] == [0]
+    assert plan_store.get_revision(plan_id, 0)["plan"] == plan
+    assert plan_store.get_revision(plan_id, 1) is None
+
+    edited = _edit(plan, random.Random(1))
+    assert plan_store.update_plan(plan_id, edited, reason="swap") == 1
+    assert [(r["revision"], r["reason"]) for r in plan_store.list_revisions(plan_id)] == [(0, None), (1, "swap")]
+    assert plan_store.get_revision(plan_id, 0) == {"plan": plan, "constraints": {"calories": 2000}, "revision": 0}
+    assert plan_store.get_revision(plan_id, 1)["plan"] == edited
+    assert plan_store.list_revisions("no-such-plan") is None
+    assert plan_store.get_revision("no-such-plan", 0) is None
+
+
+def test_plan_owner_comes_from_the_token_and_is_enforced():
+    # A user_id in the body is ignored
+    anonymous = client.post("/api/generate-plan", json={"user_id": "victim"}).json()["plan_id"]
+    assert plan_store.get_owner(anonymous) == (True, None)
+
+    owned = client.post("/api/generate-plan", json={}, headers=_bearer("plan-owner")).json()["plan_id"]
+    assert plan_store.get_owner(owned) == (True, "plan-owner")
+
+    swap = {"plan_id": owned, "day": "Mon", "meal_index": 0}
+    rescale = {"plan_id": owned, "calories": 2100}
+    for headers in ({}, _bearer("someone-else")):
+        assert client.post("/api/swap-meal", json=swap, headers=headers).status_code == 404
+        assert client.post("/api/rescale-plan", json=rescale, headers=headers).status_code == 404
+        assert client.get(f"/api/plans/{owned}/history", headers=headers).status_code == 404
+        assert client.get(f"/api/plans/{owned}/revisions/0", headers=headers).status_code == 404
+    assert [r["revision"] for r in plan_store.list_revisions(owned)] == [0]
+
+    owner = _bearer("plan-owner")
+    assert client.post("/api/swap-meal", json=swap, headers=owner).status_code == 200
+    assert client.post("/api/rescale-plan", json=rescale, headers=owner).status_code == 200
+    assert len(client.get(f"/api/plans/{owned}/history", headers=owner).json()["revisions"]) == 3
+    assert client.get(f"/api/plans/{owned}/revisions/0", headers=owner).status_code == 200
+    # Anonymous plans stay open to whoever holds the id
+    assert client.get(f"/api/plans/{anonymous}/history").status_code == 200
+
+
+def _login(email: str, password: str):
+    return client.post("/api/auth/login", json={"email": email, "password": password})
+
+
+def test_login_accepts_only_the_right_password_of_a_known_user():
+    user_id = client.post("/api/auth/signup", json={"email": "login@example.com", "password": "hunter22"}).json()["user_id"]
+
+    good = _login("Login@Example.com", "hunter22")
+    assert good.status_code == 200
+    assert auth.decode_access_token(good.json()["access_token"])["sub"] == user_id
+    for email, password in [("login@example.com", "hunter23"), ("nobody@example.com", "hunter22")]:
+        response = _login(email, password)
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Incorrect email or password"
+
+
+def test_login_is_rejected_with_retry_after_when_the_hash_pool_is_full(monkeypatch):
+    client.post("/api/auth/signup", json={"email": "busy@example.com", "password": "hunter22"})
+    monkeypatch.setattr(auth, "_hasher", auth.PasswordHasher(workers=1, max_pending=0))
+    response = _login("busy@example.com", "hunter22")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_login_upgrades_hashes_with_another_cost(monkeypatch):
+    user_store.create_user("rehash@example.com", auth.hash_password_sync("hunter22", rounds=5))
+    assert auth.needs_rehash(user_store.get_user_by_username("rehash@example.com")["hashed_password"])
+
+    # A full pool only skips the upgrade, the login itself still succeeds
+    hasher = auth.get_hasher()
+
+    async def busy(password):
+        raise auth.HashQueueFullError("busy")
+
+    monkeypatch.setattr(hasher, "hash", busy)
+    assert _login("rehash@example.com", "hunter22").status_code == 200
+    assert auth.needs_rehash(user_store.get_user_by_username("rehash@example.com")["hashed_password"])
+
+    monkeypatch.undo()
+    assert _login("rehash@example.com", "hunter22").status_code == 200
+    upgraded = user_store.get_user_by_username("rehash@example.com")["hashed_password"]
+    assert not auth.needs_rehash(upgraded)
+    assert auth.verify_password_sync("hunter22", upgraded)
+
+
+def test_cached_token_claims_do_not_outlive_expiry():
+    token = auth.create_access_token("expired-user", "expired@example.com", expires_minutes=-1)
+    past = datetime.now(timezone.utc) - timedelta(minutes=1)
+    auth.token_cache.put(token, {"sub": "expired-user", "exp": int(past.timestamp())})
+    with pytest.raises(auth.InvalidTokenError):
+        auth.decode_access_token(token)
+    assert auth.token_cache.get(token) is None
+
+
+def test_token_cache_rejects_a_token_signed_with_another_key():
+    token = auth.create_access_token("cached-user", "cached@example.com")
+    claims = auth.decode_access_token(token)
+    assert auth.token_cache.get(token) == claims
+
+    forged = jwt.encode(claims, "another-secret", algorithm=auth.ALGORITHM)
+    with pytest.raises(auth.InvalidTokenError):
+        auth.decode_access_token(forged)
+    assert auth.token_cache.get(forged) is None
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_plan_responses_are_compressed_with_the_negotiated_encoding(encoding):
+    if encoding == "br":
+        pytest.importorskip("brotli")
+    plain = client.post("/api/generate-plan", json={}, headers={"Accept-Encoding": "identity"})
+    response = client.post("/api/generate-plan", json={}, headers={"Accept-Encoding": f"{encoding}, deflate"})
+    assert response.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(plain.content)
+    assert response.json()["plan"] == plain.json()["plan"]
+
+
+def test_small_and_identity_responses_pass_through_uncompressed():
+    import compression
+
+    small = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "Accept-Encoding" in small.headers["vary"]
+    assert small.json() == {"message": "FoodGene ML Service is running"}
+
+    identity = client.post("/api/generate-plan", json={}, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert int(identity.headers["content-length"]) == len(identity.content) > compression.MIN_SIZE
+    assert compression.choose_encoding("gzip;q=0, identity") is None
+
+
+def test_cached_engine_plan_round_trips_through_raw_json():
+    from serialization import RawJSON, dumps, encode
+
+    body = {"calories": 2100, "macros": {"protein_g": 130, "carbs_g": 240, "fat_g": 70},
+            "profile": {"diet_pref": "vegetarian", "allergies": ["peanut"]}}
+    expected = json.loads(dumps(plan_engine.generate_plan(body["calories"], body["macros"], body["profile"])))
+    hits = plan_engine._plan_json.cache_info().hits
+    for _ in range(2):
+        response = client.post("/api/generate-plan", json=body)
+        assert response.status_code == 200
+        assert response.json()["plan"] == expected
+    assert plan_engine._plan_json.cache_info().hits > hits
+
+    raw = plan_engine.generate_plan_json(body["calories"], body["profile"], body["macros"])
+    assert json.loads(encode({"plan_id": "p", "plan": RawJSON(raw)})) == {"plan_id": "p", "plan": expected}
@@ -0,0 +1,45 @@
+"""Tests for the research corpus store and search."""
+import sqlite3
+
+from db import get_connection
+from src.nlp.research_summary_generator import ResearchCorpus
+
+
+def test_corpus_totals_are_shared_between_instances():
+    writer, reader = ResearchCorpus(), ResearchCorpus()
+    before = reader.conn.execute("SELECT COUNT(*) FROM research_documents").fetchone()[0]
+    writer.add("Creatine supplementation improves sprint performance", {"summary": "creatine", "highlights": []})
+    writer.add("Creatine supplementation improves sprint performance", {"summary": "creatine", "highlights": []})
+    writer.add("Vitamin D status and bone density in adults", {"summary": "vitamin d", "highlights": []})
+
+    stats = get_connection().execute("SELECT doc_count, total_length FROM research_stats").fetchone()
+    counts = get_connection().execute(
+        "SELECT COUNT(*), SUM(length) FROM research_documents").fetchone()
+    assert stats["doc_count"] == counts[0] == before + 2
+    assert stats["total_length"] == counts[1]
+
+    # A reader created before the writes still ranks against the current totals
+    results = reader.search("sprint creatine")
+    assert [r["summary"] for r in results] == ["creatine"]
+    assert ResearchCorpus().search("bone density")[0]["summary"] == "vitamin d"
+
+
+def test_common_terms_still_score_but_do_not_pick_candidates(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "research.db"))
+    conn.row_factory = sqlite3.Row
+    corpus = ResearchCorpus(conn)
+    for summary, text in [
+        ("heavy", "creatine protein protein protein"),
+        ("light", "creatine protein loading phase"),
+        ("whey", "whey protein isolate digestion"),
+        ("casein", "casein protein before sleep"),
+        ("soy", "soy protein muscle growth"),
+    ]:
+        corpus.add(text, {"summary": summary, "highlights": []})
+
+    results = corpus.search("creatine protein")
+    assert [r["summary"] for r in results] == ["heavy", "light"]
+    alone = {r["summary"]: r["score"] for r in corpus.search("creatine")}
+    assert all(r["score"] > alone[r["summary"]] for r in results)
+    # With no selective term, the common term alone still finds documents
+    assert len(corpus.search("protein")) == 5
@@ -0,0 +1,88 @@
+"""Tests for scan storage, the perceptual-hash index and produce grading."""
+import base64
+from hashlib import sha256
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import app
+from src.vision_service import produce_quality_detection
+from src.vision_service.scan_storage import PHashIndex, ScanStore
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 300
+
+
+def test_base64_text_is_stored_by_digest_without_exposing_its_path(tmp_path):
+    store = ScanStore(root=str(tmp_path))
+    text = "data:image/png;base64," + base64.b64encode(PNG).decode()
+    image = store.put_base64(text)
+    assert image.sha256 == sha256(PNG).hexdigest()
+    assert image.path.endswith(f"{image.sha256}.png")
+    assert open(image.path, "rb").read() == PNG
+
+    again = store.put_base64(text.encode())
+    assert again.deduplicated is True
+    assert again.to_dict() == {"sha256": image.sha256, "size": len(PNG), "deduplicated": True}
+
+
+def test_phash_index_finds_nearest_within_distance():
+    index = PHashIndex(max_distance=4)
+    index.add(0b1011, "a")
+    index.add(0xFFFF << 40, "b")
+    assert index.nearest(0b1000) == ("a", 2)
+    assert index.nearest((0xFFFF << 40) | 0b111) == ("b", 3)
+    assert index.nearest(0xFF) is None
+
+
+def _png(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (205, 45, 35)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _grade(data: bytes):
+    return TestClient(app).post("/predict/produce-quality", files={"file": ("tray.png", data, "image/png")})
+
+
+def test_produce_quality_rejects_oversized_and_unreadable_uploads(monkeypatch):
+    assert _grade(_png(128, 128)).status_code == 200
+    assert _grade(b"not an image").status_code == 400
+
+    monkeypatch.setattr(produce_quality_detection, "MAX_PIXELS", 128 * 128 - 1)
+    assert _grade(_png(128, 128)).status_code == 413
+    monkeypatch.setattr(produce_quality_detection, "MAX_PIXELS", 10 ** 9)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert _grade(_png(128, 128)).status_code == 413
+    monkeypatch.setattr(produce_quality_detection, "MAX_UPLOAD_BYTES", 100)
+    assert _grade(_png(128, 128)).status_code == 413
+
+
+@pytest.mark.parametrize("inference_workers,expected", [("4", 2), ("1", 1)])
+def test_produce_grading_pool_is_sized_from_inference_workers(monkeypatch, inference_workers, expected):
+    monkeypatch.delenv("PRODUCE_WORKERS", raising=False)
+    monkeypatch.setenv("INFERENCE_WORKERS", inference_workers)
+    assert produce_quality_detection.ProduceGrader().workers == expected
+
+
+@pytest.mark.parametrize("path", ["/etc/hostname", "/nonexistent/secret", "/root", "/dev/zero"])
+def test_scanner_requests_cannot_name_a_server_file(path):
+    client = TestClient(app)
+    single = client.post("/predict/scanner", json={"image_path": path})
+    assert single.status_code == 422
+    assert "No such file" not in single.text and "directory" not in single.text
+    batch = client.post("/predict/batch", json={"requests": [
+        {"task": "crop_yield", "payload": {"crop": "rice"}},
+        {"task": "scanner", "payload": {"image_path": path}},
+    ]})
+    assert batch.status_code == 422
+
+
+def test_scanner_upload_is_scanned_from_storage(tmp_path, monkeypatch):
+    from src.vision_service import scan_storage
+
+    monkeypatch.setattr(scan_storage, "_store", ScanStore(root=str(tmp_path)))
+    response = TestClient(app).post("/predict/scanner/upload", files={"file": ("plate.png", _png(64, 64), "image/png")})
+    assert response.status_code == 200
+    assert set(response.json()["image"]) == {"sha256", "size", "deduplicated"}